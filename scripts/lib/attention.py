@@ -0,0 +1,152 @@
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AttentionInterface, AttentionMaskInterface
+from transformers.masking_utils import sdpa_mask
+from lib.models import get_model_structure, StopForward, stop_after
+
+TOPK_ATTENTION = 'prismata_topk'
+QUERY_CHUNK = 256 # Queries scored at once: working memory is Heads x QUERY_CHUNK x Seq (linear in Seq)
+
+class TopKLinks:
+    """
+    Preallocated COO buffer of attention links: (layer, head, query, key, weight).
+    Holds exactly `k` links per query per head per layer, so its size is fixed before the forward pass.
+    """
+    def __init__(self, n_layers, n_heads, seq_len, k):
+        capacity = n_layers * n_heads * seq_len * k
+        self.layer = np.empty(capacity, dtype=np.int32)
+        self.head = np.empty(capacity, dtype=np.int32)
+        self.query = np.empty(capacity, dtype=np.int32)
+        self.key = np.empty(capacity, dtype=np.int32)
+        self.weight = np.empty(capacity, dtype=np.float32)
+        self.size = 0
+        self.k = k
+
+    def add(self, layer_idx, probs, query_start):
+        """probs: [Heads, Chunk, Keys] attention probabilities of one batch element."""
+        k = min(self.k, probs.shape[-1])
+        weights, keys = probs.topk(k, dim=-1)
+        n_heads, n_queries, _ = weights.shape
+        n = weights.numel()
+        if self.size + n > len(self.weight): # more queries than planned (shouldn't happen)
+            return
+        sl = slice(self.size, self.size + n)
+        self.layer[sl] = layer_idx
+        self.head[sl] = np.repeat(np.arange(n_heads), n_queries * k)
+        self.query[sl] = np.tile(np.repeat(np.arange(query_start, query_start + n_queries), k), n_heads)
+        self.key[sl] = keys.reshape(-1).numpy()
+        self.weight[sl] = weights.reshape(-1).float().numpy()
+        self.size += n
+
+    def arrays(self):
+        n = self.size
+        return {'layer': self.layer[:n], 'head': self.head[:n], 'query': self.query[:n], 'key': self.key[:n], 'weight': self.weight[:n]}
+
+# Set while a capture is running: {'links': TopKLinks, 'layer_of': {id(module): layer_idx}}
+_capture = {}
+
+def topk_attention_forward(module, query, key, value, attention_mask, scaling=None, dropout=0.0, **kwargs):
+    """
+    Drop-in attention implementation (same contract as transformers' eager_attention_forward) that
+    never materializes [Heads, Seq, Seq]: queries are processed QUERY_CHUNK at a time and only the
+    top-k probabilities per query are kept in the COO buffer.
+    """
+    if scaling is None:
+        scaling = query.size(-1) ** -0.5
+    if key.shape[1] != query.shape[1]: # grouped-query attention
+        key = key.repeat_interleave(query.shape[1] // key.shape[1], dim=1)
+        value = value.repeat_interleave(query.shape[1] // value.shape[1], dim=1)
+
+    q_len, k_len = query.shape[-2], key.shape[-2]
+    causal = attention_mask is None and getattr(module, 'is_causal', False) and q_len > 1
+    layer_idx = _capture.get('layer_of', {}).get(id(module))
+    out = torch.empty(*query.shape[:-1], value.shape[-1], dtype=value.dtype)
+
+    for start in range(0, q_len, QUERY_CHUNK):
+        stop = min(start + QUERY_CHUNK, q_len)
+        scores = torch.matmul(query[:, :, start:stop], key.transpose(-1, -2)) * scaling
+        if attention_mask is not None:
+            m = attention_mask[..., start:stop, :k_len]
+            scores = scores.masked_fill(~m, float('-inf')) if m.dtype == torch.bool else scores + m
+        elif causal:
+            q_pos = torch.arange(start, stop).unsqueeze(1) + (k_len - q_len)
+            scores = scores.masked_fill(torch.arange(k_len).unsqueeze(0) > q_pos, float('-inf'))
+        probs = torch.softmax(scores.float(), dim=-1).to(value.dtype)
+        out[:, :, start:stop] = torch.matmul(probs, value)
+        if layer_idx is not None:
+            _capture['links'].add(layer_idx, probs[0].detach(), start)
+
+    return out.transpose(1, 2), None
+
+AttentionInterface.register(TOPK_ATTENTION, topk_attention_forward)
+AttentionMaskInterface.register(TOPK_ATTENTION, sdpa_mask)
+
+def num_heads(model):
+    config = model.config
+    for name in ('num_attention_heads', 'n_head', 'num_heads'):
+        if hasattr(config, name):
+            return int(getattr(config, name))
+    raise ValueError(f"Cannot find the number of attention heads in {type(config).__name__}")
+
+def get_attention_links(model, model_name, text="The future is vast and infinite", k=8, max_length=4096, tokenizer=None, layers=None):
+    """
+    Runs one forward pass with the top-k attention implementation swapped in and returns
+    (TopKLinks, n_heads, seq_len). Memory is O(Layers * Heads * Seq * k), never O(Seq^2).
+    With `layers` (block indices) only those blocks record links and the pass stops after the last one.
+    """
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=max_length)
+    seq_len = inputs['input_ids'].shape[1]
+    blocks = get_model_structure(model)
+    selected = range(len(blocks)) if layers is None else layers
+    n_heads = num_heads(model)
+
+    layer_of = {}
+    for i in selected:
+        for m in blocks[i].modules():
+            layer_of[id(m)] = i
+    links = TopKLinks(len(selected), n_heads, seq_len, k)
+    _capture.update(links=links, layer_of=layer_of)
+    hooks = [stop_after(blocks[selected[-1]])] if layers else []
+
+    previous = model.config._attn_implementation
+    model.config._attn_implementation = TOPK_ATTENTION
+    print(f"🔭 Attending to: '{text[:60]}' ({seq_len} tokens, top-{k} links per query)...")
+    try:
+        with torch.no_grad():
+            model(**inputs)
+    except StopForward:
+        pass
+    finally:
+        model.config._attn_implementation = previous
+        _capture.clear()
+        for h in hooks: h.remove()
+    print(f"   ↳ Captured {links.size} links ({links.size * 20 / 2**20:.1f} MB)")
+    return links, n_heads, seq_len
+
+def head_cluster_edges(links, layer_idx, offset, count, n_heads, seq_len, max_edges=None):
+    """
+    Maps the layer's links onto its vertices: the layer's points are split into n_heads contiguous
+    head clusters, and token positions map proportionally onto each cluster's points.
+    Returns (edges [E, 2] global indices, weights [E], received attention per vertex [count]).
+    Parallel links landing on the same vertex pair are merged (weights summed).
+    """
+    a = links.arrays()
+    sel = a['layer'] == layer_idx
+    head, query, key, weight = a['head'][sel], a['query'][sel], a['key'][sel], a['weight'][sel]
+
+    cluster = max(count // n_heads, 1)
+    base = np.minimum(head * cluster, max(count - cluster, 0))
+    v1 = base + (query.astype(np.int64) * cluster) // seq_len
+    v2 = base + (key.astype(np.int64) * cluster) // seq_len
+    received = np.bincount(v2, weights=weight, minlength=count)[:count]
+
+    keep = v1 != v2
+    pair = v1[keep] * count + v2[keep]
+    pairs, inverse = np.unique(pair, return_inverse=True)
+    summed = np.bincount(inverse, weights=weight[keep])
+    if max_edges is not None and len(pairs) > max_edges:
+        top = np.argsort(summed)[::-1][:max_edges]
+        pairs, summed = pairs[top], summed[top]
+    edges = np.stack([pairs // count, pairs % count], axis=1) + offset
+    return edges.astype(np.int32), summed.astype(np.float32), received
@@ -0,0 +1,154 @@
+import inspect
+import time
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.checkpoint import checkpoint
+from transformers import AutoTokenizer, AutoImageProcessor
+from lib.models import get_model_structure
+
+# Gradient x activation crystals: one backward pass from a target logit, reduced per block output channel.
+# Blocks run under activation checkpointing, so the forward keeps only each block's input (and the sampled
+# channels of its output); a block's internals (attention probabilities, MLP expansions) are recomputed
+# during the backward pass one block at a time. Peak memory is O(Layers * Seq * Dim), not O(Layers * Seq^2).
+
+def checkpoint_blocks(blocks):
+    """Wraps every block's forward in torch.utils.checkpoint (undo with release_blocks)."""
+    for block in blocks:
+        forward = block.forward
+        block.forward = lambda *args, _forward=forward, **kwargs: checkpoint(_forward, *args, use_reentrant=False, **kwargs)
+
+def release_blocks(blocks):
+    for block in blocks:
+        block.__dict__.pop('forward', None)
+
+def sampled_channels(data, step):
+    """[Positions, Channels / step] of the first batch item: tokens for [B, Seq, Dim], pixels for [B, C, H, W]."""
+    if data.dim() == 3:
+        return data[0, :, ::step]
+    if data.dim() == 4:
+        return data[0, ::step].flatten(1).T
+    if data.dim() == 2:
+        return data[0:1, ::step]
+    return None
+
+def output_logits(outputs):
+    """
+    [Classes] scores the target is picked from: LM logits at the last position, classifier logits,
+    or for a headless model its output features (pooled, else the last position's hidden state).
+    """
+    logits = getattr(outputs, 'logits', None)
+    if logits is not None:
+        return logits[0, -1] if logits.dim() == 3 else logits[0]
+    pooled = getattr(outputs, 'pooler_output', None)
+    if pooled is not None:
+        return pooled[0].flatten()
+    hidden = outputs.last_hidden_state if hasattr(outputs, 'last_hidden_state') else outputs[0]
+    return hidden[0, -1] if hidden.dim() == 3 else hidden[0].flatten()
+
+def resolve_target(target, logits, tokenizer=None, config=None):
+    """Index of the target logit: the top prediction (None), an index ('42'), a class label or a token (' Paris')."""
+    if target is None:
+        return int(logits.argmax())
+    if str(target).lstrip('-').isdigit():
+        return int(target)
+    label2id = getattr(config, 'label2id', None) or {}
+    if target in label2id:
+        return int(label2id[target])
+    if tokenizer is not None:
+        ids = tokenizer.encode(target, add_special_tokens=False)
+        if ids:
+            return ids[0]
+    raise ValueError(f"Unknown attribution target: {target}")
+
+def target_label(index, tokenizer=None, config=None):
+    id2label = getattr(config, 'id2label', None) or {}
+    if tokenizer is None and index in id2label:
+        return str(id2label[index])
+    return tokenizer.decode([index]) if tokenizer is not None else str(index)
+
+def get_attributions(model, model_name, text="The future is vast and infinite", image_path=None, target=None,
+                     step=2, layers=None, max_length=2048):
+    """
+    Backward pass from one target logit (next-token logit for text, class logit for images) of a Hugging Face
+    model, preferably loaded with its head (load_hf_model(..., head=...)).
+    Hooks on every block from get_model_structure (or the `layers` block indices) keep the sampled channels
+    of the block output and, when its gradient arrives, reduce it to sum over positions of gradient x activation.
+    Returns ({layer_idx: [Channels / step] float32}, {'target', 'label', 'logit', 'positions'}).
+    """
+    blocks = get_model_structure(model.base_model) # head models wrap the block stack
+    tokenizer, config = None, getattr(model, 'config', None)
+    if image_path:
+        print(f"👁️ Attributing image: '{image_path}'...")
+        processor = AutoImageProcessor.from_pretrained(model_name)
+        inputs = dict(processor(images=Image.open(image_path).convert('RGB'), return_tensors="pt"))
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        inputs = dict(tokenizer(text, return_tensors="pt", truncation=True, max_length=max_length))
+        print(f"🧠 Attributing: '{text[:60]}' ({inputs['input_ids'].shape[1]} tokens)...")
+    if getattr(config, 'use_cache', False):
+        inputs['use_cache'] = False
+    if not image_path and 'logits_to_keep' in inspect.signature(model.forward).parameters:
+        inputs['logits_to_keep'] = 1 # only the next-token logits are needed, not [Seq, Vocab]
+
+    acts, scores = {}, {}
+    def get_hook(layer_idx):
+        def hook(module, input, output):
+            data = output[0] if isinstance(output, tuple) else output
+            if not torch.is_tensor(data) or not data.requires_grad:
+                return
+            sampled = sampled_channels(data, step)
+            if sampled is None:
+                return
+            acts[layer_idx] = sampled.detach().float().clone()
+            def grad_hook(grad):
+                scores[layer_idx] = (sampled_channels(grad, step).float() * acts.pop(layer_idx)).sum(dim=0).numpy()
+            data.register_hook(grad_hook)
+        return hook
+
+    def needs_grad(module, args, kwargs):
+        # Parameters are frozen, so the graph starts at the first block's input
+        if args and torch.is_tensor(args[0]) and args[0].is_floating_point():
+            return (args[0].detach().requires_grad_(),) + tuple(args[1:]), kwargs
+        if torch.is_tensor(kwargs.get('hidden_states')):
+            kwargs['hidden_states'] = kwargs['hidden_states'].detach().requires_grad_()
+        return args, kwargs
+
+    frozen = [(p, p.requires_grad) for p in model.parameters()]
+    for p, _ in frozen:
+        p.requires_grad_(False)
+    hooks = [block.register_forward_hook(get_hook(i)) for i, block in enumerate(blocks) if layers is None or i in layers]
+    hooks.append(blocks[0].register_forward_pre_hook(needs_grad, with_kwargs=True))
+    was_training = model.training
+    model.eval()
+    checkpoint_blocks(blocks)
+    start = time.time()
+    try:
+        with torch.enable_grad():
+            logits = output_logits(model(**inputs))
+            index = resolve_target(target, logits, tokenizer, config)
+            logit = logits[index]
+            logit.backward()
+            value = logit.item()
+    finally:
+        release_blocks(blocks)
+        for h in hooks: h.remove()
+        for p, flag in frozen:
+            p.requires_grad_(flag)
+        model.train(was_training)
+
+    label = target_label(index, tokenizer, config)
+    print(f"   ↳ Target {index} ('{label}', logit {value:.3f}): {len(scores)} blocks in {time.time() - start:.1f}s")
+    positions = inputs['input_ids'].shape[1] if 'input_ids' in inputs else 1
+    return scores, {'target': index, 'label': label, 'logit': value, 'positions': positions}
+
+def normalize_attributions(scores):
+    """Signed scores scaled by the largest |score| over all blocks, so colors compare across layers (-1..1)."""
+    peak = max((float(np.abs(s).max()) for s in scores.values() if s.size), default=0.0)
+    return {i: s / peak if peak > 0 else s for i, s in scores.items()}
+
+def save_attributions(scores, info, filename, step, text=None, image_path=None):
+    """One .npz with layer_<idx> arrays (raw gradient x activation per sampled channel) plus the target."""
+    arrays = {f"layer_{i}": s.astype(np.float32) for i, s in scores.items()}
+    np.savez_compressed(filename, step=step, target=info['target'], label=info['label'], logit=info['logit'],
+                        positions=info['positions'], input=image_path or text or '', **arrays)
@@ -0,0 +1,94 @@
+import numpy as np
+import scipy.sparse as sp
+from lib.extractors import to_numpy, to_sparse, density, as_csr, SPARSE_DENSITY, sparse_dtype
+from lib.headers import BLOCK_PARTS, block_entries, piece_shape, find_block_layers
+
+# Full-block extraction (--block full). Which tensors of a block are read, and whether by row or by column,
+# is decided from their names in lib/headers.py (BLOCK_TENSORS); here they are read and stacked.
+
+def part_tags(parts, n_rows, n_neurons, step=1):
+    """BLOCK_PARTS index of every sampled row; a fused tensor's neurons are split evenly between its parts."""
+    ids = np.array([BLOCK_PARTS.index(p) for p in parts], dtype=np.uint8)
+    return ids[np.arange(n_rows) * step * len(parts) // max(n_neurons, 1)]
+
+def block_tags(tags):
+    """Per-vertex tag record of one block layer (see lattice.layer_colors / fill_tags)."""
+    return {'parts': np.concatenate(tags), 'num_parts': len(BLOCK_PARTS)}
+
+def layout(pieces, dtype, fill):
+    """
+    Stacks pieces [(rows, features)] into one [Sum(rows), Features] array, filled in place by fill(i, out_block);
+    pieces of different widths go block-diagonal as CSR (float32 for a float16 dtype, see sparse_dtype).
+    """
+    widths = {w for _, w in pieces}
+    if len(widths) == 1:
+        out = np.empty((sum(r for r, _ in pieces), widths.pop()), dtype=dtype)
+        row = 0
+        for i, (rows, _) in enumerate(pieces):
+            fill(i, out[row:row + rows])
+            row += rows
+        return out
+    blocks = []
+    for i, (rows, width) in enumerate(pieces):
+        block = np.empty((rows, width), dtype=dtype)
+        fill(i, block)
+        blocks.append(as_csr(block))
+    return sp.block_diag(blocks, format='csr', dtype=sparse_dtype(dtype))
+
+def index_model_blocks(blocks):
+    """Per block: [(parameter, parts, by_column)], resolved once from named_parameters (no attribute probing)."""
+    index = []
+    for block in blocks:
+        params = dict(block.named_parameters())
+        entries = block_entries((name, tuple(p.shape)) for name, p in params.items())
+        index.append([(params[name], parts, by_column) for name, parts, by_column in entries])
+    return index
+
+def tensor_rows(w, by_column, step=1):
+    """Sampled [Neurons/step, Features] view of one weight (Linear, Conv1D or convolution)."""
+    w = w.detach()
+    if by_column:
+        return w[:, ::step].T
+    return w[::step].reshape(-(-w.shape[0] // step), -1)
+
+def extract_block(entries, step=1, dtype=np.float32):
+    """
+    (sampled block [Sum(rows), Features], tag record) from the index_model_blocks entries of one block,
+    (None, None) when it has none. A single tensor comes back as a view whenever the dtype allows it,
+    very sparse blocks as CSR (see SPARSE_DENSITY).
+    """
+    if not entries:
+        return None, None
+    views = [tensor_rows(w, by_column, step) for w, _, by_column in entries]
+    tags = block_tags([part_tags(parts, v.shape[0], w.shape[1] if by_column else w.shape[0], step)
+                       for v, (w, parts, by_column) in zip(views, entries)])
+    if density(views) <= SPARSE_DENSITY:
+        blocks = [to_sparse(v, dtype) for v in views]
+        if len({v.shape[1] for v in views}) == 1:
+            return sp.vstack(blocks, format='csr'), tags
+        return sp.block_diag(blocks, format='csr', dtype=sparse_dtype(dtype)), tags
+    if len(views) == 1:
+        return to_numpy(views[0], dtype), tags
+    return layout([tuple(v.shape) for v in views], dtype, lambda i, out: to_numpy(views[i], dtype, out)), tags
+
+def iter_checkpoint_blocks(ckpt, step=1, dtype=np.float32, layers=None):
+    """
+    Yields (layer index, sampled block, tag record) straight from the shards, one block at a time: each tensor
+    is read once, CHUNK_ROWS sampled rows at a time, into its rows of the block. With `layers` (block indices),
+    the tensors of other blocks are never read.
+    """
+    for layer, entries in find_block_layers(ckpt):
+        if layers is not None and layer not in layers:
+            continue
+        shapes = [ckpt.shape(key) for key, _, _ in entries]
+        pieces = [piece_shape(shape, by_column, step) for shape, (_, _, by_column) in zip(shapes, entries)]
+
+        def fill(i, out):
+            key, _, by_column = entries[i]
+            (ckpt.sampled_T if by_column else ckpt.sampled_rows)(key, step, dtype, out=out)
+
+        data = layout(pieces, dtype, fill)
+        ckpt.release()
+        tags = block_tags([part_tags(parts, rows, shape[1] if by_column else shape[0], step)
+                           for (rows, _), shape, (_, parts, by_column) in zip(pieces, shapes, entries)])
+        yield layer, data, tags
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import numpy as np
+import torch
+from safetensors import safe_open
+from lib.extractors import to_numpy, CHUNK_ROWS
+from lib.headers import find_attention_layers
+from lib.quantized import find_quantized, logical_keys, may_be_quantized, quantization_config
+
+class QuantizedSlice:
+    """A quantized weight with the get_shape() / row-range indexing of a safetensors slice (see embeddings.read_rows)."""
+    def __init__(self, tensor, read):
+        self.tensor, self.read, self.groups = tensor, read, None
+
+    def get_shape(self):
+        return list(self.tensor.shape)
+
+    def __getitem__(self, rows):
+        if self.groups is None:
+            self.groups = self.tensor.groups(self.read)
+        w = self.tensor.block(self.read, rows.indices(self.tensor.shape[0]), (0, self.tensor.shape[1], 1), self.groups)
+        return torch.from_numpy(w.T if self.tensor.stored[0] == 'in' else w)
+
+class Checkpoint:
+    """
+    Lazy, memory-mapped view over a local safetensors checkpoint (single file or sharded).
+    Nothing is read until a tensor (or a slice of one) is requested, so the model is never instantiated.
+    Quantized weights (GPTQ / AWQ / int8, see lib/quantized.py) are listed and read under their logical name and
+    [Out, In] shape; only the rows or columns a read selects are unpacked and dequantized.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.weight_map = {}
+        self.handles = {}
+
+        files = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '*.safetensors')))
+        index_file = os.path.join(path, 'model.safetensors.index.json')
+        if os.path.isdir(path) and os.path.exists(index_file):
+            with open(index_file) as f:
+                for name, shard in json.load(f)['weight_map'].items():
+                    self.weight_map[name] = os.path.join(path, shard)
+        else:
+            for shard in files:
+                for name in self._open(shard).keys():
+                    self.weight_map[name] = shard
+        self.quantized = {}
+        if may_be_quantized(self.weight_map):
+            tensors = {}
+            for name in self.weight_map:
+                s = self.stored(name)
+                tensors[name] = (s.get_dtype(), tuple(s.get_shape()))
+            self.quantized = find_quantized(tensors, quantization_config(path))
+        self.names = logical_keys(self.weight_map, self.quantized)
+
+    def _open(self, shard):
+        if shard not in self.handles:
+            self.handles[shard] = safe_open(shard, framework='pt')
+        return self.handles[shard]
+
+    def release(self):
+        """Drops the shard mappings so pages touched so far stop counting toward RSS."""
+        self.handles = {}
+
+    def keys(self):
+        return list(self.names)
+
+    def __contains__(self, name):
+        return name in self.quantized or name in self.weight_map
+
+    def stored(self, name):
+        """The tensor as stored (safetensors slice), quantized components included."""
+        return self._open(self.weight_map[name]).get_slice(name)
+
+    def slice(self, name):
+        if name in self.quantized:
+            return QuantizedSlice(self.quantized[name], self.stored)
+        return self.stored(name)
+
+    def shape(self, name):
+        if name in self.quantized:
+            return self.quantized[name].shape
+        return tuple(self.stored(name).get_shape())
+
+    def get(self, name):
+        """Whole tensor (torch). Only use for small tensors such as routers or norms."""
+        if name in self.quantized:
+            return torch.from_numpy(self.quantized[name].sampled(self.stored, CHUNK_ROWS))
+        return self._open(self.weight_map[name]).get_tensor(name)
+
+    def sampled_T(self, name, step=1, dtype=np.float32, out=None):
+        """
+        Same rows as extract_weights gives for a Linear weight [Out, In]: W[:, ::step].T -> [In/step, Out].
+        Reads CHUNK_ROWS output rows at a time straight from the mmapped shard, releasing it after each, so only
+        the sampled columns and one chunk of the shard are ever resident.
+        """
+        if name in self.quantized:
+            return self.quantized[name].sampled(self.stored, CHUNK_ROWS, step, dtype, out, columns=True)
+        n_out, n_in = self.shape(name)
+        if out is None:
+            out = np.empty(((n_in + step - 1) // step, n_out), dtype=dtype)
+        for start in range(0, n_out, CHUNK_ROWS):
+            chunk = self.slice(name)[start:start + CHUNK_ROWS, ::step]
+            self.release()
+            to_numpy(chunk.T, dtype, out[:, start:start + CHUNK_ROWS])
+        return out
+
+    def sampled_rows(self, name, step=1, dtype=np.float32, out=None):
+        """
+        W[::step] with trailing dims flattened -> [Rows/step, Rest]: a Conv1D weight [In, Out] as extract_weights
+        samples it, or the output neurons of a Linear / convolution. Reads CHUNK_ROWS sampled rows at a time (see sampled_T).
+        """
+        if name in self.quantized:
+            return self.quantized[name].sampled(self.stored, CHUNK_ROWS, step, dtype, out)
+        shape = self.shape(name)
+        n_rows = (shape[0] + step - 1) // step
+        if out is None:
+            out = np.empty((n_rows, int(np.prod(shape[1:]))), dtype=dtype)
+        for start in range(0, n_rows, CHUNK_ROWS):
+            chunk = self.slice(name)[start * step:(start + CHUNK_ROWS) * step:step]
+            self.release()
+            to_numpy(chunk.reshape(chunk.shape[0], -1), dtype, out[start:start + CHUNK_ROWS])
+        return out
+
+def layer_shape(ckpt, names, conv1d, step=1):
+    """[In/step, Sum(Out)] of the slice read_layer returns (for a Conv1D, W[::step] flattened)."""
+    if conv1d:
+        shape = ckpt.shape(names[0])
+        return ((shape[0] + step - 1) // step, int(np.prod(shape[1:])))
+    shapes = [ckpt.shape(n) for n in names]
+    return ((shapes[0][1] + step - 1) // step, sum(s[0] for s in shapes))
+
+def chunk_bytes(ckpt, names, conv1d):
+    """float32 bytes of the widest CHUNK_ROWS stored rows one layer's tensors are read by: no streamed read of it holds less."""
+    return max(CHUNK_ROWS * int(np.prod(ckpt.shape(n)[1:])) * 4 for n in names[:1 if conv1d else None])
+
+def read_layer(ckpt, names, conv1d, step=1, dtype=np.float32, out=None):
+    """
+    One layer's sampled slice [In/step, Sum(Out)], same rows as extract_weights, read chunk by chunk.
+    `out` (e.g. a SpillSlot over a scratch file) receives it instead of a new array; each tensor is then written
+    through its own out[:, cols] and the shard mappings are released after it.
+    """
+    if out is None:
+        out = np.empty(layer_shape(ckpt, names, conv1d, step), dtype=dtype)
+    if conv1d:
+        ckpt.sampled_rows(names[0], step, dtype, out=out[:, :])
+        ckpt.release()
+        return out
+    col = 0
+    for n in names:
+        n_out = ckpt.shape(n)[0]
+        ckpt.sampled_T(n, step, dtype, out=out[:, col:col + n_out])
+        ckpt.release()
+        col += n_out
+    return out
+
+def iter_checkpoint_layers(ckpt, step=1, dtype=np.float32, layers=None, alloc=None):
+    """
+    Yields (layer index, the same sampled slice as extract_weights), layer by layer, straight from the shards.
+    Only one layer's sampled slice is resident at a time, whatever the model size.
+    With `layers` (block indices), the tensors of other layers are never read.
+    With `alloc(shape, dtype)` (e.g. SpillFile.reserve) each slice is written into what it returns, which is yielded.
+    """
+    for layer, names, conv1d in find_attention_layers(ckpt):
+        if layers is not None and layer not in layers:
+            continue
+        out = read_layer(ckpt, names, conv1d, step, dtype, alloc(layer_shape(ckpt, names, conv1d, step), dtype) if alloc else None)
+        yield layer, out
@@ -0,0 +1,136 @@
+import numpy as np
+from plyfile import PlyData, PlyElement
+from scipy.linalg import orthogonal_procrustes
+from scipy.spatial import cKDTree
+from lib.lattice import layer_edges
+
+# Compare bundle: one binary PLY holding two crystals in one frame.
+#   vertex: x, y, z, red, green, blue, model (0 | 1), layer
+#   edge:   vertex1, vertex2, kind (0 = lattice edge of one model, 1 = correspondence edge between the models)
+# Model names are stored as `comment model <i> <name>` header lines.
+LAYER_SPACING = 0.15
+EDGE_LATTICE, EDGE_CORRESPONDENCE = 0, 1
+
+def read_crystal(path):
+    """(positions [N, 3] float64, colors [N, 3] uint8) of a crystal PLY (text or binary)."""
+    v = PlyData.read(path)['vertex'].data
+    return np.stack([v['x'], v['y'], v['z']], axis=1).astype(np.float64), np.stack([v['red'], v['green'], v['blue']], axis=1)
+
+def layer_labels(y, max_layers=256):
+    """Layer index per vertex from the stacking height (layers sit at layer_idx * 0.15); 16 height bands for unlayered crystals."""
+    heights, labels = np.unique(np.round(y, 4), return_inverse=True)
+    if len(heights) > max_layers:
+        edges = np.quantile(y, np.linspace(0, 1, 17)[1:-1])
+        labels = np.searchsorted(edges, y)
+        labels = np.unique(labels, return_inverse=True)[1]
+    return labels.ravel()
+
+def depth_pairs(n_a, n_b):
+    """Layers matched by relative depth: min(n_a, n_b) pairs (layer of A, layer of B)."""
+    t = np.linspace(0, 1, min(n_a, n_b))
+    return np.rint(t * (n_a - 1)).astype(int), np.rint(t * (n_b - 1)).astype(int)
+
+def layer_centroids(plane, labels, n_layers):
+    counts = np.bincount(labels, minlength=n_layers)
+    return np.stack([np.bincount(labels, weights=plane[:, k], minlength=n_layers) for k in range(2)], axis=1) / np.maximum(counts, 1)[:, None]
+
+def normalize_plane(plane):
+    """Projection plane (x, z) centered and scaled to unit RMS radius."""
+    plane = plane - plane.mean(axis=0)
+    rms = np.sqrt((plane ** 2).sum(axis=1).mean())
+    return plane / rms if rms > 0 else plane
+
+def align_planes(plane_a, labels_a, plane_b, labels_b):
+    """
+    Orthogonal Procrustes (rotation or reflection, since PCA signs are arbitrary) of B's layer centroids onto A's,
+    over depth-matched layers. Returns (R [2, 2], residual relative to A's centroid spread).
+    Both planes are at unit RMS radius, so a centroid track spread below 1e-3 per layer is degenerate (per-layer
+    projections center every layer at the origin): the fit would only see float noise, so it returns (identity, None).
+    """
+    n_a, n_b = labels_a.max() + 1, labels_b.max() + 1
+    idx_a, idx_b = depth_pairs(n_a, n_b)
+    ca = layer_centroids(plane_a, labels_a, n_a)[idx_a]
+    cb = layer_centroids(plane_b, labels_b, n_b)[idx_b]
+    ca, cb = ca - ca.mean(axis=0), cb - cb.mean(axis=0)
+    spread, floor = np.linalg.norm(ca), 1e-3 * np.sqrt(len(ca))
+    if len(ca) < 2 or spread < floor or np.linalg.norm(cb) < floor:
+        return np.eye(2), None
+    R, _ = orthogonal_procrustes(cb, ca)
+    return R, float(np.linalg.norm(cb @ R - ca) / spread)
+
+def downsample_layers(labels, budget):
+    """Evenly spaced vertices of every layer (in their original order), about `budget` in total, in proportion to layer size."""
+    counts = np.bincount(labels)
+    keep = np.maximum(np.rint(counts * min(1.0, budget / len(labels))).astype(int), 1)
+    picked = []
+    for layer, (count, k) in enumerate(zip(counts, keep)):
+        members = np.flatnonzero(labels == layer)
+        picked.append(members[np.rint(np.linspace(0, count - 1, min(k, count))).astype(int)])
+    return picked # one index array per layer
+
+def correspondence_edges(plane_a, layers_a, plane_b, layers_b, offset_b, links):
+    """
+    For depth-matched layers, `links` evenly spaced vertices of A each linked to the nearest vertex (in the aligned plane)
+    of the matching layer of B. Indices are bundle indices (B starts at offset_b).
+    """
+    idx_a, idx_b = depth_pairs(len(layers_a), len(layers_b))
+    parts, start_a = [], np.concatenate([[0], np.cumsum([len(l) for l in layers_a])[:-1]])
+    start_b = offset_b + np.concatenate([[0], np.cumsum([len(l) for l in layers_b])[:-1]])
+    for la, lb in zip(idx_a, idx_b):
+        rows_a = np.rint(np.linspace(0, len(layers_a[la]) - 1, min(links, len(layers_a[la])))).astype(int)
+        _, nearest = cKDTree(plane_b[layers_b[lb]]).query(plane_a[layers_a[la][rows_a]])
+        parts.append(np.stack([start_a[la] + rows_a, start_b[lb] + nearest], axis=1))
+    return np.concatenate(parts).astype(np.int32)
+
+def build_compare_bundle(path_a, path_b, filename, names=None, points=20000, links=32):
+    """
+    Aligns two crystals offline and writes them as one binary bundle:
+    both projection planes normalized to unit RMS radius, B rotated/reflected onto A by Procrustes on layer centroids,
+    layers restacked to a common height, each model downsampled to points / 2 vertices (lattice edges rebuilt),
+    plus `links` correspondence edges per depth-matched layer pair.
+    """
+    names = names or [path_a, path_b]
+    crystals = []
+    for path in (path_a, path_b):
+        positions, colors = read_crystal(path)
+        labels = layer_labels(positions[:, 1])
+        crystals.append({'plane': normalize_plane(positions[:, [0, 2]]), 'colors': colors, 'labels': labels, 'n_points': len(positions)})
+    a, b = crystals
+    R, residual = align_planes(a['plane'], a['labels'], b['plane'], b['labels'])
+    b['plane'] = b['plane'] @ R
+    scale = 1.5 / max(np.abs(a['plane']).max(), np.abs(b['plane']).max())
+
+    height = (max(a['labels'].max(), b['labels'].max())) * LAYER_SPACING
+    vertices, edges, kinds, offset = [], [], [], 0
+    for model, c in enumerate(crystals):
+        c['layers'] = downsample_layers(c['labels'], points // 2)
+        n_layers = len(c['layers'])
+        counts = [len(l) for l in c['layers']]
+        offsets = offset + np.concatenate([[0], np.cumsum(counts)[:-1]])
+        order = np.concatenate(c['layers'])
+        v = np.empty(len(order), dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('model', 'u1'), ('layer', 'u2')])
+        layer_of = np.repeat(np.arange(n_layers), counts)
+        v['x'], v['z'] = c['plane'][order, 0] * scale, c['plane'][order, 1] * scale
+        v['y'] = layer_of / max(n_layers - 1, 1) * height
+        v['red'], v['green'], v['blue'] = c['colors'][order, 0], c['colors'][order, 1], c['colors'][order, 2]
+        v['model'], v['layer'] = model, layer_of
+        vertices.append(v)
+        lattice = np.concatenate([layer_edges(offsets[i], counts[i], counts[i - 1] if i > 0 else 0) for i in range(n_layers)])
+        edges.append(lattice)
+        kinds.append(np.full(len(lattice), EDGE_LATTICE, dtype=np.uint8))
+        c['offset'] = offset
+        offset += len(order)
+
+    corr = correspondence_edges(a['plane'], a['layers'], b['plane'], b['layers'], b['offset'], links)
+    edges.append(corr)
+    kinds.append(np.full(len(corr), EDGE_CORRESPONDENCE, dtype=np.uint8))
+
+    vertex = np.concatenate(vertices)
+    edges, kinds = np.concatenate(edges), np.concatenate(kinds)
+    edge_array = np.empty(len(edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4'), ('kind', 'u1')])
+    edge_array['vertex1'], edge_array['vertex2'], edge_array['kind'] = edges[:, 0], edges[:, 1], kinds
+    comments = [f"model {i} {name}" for i, name in enumerate(names)]
+    PlyData([PlyElement.describe(vertex, 'vertex'), PlyElement.describe(edge_array, 'edge')],
+            byte_order='<', comments=comments).write(filename)
+    return {'residual': residual, 'reflected': bool(np.linalg.det(R) < 0),
+            'points': [len(v) for v in vertices], 'source_points': [c['n_points'] for c in crystals], 'links': len(corr)}
@@ -0,0 +1,86 @@
+import numpy as np
+
+# Voxel-grid consolidation after projection: vertices in the same cell become one vertex
+# (mean position and color, `count` of merged points), edges are remapped and deduplicated.
+# The viewer draws points 0.15 units wide with additive blending, so cells are capped well below that.
+MAX_CELL = 0.05
+
+def cell_keys(positions, cell):
+    """One int64 key per vertex for its voxel (row-major over the occupied bounding box)."""
+    q = np.floor((positions - positions.min(axis=0)) / cell).astype(np.int64)
+    dims = q.max(axis=0) + 1
+    return (q[:, 0] * dims[1] + q[:, 1]) * dims[2] + q[:, 2]
+
+def fit_cell(positions, ratio, max_cell=MAX_CELL, iters=24):
+    """
+    Adaptive grid: the cell size whose occupied-cell count is closest to len(positions) / ratio
+    (geometric bisection, one np.unique per step), never larger than max_cell.
+    """
+    target = len(positions) / ratio
+    extent = float(np.ptp(positions, axis=0).max()) or 1.0
+    lo, hi = extent * 1e-6, min(extent, max_cell)
+    if len(np.unique(cell_keys(positions, hi))) > target:
+        return hi # the cap is reached before the target ratio
+    for _ in range(iters):
+        mid = np.sqrt(lo * hi)
+        if len(np.unique(cell_keys(positions, mid))) > target:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+def voxel_groups(positions, cell):
+    """(inverse [N] cell id per vertex, counts [Cells], first [Cells] index of each cell's first vertex)."""
+    _, first, inverse, counts = np.unique(cell_keys(positions, cell), return_index=True, return_inverse=True, return_counts=True)
+    return inverse.ravel(), counts, first
+
+def remap_edges(edges, inverse, weights=None):
+    """
+    Edges between cells: endpoints remapped, self-loops dropped, (a, b) and (b, a) merged, duplicates removed.
+    With weights, each merged edge keeps the largest. Returns (edges [E', 2] int32, weights or None).
+    """
+    e = inverse[np.asarray(edges, dtype=np.int64)]
+    keep = e[:, 0] != e[:, 1]
+    e = np.sort(e[keep], axis=1)
+    n = int(inverse.max()) + 1 if len(inverse) else 0
+    keys, edge_inverse = np.unique(e[:, 0] * n + e[:, 1], return_inverse=True)
+    merged = np.stack([keys // n, keys % n], axis=1).astype(np.int32)
+    if weights is None:
+        return merged, None
+    w = np.full(len(keys), -np.inf, dtype=np.float64)
+    np.maximum.at(w, edge_inverse.ravel(), np.asarray(weights)[keep])
+    return merged, w.astype(np.float32)
+
+def consolidate_vertex(vertex, inverse, counts, first):
+    """
+    Structured vertex array -> one record per cell: x/y/z and float properties averaged, colors averaged
+    and rounded, other integer properties (e.g. `expert`) taken from the cell's first vertex, plus `count`.
+    """
+    names = [n for n in vertex.dtype.names if n != 'count']
+    out = np.empty(len(counts), dtype=[(n, vertex.dtype[n].str) for n in names] + [('count', 'i4')])
+    weights = vertex['count'] if 'count' in vertex.dtype.names else np.ones(len(vertex))
+    totals = np.bincount(inverse, weights=weights, minlength=len(counts))
+    for n in names:
+        if n in ('red', 'green', 'blue') or vertex.dtype[n].kind == 'f':
+            mean = np.bincount(inverse, weights=vertex[n] * weights, minlength=len(counts)) / totals
+            out[n] = np.rint(mean) if vertex.dtype[n].kind in 'iu' else mean
+        else:
+            out[n] = vertex[n][first]
+    out['count'] = totals
+    return out
+
+def consolidate(vertex, edge_array, ratio=4.0, cell=None, max_cell=MAX_CELL):
+    """Voxel consolidation of a crystal's vertex and edge arrays. Returns (vertex, edge_array, cell)."""
+    positions = np.stack([vertex['x'], vertex['y'], vertex['z']], axis=1).astype(np.float64)
+    cell = cell or fit_cell(positions, ratio, max_cell)
+    inverse, counts, first = voxel_groups(positions, cell)
+    merged_vertex = consolidate_vertex(vertex, inverse, counts, first)
+
+    edges = np.stack([edge_array['vertex1'], edge_array['vertex2']], axis=1)
+    has_weight = 'weight' in edge_array.dtype.names
+    merged_edges, weights = remap_edges(edges, inverse, edge_array['weight'] if has_weight else None)
+    out_edges = np.empty(len(merged_edges), dtype=edge_array.dtype)
+    out_edges['vertex1'], out_edges['vertex2'] = merged_edges[:, 0], merged_edges[:, 1]
+    if has_weight:
+        out_edges['weight'] = weights
+    return merged_vertex, out_edges, cell
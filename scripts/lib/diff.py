@@ -0,0 +1,107 @@
+import numpy as np
+from lib.checkpoints import Checkpoint, read_layer
+from lib.headers import find_attention_layers
+from lib.lattice import layer_positions, layer_edges
+from lib.options import DRIFT_STATS
+from lib.plyio import write_ascii_ply
+from lib.projection import fit_basis_streaming
+from lib.rendering import get_colors
+
+def neuron_drift(base, tuned):
+    """
+    Per-neuron (row) drift between two sampled slices of the same layer:
+    delta norm ||t - b||, relative delta ||t - b|| / ||b||, and cosine drift 1 - cos(b, t).
+    """
+    base = base.astype(np.float64) # float64 so an untouched row reads as exactly zero drift
+    tuned = tuned.astype(np.float64)
+    base_norm = np.linalg.norm(base, axis=1)
+    tuned_norm = np.linalg.norm(tuned, axis=1)
+    delta = np.linalg.norm(tuned - base, axis=1)
+    cos = np.einsum('ij,ij->i', base, tuned) / np.maximum(base_norm * tuned_norm, 1e-12)
+    return {'delta': delta, 'relative': delta / np.maximum(base_norm, 1e-12), 'cosine': np.maximum(1.0 - cos, 0.0)}
+
+def matching_layers(base_ckpt, tuned_ckpt):
+    """[(layer, base names, tuned names, conv1d)] present in both checkpoints with identical shapes."""
+    tuned = {layer: (names, conv1d) for layer, names, conv1d in find_attention_layers(tuned_ckpt)}
+    pairs = []
+    for layer, names, conv1d in find_attention_layers(base_ckpt):
+        if layer not in tuned:
+            continue
+        t_names, t_conv1d = tuned[layer]
+        if conv1d != t_conv1d or [base_ckpt.shape(n) for n in names] != [tuned_ckpt.shape(n) for n in t_names]:
+            print(f"   ⚠️  Layer {layer} differs in shape between the checkpoints. Skipped.")
+            continue
+        pairs.append((layer, names, t_names, conv1d))
+    return pairs
+
+def crystallize_diff(base_path, tuned_path, filename, step=2, dtype=np.float32, drift='cosine', seed=0):
+    """
+    Fine-tune drift crystal. Both checkpoints are streamed layer by layer from their safetensors shards:
+    1. a projection basis is fitted on the base model only (streaming randomized SVD, one base layer at a time),
+    2. each layer of base and fine-tune is read side by side (two layers resident), drift is measured per
+       neuron and both are projected into the shared basis.
+    Writes the fine-tune crystal (colored by drift), the base crystal in the same basis (`_base.ply`)
+    and the raw per-neuron drift (`.npz`).
+    """
+    base_ckpt, tuned_ckpt = Checkpoint(base_path), Checkpoint(tuned_path)
+    pairs = matching_layers(base_ckpt, tuned_ckpt)
+    if not pairs:
+        print("No matching attention layers between the two checkpoints.")
+        return None
+
+    def iter_base():
+        for _, names, _, conv1d in pairs:
+            block = read_layer(base_ckpt, names, conv1d, step, dtype)
+            base_ckpt.release()
+            yield block
+
+    n_features = next(iter_base()).shape[1]
+    print(f"   ↳ Fitting the shared basis on the base model ({len(pairs)} layers, streaming)...")
+    mu, components = fit_basis_streaming(iter_base, n_features, 2, seed)
+
+    print("   ↳ Streaming both checkpoints layer by layer (drift + projection)...")
+    base_proj, tuned_proj, drifts = [], [], []
+    for layer, names, t_names, conv1d in pairs:
+        base = read_layer(base_ckpt, names, conv1d, step, dtype)
+        tuned = read_layer(tuned_ckpt, t_names, conv1d, step, dtype)
+        drifts.append(neuron_drift(base, tuned))
+        base_proj.append((base - mu) @ components.T)
+        tuned_proj.append((tuned - mu) @ components.T)
+        del base, tuned
+        base_ckpt.release()
+        tuned_ckpt.release()
+
+    # One scale for both crystals (the base model's extent), so positions are directly comparable
+    scale = max(np.max(np.abs(p)) for p in base_proj)
+    scale = scale if scale > 0 else 1.0
+    peak = max(float(d[drift].max()) for d in drifts)
+
+    counts = [len(p) for p in base_proj]
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    edges = np.concatenate([layer_edges(offsets[i], counts[i], counts[i - 1] if i > 0 else 0) for i in range(len(counts))])
+    edge_array = np.empty(len(edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4')])
+    edge_array['vertex1'], edge_array['vertex2'] = edges[:, 0], edges[:, 1]
+
+    def write(out_file, projections, colored):
+        positions = np.concatenate([layer_positions(p / scale, i) for i, p in enumerate(projections)])
+        values = np.concatenate([d[drift] for d in drifts])
+        heat = values / peak if peak > 0 else values
+        colors = get_colors('diff', 0, len(counts), np.arange(len(positions)), None, heat if colored else np.zeros_like(heat))
+        vertex = np.empty(len(positions), dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('drift', 'f4')])
+        vertex['x'], vertex['y'], vertex['z'] = positions[:, 0], positions[:, 1], positions[:, 2]
+        vertex['red'], vertex['green'], vertex['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+        vertex['drift'] = values
+        write_ascii_ply(out_file, vertex, edge_array)
+
+    write(filename, tuned_proj, True)
+    write(filename.replace('.ply', '_base.ply'), base_proj, False)
+
+    arrays = {'layers': np.array([p[0] for p in pairs])}
+    for (layer, *_), d in zip(pairs, drifts):
+        for stat in DRIFT_STATS:
+            arrays[f"{stat}_{layer}"] = d[stat].astype(np.float32)
+    np.savez_compressed(filename.replace('.ply', '.npz'), **arrays)
+
+    ranked = sorted(((float(d[drift].mean()), layer) for (layer, *_), d in zip(pairs, drifts)), reverse=True)
+    print("   ↳ Most changed layers (" + drift + "): " + ", ".join(f"{layer} ({v:.2e})" for v, layer in ranked[:5]))
+    return filename
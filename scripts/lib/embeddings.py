@@ -0,0 +1,124 @@
+import json
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from plyfile import PlyData, PlyElement
+from scipy.spatial import cKDTree
+from transformers import AutoTokenizer
+from lib.extractors import to_numpy, row_magnitudes, CHUNK_ROWS
+from lib.lattice import layer_positions
+from lib.projection import project, project_streaming
+from lib.rendering import get_embedding_colors
+
+def model_embedding_table(model):
+    """[Vocab, Dim] torch view of an instantiated model's token embeddings (HF or mock)."""
+    if hasattr(model, 'get_input_embeddings'):
+        try:
+            module = model.get_input_embeddings()
+            if module is not None and hasattr(module, 'weight'):
+                return module.weight
+        except NotImplementedError:
+            pass
+    for m in model.modules():
+        if isinstance(m, nn.Embedding):
+            return m.weight
+    # Word2Vec mock: the projection is a Linear(Vocab -> Dim), so its rows are weight.T
+    if isinstance(getattr(model, 'embeddings', None), nn.Linear):
+        return model.embeddings.weight.T
+    return None
+
+def stratified_rows(vocab_size, n_samples, seed=0):
+    """
+    One random row from each of n_samples equal id ranges, sorted.
+    BPE / WordPiece ids roughly follow merge (frequency) order, so every band of the vocabulary,
+    from the most common tokens to the rarest pieces, is represented in proportion.
+    """
+    if n_samples >= vocab_size:
+        return np.arange(vocab_size)
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(0, vocab_size, n_samples + 1).astype(np.int64)
+    return bounds[:-1] + (rng.random(n_samples) * np.diff(bounds)).astype(np.int64)
+
+def read_rows(table, ids, dtype=np.float32):
+    """
+    Rows `ids` (sorted) of a [Vocab, Dim] table, which may be a safetensors slice (memory-mapped)
+    or a tensor. Dense windows are read in one go; sparse ones row by row, so only the pages
+    holding sampled rows are touched.
+    """
+    out = np.empty((len(ids), table.get_shape()[1] if hasattr(table, 'get_shape') else table.shape[1]), dtype=dtype)
+    window_ids = ids // CHUNK_ROWS
+    for window in np.unique(window_ids):
+        pos = np.flatnonzero(window_ids == window)
+        rows = ids[pos]
+        if len(rows) * 8 >= CHUNK_ROWS:
+            start = int(rows[0])
+            block = table[start:int(rows[-1]) + 1]
+            to_numpy(block[torch.from_numpy(rows - start)], dtype, out[pos[0]:pos[-1] + 1])
+        else:
+            for p, r in zip(pos, rows):
+                to_numpy(table[int(r):int(r) + 1], dtype, out[p:p + 1])
+    return out
+
+def token_strings(model_name, ids):
+    if model_name is None:
+        return None
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"   ⚠️  No tokenizer for {model_name} ({e}). Token sidecar will only hold ids.")
+        return None
+    return [str(t) for t in tokenizer.convert_ids_to_tokens([int(i) for i in ids])]
+
+def crystallize_embeddings(table, model_name, filename, n_samples=16384, projector='randomized', dtype=np.float32, memory_budget=None, neighbors=2, seed=0, tokenizer_name=''):
+    """
+    Token-embedding crystal: stratified rows of the embedding table -> 3D projection -> kNN edges.
+    Vertices carry their token id; `<name>_tokens.json` maps vertex order to ids and token strings.
+    With a memory budget the sampled matrix is never assembled: the projection streams rows from the table.
+    Token strings come from `tokenizer_name` (default: model_name; None skips them, e.g. for mocks).
+    """
+    start_time = time.time()
+    vocab_size, dim = table.get_shape() if hasattr(table, 'get_shape') else tuple(table.shape)
+    ids = stratified_rows(vocab_size, n_samples, seed)
+    print(f"   ↳ Sampling {len(ids)} of {vocab_size} tokens ({dim} dims), stratified by id...")
+
+    matrix_bytes = len(ids) * dim * np.dtype(dtype).itemsize
+    if memory_budget and matrix_bytes > memory_budget // 4:
+        block_rows = max(256, memory_budget // (4 * dim * 4))
+        print(f"   ↳ Streaming projection in blocks of {block_rows} rows (Global 3D)...")
+        read = lambda start, stop: read_rows(table, ids[start:stop], dtype)
+        projected = project_streaming(read, len(ids), dim, 3, block_rows, seed)
+        magnitudes = np.concatenate([row_magnitudes(read(s, s + block_rows)) for s in range(0, len(ids), block_rows)])
+    else:
+        matrix = read_rows(table, ids, dtype)
+        print(f"   ↳ Compressing {matrix.shape} dimensions (Global {projector.upper()} 3D)...")
+        projected = project(matrix, 3, projector, seed)
+        magnitudes = row_magnitudes(matrix)
+        del matrix
+    max_val = np.max(np.abs(projected))
+    if max_val > 0: projected /= max_val
+
+    # Each token links to its nearest neighbours in the crystal
+    positions = layer_positions(projected, 0)
+    _, nn_idx = cKDTree(positions).query(positions, k=neighbors + 1)
+    edges = np.stack([np.repeat(np.arange(len(ids)), neighbors), nn_idx[:, 1:].ravel()], axis=1)
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    norm = magnitudes / magnitudes.max() if magnitudes.max() > 0 else magnitudes
+    vertex = np.empty(len(ids), dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('token', 'i4')])
+    vertex['x'], vertex['y'], vertex['z'] = positions[:, 0], positions[:, 1], positions[:, 2]
+    colors = get_embedding_colors(ids / vocab_size, norm)
+    vertex['red'], vertex['green'], vertex['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+    vertex['token'] = ids
+    edge_array = np.empty(len(edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4')])
+    edge_array['vertex1'], edge_array['vertex2'] = edges[:, 0], edges[:, 1]
+    PlyData([PlyElement.describe(vertex, 'vertex'), PlyElement.describe(edge_array, 'edge')], byte_order='<').write(filename)
+
+    # Sidecar label index: vertex i <-> ids[i] <-> tokens[i]
+    sidecar = filename.replace('.ply', '_tokens.json')
+    with open(sidecar, 'w', encoding='utf-8') as f:
+        json.dump({'model': model_name, 'vocab_size': int(vocab_size), 'ids': ids.tolist(),
+                   'tokens': token_strings(model_name if tokenizer_name == '' else tokenizer_name, ids)}, f, ensure_ascii=False)
+    print(f"   ↳ Token index: {sidecar} ({time.time() - start_time:.1f}s)")
+    return filename
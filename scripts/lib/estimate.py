@@ -0,0 +1,310 @@
+import json
+import time
+import numpy as np
+from lib.headers import (CheckpointHeader, is_checkpoint, find_attention_layers, find_moe_layers, find_embedding_key,
+                         block_entries, block_shape as full_block_shape, find_block_layers)
+from lib.lattice import count_edges
+from lib.mockshapes import MOCK_SHAPES, MOCK_EMBEDDINGS, mock_blocks, mock_bytes, mock_block_weights
+from lib.options import PIPELINE_DEPTH, pca_solver, fit_reads, parse_layer_range, selected_layers, expert_ids
+
+# Dry-run cost model: shapes come from safetensors headers, the declared mock shapes (lib/mockshapes.py)
+# or config.json (model built on the meta device), so nothing is read or allocated beyond metadata.
+# Checkpoints and mocks need neither torch nor transformers; only config.json models import them.
+# Throughputs are single-core figures measured with the pipeline itself (1 CPU); times are order-of-magnitude guides.
+STARTUP_SECONDS = 8.0          # python + torch/transformers/sklearn imports of the build (the dry run itself needs none for mocks)
+RUNTIME_BYTES = 880 * 2**20    # resident set of the imported libraries before any model is loaded
+LOAD_BYTES_PER_S = 2.0e8       # from_pretrained on local safetensors
+INIT_PARAMS_PER_S = 7.5e7      # mock models (random init)
+EXTRACT_BYTES_PER_S = 3.0e8    # strided sampling / dtype conversion
+STATS_VALUES_PER_S = 1.0e8     # weight statistics sidecar (dominated by the histogram)
+FIT_READ_SECONDS_PER_VALUE = 1.5e-9  # --pipeline: one thin product of project_blocks per read of the layers
+COVARIANCE_SECONDS_PER_FLOP = 2e-11  # --pipeline, exact PCA: X^T X accumulated in float64 (per multiply-add)
+PROJECT_SECONDS_PER_VALUE = {'pca': 2.7e-8, 'randomized': 6e-9, 'sketch': 1.4e-8} # per sampled matrix element
+OUT_OF_CORE_SECONDS_PER_VALUE = 3.5e-8 # spill + streamed basis fit + second projection pass
+STREAM_CHUNK_ROWS = 1024       # CHUNK_ROWS (lib/extractors.py, which imports torch): stored rows per read of a streamed tensor
+READBACK_BYTES = 2 * (16 << 20) # SpillFile.append reading a layer filled in place back (copy + mapping)
+ASCII_BYTES_PER_S = 4.0e6      # plyio text formatting
+BINARY_BYTES_PER_S = 2.0e8
+PROJECT_MEMORY_FACTOR = {'pca': 2.0, 'randomized': 1.0, 'sketch': 1.0} # workspace, in units of the stacked matrix
+VERTEX_BINARY_BYTES = 15       # x y z (f4) + r g b (u1)
+FLOAT_TEXT_CHARS = 20.5        # '%.18g' of a float32 coordinate, on average
+EMBEDDING_NEIGHBORS = 2
+
+def sampled(n, step):
+    return (n + step - 1) // step
+
+def meta_model(model_name):
+    """(model on the meta device, source) for a Hugging Face config; (None, reason) when there is no local one."""
+    import torch
+    from transformers import AutoConfig, AutoModel
+    try:
+        config = AutoConfig.from_pretrained(model_name, local_files_only=True)
+    except Exception:
+        return None, 'no local config.json (the hub is not queried in a dry run)'
+    with torch.device('meta'):
+        return AutoModel.from_config(config), 'config.json'
+
+def expert_count(experts, n_experts):
+    chosen = expert_ids(experts, n_experts)
+    return len(chosen) if chosen is not None else min(int(experts), n_experts)
+
+def layer_shapes(model_name, step=2, experts='2', full_block=False):
+    """
+    ([{'layer', 'rows', 'features'}], source, model_bytes, path, n_blocks) of the crystal layers, without reading weights.
+    path is 'moe' / 'checkpoint' / 'quantized' (streamable from safetensors) or 'model' (needs an instantiated model).
+    full_block: shapes of --block full (every sub-module tensor) instead of the attention projections.
+    """
+    if is_checkpoint(model_name):
+        header = CheckpointHeader(model_name)
+        kind = 'quantized' if header.quantized else 'checkpoint'
+        moe = find_moe_layers(header)
+        if moe:
+            layers = []
+            for info in moe:
+                n_experts = header.shape(info['router'])[0]
+                n_inter, n_hidden = header.shape(info['expert_name'].format(expert=0))
+                layers.append({'layer': info['layer'], 'rows': sampled(n_hidden, step) * expert_count(experts, n_experts), 'features': n_inter})
+            return layers, 'safetensors headers', header.nbytes(), 'moe', max(l['layer'] for l in layers) + 1
+        if full_block:
+            found = find_block_layers(header)
+            if found:
+                layers = []
+                for layer, entries in found:
+                    rows, features = full_block_shape([(header.shape(key), by_column) for key, _, by_column in entries], step)
+                    layers.append({'layer': layer, 'rows': rows, 'features': features})
+                return layers, 'safetensors headers', header.nbytes(), kind, max(l['layer'] for l in layers) + 1
+        attention = find_attention_layers(header) if not full_block else []
+        if attention:
+            layers = []
+            for layer, names, conv1d in attention:
+                shapes = [header.shape(n) for n in names]
+                if conv1d:
+                    layers.append({'layer': layer, 'rows': sampled(shapes[0][0], step), 'features': shapes[0][1]})
+                else:
+                    layers.append({'layer': layer, 'rows': sampled(shapes[0][1], step), 'features': sum(s[0] for s in shapes)})
+            return layers, 'safetensors headers', header.nbytes(), kind, max(l['layer'] for l in layers) + 1
+
+    if model_name in MOCK_SHAPES:
+        blocks, layers = mock_blocks(model_name), []
+        for idx, params in enumerate(blocks):
+            if full_block:
+                shapes = dict(params)
+                entries = block_entries(params)
+                shape = full_block_shape([(shapes[name], by_column) for name, _, by_column in entries], step) if entries else None
+            else:
+                weights = mock_block_weights(params) # [Out, In]: input columns become the rows, as in sampled_shape
+                shape = (sampled(weights[0][1], step), sum(w[0] for w in weights)) if weights else None
+            if shape is not None:
+                layers.append({'layer': idx, 'rows': shape[0], 'features': shape[1]})
+        return layers, 'mock shapes', mock_bytes(blocks), 'model', len(blocks)
+
+    model, source = meta_model(model_name)
+    if model is None:
+        return [], source, 0, 'model', 0
+    from lib.extractors import block_weights, sampled_shape
+    from lib.models import get_model_structure
+    layers, blocks = [], get_model_structure(model)
+    for idx, block in enumerate(blocks):
+        if full_block:
+            shapes = {name: tuple(p.shape) for name, p in block.named_parameters()}
+            entries = block_entries(shapes.items())
+            shape = full_block_shape([(shapes[name], by_column) for name, _, by_column in entries], step) if entries else None
+        else:
+            found = block_weights(block)
+            shape = sampled_shape(*found, step) if found is not None else None
+        if shape is not None:
+            layers.append({'layer': idx, 'rows': shape[0], 'features': shape[1]})
+    return layers, source, sum(p.numel() * p.element_size() for p in model.parameters()), 'model', len(blocks)
+
+def embedding_shape(model_name):
+    """((vocab, hidden), source) of the token embedding table from the checkpoint header or the meta model; shape None if absent."""
+    if is_checkpoint(model_name):
+        header = CheckpointHeader(model_name)
+        key = find_embedding_key(header)
+        if key:
+            return header.shape(key), 'safetensors headers'
+    if model_name in MOCK_SHAPES:
+        return MOCK_EMBEDDINGS.get(model_name), 'mock shapes'
+    model, source = meta_model(model_name)
+    if model is None:
+        return None, source
+    from lib.embeddings import model_embedding_table
+    table = model_embedding_table(model)
+    return (tuple(table.shape) if table is not None else None), source
+
+def average_digits(n):
+    """Mean number of decimal digits of the integers 0 .. n-1 (vertex indices in a text PLY)."""
+    if n <= 0:
+        return 1.0
+    total, low, digits = 0, 0, 1
+    while low < n:
+        high = min(10 ** digits, n)
+        total += (high - low) * digits
+        low, digits = high, digits + 1
+    return total / n
+
+def ply_bytes(n_vertices, n_edges, extra_vertex=(), extra_edge=()):
+    """{'ascii', 'binary'} file size. extra_*: (text chars, binary bytes) per additional property."""
+    vertex_text = 3 * FLOAT_TEXT_CHARS + 3 * 2.8 + 6 + sum(c for c, _ in extra_vertex)
+    edge_text = 2 * average_digits(n_vertices) + 2 + sum(c for c, _ in extra_edge)
+    header = 300
+    return {'ascii': int(header + n_vertices * vertex_text + n_edges * edge_text),
+            'binary': int(header + n_vertices * (VERTEX_BINARY_BYTES + sum(b for _, b in extra_vertex)) + n_edges * (8 + sum(b for _, b in extra_edge)))}
+
+def estimate_build(model_name, *, step=2, modes=('default',), precision='float32', projector='pca', experts='2',
+                   memory_budget=None, samples=16384, top_k=8, consolidate=None, layers=None, stats=True, pipelined=False, block='attention'):
+    """
+    Predicted geometry, output sizes, peak memory per stage and time for one prismata_make.py run, from metadata only.
+    Returns a JSON-ready dict (see print_estimate); `elapsed_ms` is the cost of the estimate itself.
+    """
+    start = time.perf_counter()
+    modes = list(modes)
+    itemsize = np.dtype(precision).itemsize
+    result = {'model': model_name, 'step': step, 'modes': modes, 'precision': precision, 'projector': projector}
+
+    if modes == ['embedding']:
+        shape, source = embedding_shape(model_name)
+        if shape is None:
+            return dict(result, source=source, error='no token embedding table found')
+        vocab, hidden = shape
+        n = min(samples, vocab)
+        edges = n * EMBEDDING_NEIGHBORS
+        table = n * hidden * itemsize
+        result.update(source=source, pipeline='embedding', upper_bounds=[],
+                      layers=[{'layer': 0, 'rows': n, 'features': hidden}], vertices=n,
+                      edges={'embedding': edges}, output_bytes={'embedding': ply_bytes(n, edges, extra_vertex=[(6, 4)])},
+                      formats={'embedding': 'binary'},
+                      memory={'load': 0, 'extract': table, 'project': table * PROJECT_MEMORY_FACTOR['randomized'], 'write': n * 40 + edges * 8},
+                      seconds={'extract': table / EXTRACT_BYTES_PER_S, 'project': n * hidden * PROJECT_SECONDS_PER_VALUE['randomized'],
+                               'write': ply_bytes(n, edges)['binary'] / BINARY_BYTES_PER_S})
+        return finish(result, start)
+
+    selection = layers
+    full_block = block == 'full' or 'parts' in modes
+    layers, source, model_bytes, kind, n_blocks = layer_shapes(model_name, step, experts, full_block)
+    needs_forward = any(m in modes for m in ('activation', 'attention', 'latency', 'attribution'))
+    if selection and layers:
+        # Mocks build unselected blocks on the meta device, HF models are cut after the last selected block
+        keep = selected_layers(n_blocks, parse_layer_range(selection))
+        layers = [l for l in layers if l['layer'] in keep]
+        if keep:
+            model_bytes = int(model_bytes * (len(keep) if source == 'mock shapes' else keep[-1] + 1) / n_blocks)
+        result['layer_range'] = selection
+    if not layers:
+        return dict(result, source=source, error='no extractable layers found' + (f' in --layers {selection}' if selection else ''))
+    rows = [l['rows'] for l in layers]
+    features = [l['features'] for l in layers]
+    vertices = sum(rows)
+    ring = sum(count_edges(r, rows[i - 1] if i > 0 else 0) for i, r in enumerate(rows))
+    sampled_bytes = sum(r * f for r, f in zip(rows, features)) * itemsize
+    largest = max(r * f for r, f in zip(rows, features)) * itemsize
+    global_pca = len(set(features)) == 1
+    upper_bounds = []
+
+    out_of_core = bool(memory_budget) or pipelined # both stream layers into preallocated binary PLYs
+    # Quantized checkpoints are read as stored (only sampled rows dequantized) whenever no forward pass is needed
+    streams = kind == 'moe' or (kind in ('checkpoint', 'quantized') and (out_of_core or (not needs_forward and (selection or kind == 'quantized'))))
+    pipeline = 'pipelined' if pipelined else 'out-of-core' if out_of_core else 'in-memory'
+    if streams:
+        pipeline += ' (streamed from safetensors, model not instantiated)'
+
+    edges, output, formats = {}, {}, {}
+    for mode in modes:
+        if mode == 'attention' and not out_of_core:
+            skin = sum(count_edges(r, rows[i - 1] if i > 0 else 0, ring=False) for i, r in enumerate(rows))
+            edges[mode] = skin + vertices * top_k # links are capped at top_k per vertex; the text decides how many survive
+            upper_bounds.append(mode)
+            output[mode] = ply_bytes(vertices, edges[mode], extra_edge=[(10, 4)])
+        else:
+            edges[mode] = ring
+            # expert (u2) on MoE checkpoints, part (u1) on full-block crystals
+            output[mode] = ply_bytes(vertices, ring, extra_vertex=[(2, 2)] if kind == 'moe' else [(2, 1)] if full_block else ())
+        formats[mode] = 'binary' if out_of_core else 'ascii'
+    if consolidate and not out_of_core:
+        result['consolidated_vertices'] = int(vertices / consolidate) # upper bound on the reduction (the voxel cap may stop earlier)
+
+    load = 0 if streams else model_bytes
+    matrix = sampled_bytes if global_pca else largest
+    if pipelined:
+        # Queue slots of the extractor and the projection pool; the global fit holds [Samples, q] / [Features, q] factors
+        # (or the float64 covariance of an exact PCA) and the projection itself
+        n_comps = 3 if model_name == 'hypercube' else 2
+        exact = global_pca and projector != 'randomized' and pca_solver(vertices, features[0], n_comps)[0] == 'exact'
+        fit_bytes = (features[0] ** 2 * 8 if exact else (vertices + features[0]) * (n_comps + 10) * 4) + vertices * n_comps * 4 if global_pca else 0
+        memory = {'load': load, 'extract': min(sampled_bytes, largest * (2 * PIPELINE_DEPTH + 2)), 'project': max(largest, fit_bytes), 'write': vertices * 40}
+    elif out_of_core:
+        budget = memory_budget
+        # Streamed attention layers are written into the spill in place: one CHUNK_ROWS read of the widest tensor
+        extract = largest
+        if kind == 'checkpoint' and not full_block:
+            extract = min(largest, STREAM_CHUNK_ROWS * max(rows) * step * 4 + READBACK_BYTES)
+        memory = {'load': load, 'extract': extract, 'project': min(budget, matrix), 'write': vertices * 40}
+    else:
+        memory = {'load': load, 'extract': sampled_bytes, 'project': sampled_bytes + matrix * PROJECT_MEMORY_FACTOR.get(projector, 1.0),
+                  'write': vertices * 64 + max(edges.values()) * 16}
+
+    project_values = sum(r * f for r, f in zip(rows, features))
+    write = sum(output[m][formats[m]] / (BINARY_BYTES_PER_S if formats[m] == 'binary' else ASCII_BYTES_PER_S) for m in modes)
+    seconds = {
+        'load': 0 if streams else (model_bytes / 4 / INIT_PARAMS_PER_S if source == 'mock shapes' else model_bytes / LOAD_BYTES_PER_S),
+        'extract': sampled_bytes / EXTRACT_BYTES_PER_S,
+        'stats': project_values / STATS_VALUES_PER_S if stats else 0,
+        'project': project_values * (OUT_OF_CORE_SECONDS_PER_VALUE if out_of_core else PROJECT_SECONDS_PER_VALUE.get(projector, PROJECT_SECONDS_PER_VALUE['pca'])),
+        'write': write,
+    }
+    if pipelined:
+        # A metadata pass, the fit_reads() reads of project_blocks and the streaming pass; within each the stages
+        # overlap, so the slowest one sets the pace. Global layers are not extracted again for the streaming pass.
+        extract = seconds.pop('extract')
+        fit = 0
+        if global_pca:
+            fit = fit_reads(projector, vertices, features[0], n_comps) * max(extract, project_values * FIT_READ_SECONDS_PER_VALUE)
+            fit += project_values * features[0] * COVARIANCE_SECONDS_PER_FLOP if exact else 0
+            stream_pass = seconds.pop('write')
+        else:
+            stream_pass = max(extract, project_values * PROJECT_SECONDS_PER_VALUE.get(projector, PROJECT_SECONDS_PER_VALUE['pca']), seconds.pop('write'))
+        seconds.update(fit_pass=max(extract, seconds.pop('stats')) + fit, stream_pass=stream_pass)
+        del seconds['project']
+    result.update(source=source, pipeline=pipeline, global_pca=global_pca, layers=layers, vertices=vertices, edges=edges,
+                  output_bytes=output, formats=formats, upper_bounds=upper_bounds, memory=memory, seconds=seconds)
+    return finish(result, start)
+
+def finish(result, start):
+    """Adds the library baseline, peak memory (the model stays resident through later stages) and total time."""
+    memory, seconds = result['memory'], result['seconds']
+    result['memory'] = dict(runtime=RUNTIME_BYTES, **memory)
+    result['memory']['peak'] = RUNTIME_BYTES + memory.get('load', 0) + max(v for k, v in memory.items() if k != 'load')
+    result['seconds'] = dict(startup=STARTUP_SECONDS, **seconds)
+    result['seconds']['total'] = sum(result['seconds'].values())
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+def human(n):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if abs(n) < 1024 or unit == 'TB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+def print_estimate(est, as_json=False):
+    if as_json:
+        print(json.dumps(est, indent=2))
+        return
+    if 'error' in est:
+        print(f"🧮 Dry run for {est['model']}: {est['error']}" + (f" ({est['source']})" if est.get('source') else ""))
+        return
+    print(f"🧮 Dry run for {est['model']} [{', '.join(est['modes'])}] from {est['source']}: {est['pipeline']}")
+    rows = [l['rows'] for l in est['layers']]
+    print(f"   ↳ {len(rows)} layers, {min(rows)}-{max(rows)} sampled rows each (step {est['step']}), "
+          f"{est['vertices']:,} vertices" + (f" (~{est['consolidated_vertices']:,} consolidated)" if 'consolidated_vertices' in est else ""))
+    for mode in est['modes']:
+        size = est['output_bytes'][mode]
+        bound = '≤' if mode in est.get('upper_bounds', ()) else ''
+        print(f"   ↳ {mode}: {bound}{est['edges'][mode]:,} edges, {human(size[est['formats'][mode]])} {est['formats'][mode]} "
+              f"(ascii {human(size['ascii'])} / binary {human(size['binary'])})")
+    mem = est['memory']
+    print("   ↳ Memory: " + ", ".join(f"{k} {human(v)}" for k, v in mem.items() if k != 'peak') + f" -> peak ~{human(mem['peak'])}")
+    sec = est['seconds']
+    print("   ↳ Time: " + ", ".join(f"{k} {v:.1f}s" for k, v in sec.items() if k != 'total') + f" -> ~{sec['total']:.0f}s")
+    # Headers and mock shapes are read without torch; config.json models are built on the meta device first
+    note = " (torch + transformers imported for the meta model; checkpoints and mocks take milliseconds)" if est['source'] == 'config.json' else ""
+    print(f"   ↳ Estimated in {est['elapsed_ms']:.1f} ms{note}")
@@ -1,121 +1,159 @@
 import numpy as np
+import scipy.sparse as sp
+import torch
 import torch.nn as nn
 from PIL import Image
 from transformers import AutoTokenizer, AutoImageProcessor
-from lib.models import get_model_structure
+from lib.models import get_model_structure, StopForward, stop_after
 
-def extract_weights(block):
+# Rows converted per chunk when a tensor has no direct numpy view (bf16, dtype change).
+# Bounds the temporary float32 buffer to CHUNK_ROWS x Features.
+CHUNK_ROWS = 1024
+
+# Sampled slices at or below this density are kept as scipy.sparse CSR.
+# CSR pays value + int32 index per nonzero, so it only wins well below 50% (float32).
+# scipy.sparse has no float16: with --precision float16 the values are rounded to half precision but the CSR
+# stores them as float32 (8 bytes per nonzero against 2 per dense value), which still wins below 25%.
+# Density is measured over the whole slice: a masked q_proj next to dense k/v (the MoE mocks) is ~70% dense,
+# and as CSR it would take more memory and a slower projection than the dense array.
+SPARSE_DENSITY = 0.2
+
+def to_numpy(t, dtype=np.float32, out=None):
+    """
+    Converts a 2D tensor (usually a strided view) to numpy without extra copies.
+    If the tensor already has the requested dtype we hand back a view on its storage.
+    Otherwise (bf16, float32 -> float16) rows are converted in CHUNK_ROWS blocks into `out`.
+    """
+    t = t.detach()
+    if out is None and t.dtype != torch.bfloat16 and t.numpy().dtype == dtype:
+        return t.numpy()
+
+    if out is None:
+        out = np.empty(tuple(t.shape), dtype=dtype)
+    for start in range(0, t.shape[0], CHUNK_ROWS):
+        chunk = t[start:start + CHUNK_ROWS]
+        if chunk.dtype == torch.bfloat16:
+            chunk = chunk.float() # numpy has no bf16
+        out[start:start + CHUNK_ROWS] = chunk.numpy() # casts into out.dtype
+    return out
+
+def sparse_dtype(dtype):
+    """dtype a CSR slice of `dtype` is stored in: float16 goes to float32 (scipy.sparse does not support it)."""
+    return np.dtype(np.float32) if np.dtype(dtype) == np.float16 else np.dtype(dtype)
+
+def as_csr(data):
+    """CSR copy of a dense or sparse slice, float16 lifted to float32 (see sparse_dtype)."""
+    return sp.csr_matrix(data, dtype=sparse_dtype(data.dtype))
+
+def to_sparse(t, dtype=np.float32):
+    """
+    Builds a CSR matrix from a 2D tensor view, densifying only CHUNK_ROWS rows at a time.
+    Values are rounded to `dtype` first, so a float16 slice holds the same values dense or sparse.
     """
-    Universal extractor: Finds Attention OR Convolution weights.
-    Returns: numpy array of shape (Hidden_Dim, Features)
+    chunks = [as_csr(to_numpy(t[start:start + CHUNK_ROWS], dtype))
+              for start in range(0, t.shape[0], CHUNK_ROWS)]
+    return sp.vstack(chunks, format='csr')
+
+def density(views):
+    """Fraction of nonzeros across tensor views (counted in torch, nothing is copied)."""
+    total = sum(v.numel() for v in views)
+    return sum(int(torch.count_nonzero(v)) for v in views) / max(total, 1)
+
+def maybe_sparse(t, dtype=np.float32):
+    """to_numpy, or CSR when the slice is at most SPARSE_DENSITY dense (MoE / masked weights)."""
+    if density([t]) <= SPARSE_DENSITY:
+        return to_sparse(t.detach(), dtype)
+    return to_numpy(t, dtype)
+
+def row_magnitudes(weights):
+    """Mean |w| per row. For CSR only the stored nonzeros are touched."""
+    if sp.issparse(weights):
+        return np.asarray(abs(weights).sum(axis=1)).ravel() / weights.shape[1]
+    return np.abs(weights).mean(axis=1)
+
+def sample_concat(weights, step=1, dtype=np.float32):
+    """
+    Equivalent of np.concatenate([w.T for w in weights], axis=1)[::step],
+    but picks the sampled rows first and writes them straight into one preallocated array.
+    `weights` are Linear weights [Out, In]; the result is [In/step, Sum(Out)].
+    Highly sparse slices are assembled as CSR instead (see SPARSE_DENSITY).
+    """
+    views = [w.detach()[:, ::step].T for w in weights]
+    if density(views) <= SPARSE_DENSITY:
+        return sp.hstack([to_sparse(v, dtype) for v in views], format='csr')
+
+    out = np.empty((views[0].shape[0], sum(v.shape[1] for v in views)), dtype=dtype)
+    col = 0
+    for v in views:
+        to_numpy(v, dtype, out[:, col:col + v.shape[1]])
+        col += v.shape[1]
+    return out
+
+def block_weights(block):
+    """
+    (weights, conv1d) that extract_weights samples from `block`, None for an unknown architecture:
+    Linear-style weights [Out, In] (convolutions flattened to [Out, In * Kh * Kw]) whose input columns become the
+    rows, or with conv1d a single GPT-2 Conv1D weight [In, Out] sampled by row.
+    Only module structure and shapes are looked at, so it works on meta-device models (see lib/estimate.py).
     """
     # 0. T5 Block (Structure is inside .layer[0])
     if hasattr(block, 'layer') and len(block.layer) > 0 and hasattr(block.layer[0], 'SelfAttention'):
         sa = block.layer[0].SelfAttention
-        q = sa.q.weight.detach().numpy().T
-        k = sa.k.weight.detach().numpy().T
-        v = sa.v.weight.detach().numpy().T
-        return np.concatenate([q, k, v], axis=1)
+        return [sa.q.weight, sa.k.weight, sa.v.weight], False
 
-    # 1. Try Attention (GPT/BERT/Llama)
+    # 1. Attention (GPT/BERT/Llama); GPT-2's Conv1D already stores [In, Out]
     if hasattr(block, 'attn') and hasattr(block.attn, 'c_attn'):
-        return block.attn.c_attn.weight.detach().numpy()
-    
+        return [block.attn.c_attn.weight], True
+
     if hasattr(block, 'attention') and hasattr(block.attention, 'self'):
-        q = block.attention.self.query.weight.detach().numpy().T
-        k = block.attention.self.key.weight.detach().numpy().T
-        v = block.attention.self.value.weight.detach().numpy().T
-        return np.concatenate([q, k, v], axis=1)
-
-    if hasattr(block, 'self_attn'):
-        if hasattr(block.self_attn, 'q_proj'):
-            q = block.self_attn.q_proj.weight.detach().numpy().T
-            k = block.self_attn.k_proj.weight.detach().numpy().T
-            v = block.self_attn.v_proj.weight.detach().numpy().T
-            return np.concatenate([q, k, v], axis=1)
-
-    # 2. Try Convolution (ResNet)
-    # ResNet blocks (Bottleneck) usually have 3 convs. The middle one (convolution) is the main 3x3.
-    # HF ResNet Layer structure: layer[i].convolution (if simplified) or specific naming.
-    # In HF `ResNetLayer`: has `convolution` (3x3) or `shortcut`.
-    for name, module in block.named_modules():
+        sa = block.attention.self
+        return [sa.query.weight, sa.key.weight, sa.value.weight], False
+
+    if hasattr(block, 'self_attn') and hasattr(block.self_attn, 'q_proj'):
+        sa = block.self_attn
+        return [sa.q_proj.weight, sa.k_proj.weight, sa.v_proj.weight], False
+
+    # 2. Convolution (ResNet): the first one of the block, [Out, In, Kh, Kw] -> [Out, In * Kh * Kw]
+    for module in block.modules():
         if isinstance(module, nn.Conv2d):
-            # We found a convolution!
-            # Shape: [Out_Channels, In_Channels, Kernel, Kernel]
-            # e.g., [64, 64, 3, 3] -> Flatten to [64, 576]
-            w = module.weight.detach().numpy()
-            out_ch, in_ch, kh, kw = w.shape
-            
-            # Reshape to 2D: [Out_Neurons, All_Input_Features]
-            # We treat Out_Channels as the "Neurons" of this layer
-            return w.reshape(out_ch, -1).T 
-            # Note: We Transpose (.T) because our PCA logic assumes [Samples, Features].
-            # Here "Samples" are the neurons (Out_Channels). So we want shape [Out_Ch, In_Features]
-            # Wait, `extract_and_crystallize` expects [Features, Neurons] generally?
-            # GPT2 weight is [768, 2304]. Input=768, Output=2304.
-            # We usually Transpose it in the main loop: `data_slice = attn_weights.T[::step]`
-            # So `extract_weights` should return [Input, Output].
-            # For Conv: [Out, In*K*K]. We want [In*K*K, Out].
-            
-            return w.reshape(out_ch, -1).T
-    
+            w = module.weight.detach()
+            return [w.reshape(w.shape[0], -1)], False
+
     # 3. Simple Linear (Perceptron)
     if isinstance(block, nn.Linear):
-         w = block.weight.detach().numpy() # [Out, In]
-         return w.T # [In, Out] -> PCA on In samples? No. 
-         # PCA logic: [Samples, Features]. 
-         # We want Points = Neurons.
-         # So we want [Neurons, WeightFeatures].
-         # Weight is [Out, In].
-         # So we want [Out, In].
-         # Wait, logic in Conv was: return w.reshape(out_ch, -1).T
-         # Conv W: [Out, In, k, k]. 
-         # Reshape: [Out, FlatIn].
-         # .T => [FlatIn, Out].
-         #
-         # If `extract_and_crystallize` does:
-         # current_points_count = layer_weights.shape[0]
-         # It expects [Points, Features].
-         #
-         # If Conv returns [FlatIn, Out]. shape[0] is FlatIn.
-         # This means Points = Input Features? 
-         # Let's check Gpt2 extraction:
-         # q = ... .T  (Shape: [Hidden, Hidden])?
-         # GPT2 weight: [768, 2304]. 
-         # .T => [2304, 768].
-         # 2304 Points? (3 * 768 Neurons). Yes.
-         # So for Linear [Out, In]. We want [Out, In]. 
-         # So we return Weight Matrix as is [Out, In]?
-         # Or do we Transpose?
-         # If we return [Out, In], then shape[0] = Out (Neurons).
-         # Conv returns [FlatIn, Out]. shape[0] = FlatIn.
-         # This seems inconsistent or I am misinterpreting `Conv`.
-         #
-         # Re-reading Conv: 
-         # w.reshape(out_ch, -1).T  -> [FlatIn, Out].
-         # shape[0] = FlatIn.
-         # So for Conv, the "Points" are the INPUT PIXELS/FEATURES?
-         #
-         # Let's check GPT2 again.
-         # q = sa.q.weight.detach().numpy().T
-         # Weight: [Hidden, Hidden]. (Linear layer weight is [Out, In]).
-         # .T => [In, Out].
-         # shape[0] = In.
-         # So the CRYSTAL visualizes the INPUT DIMENSIONS, not the NEURONS?
-         #
-         # If I want to visualize Neurons (Out), I should return [Out, In].
-         # But the code seems to prefer [In, Out].
-         # Let's follow the pattern: Return [In, Out].
-         # Linear Weight: [Out, In].
-         # Return Weight.T -> [In, Out].
-         return block.weight.detach().numpy().T
-
+        return [block.weight], False
     return None
 
-def get_activations(model, model_name, text="The future is vast and infinite", image_path=None):
-    """Runs a forward pass to capture neuron activation intensity."""
+def sampled_shape(weights, conv1d, step=1):
+    """(rows, features) of the slice extract_weights builds from block_weights(block)."""
+    if conv1d:
+        return (weights[0].shape[0] + step - 1) // step, weights[0].shape[1]
+    return (weights[0].shape[1] + step - 1) // step, sum(w.shape[0] for w in weights)
+
+def extract_weights(block, step=1, dtype=np.float32):
+    """
+    Universal extractor: Finds Attention OR Convolution weights (see block_weights).
+    Returns: numpy array of shape (Hidden_Dim / step, Features), already sampled with `step`.
+    Single-tensor layers come back as views on the model weights whenever the dtype allows it,
+    very sparse layers as scipy.sparse CSR.
+    """
+    found = block_weights(block)
+    if found is None:
+        return None
+    weights, conv1d = found
+    if conv1d:
+        return maybe_sparse(weights[0][::step], dtype)
+    if len(weights) == 1:
+        return maybe_sparse(weights[0][:, ::step].T, dtype)
+    return sample_concat(weights, step, dtype)
+
+def get_activations(model, model_name, text="The future is vast and infinite", image_path=None, layers=None):
+    """
+    Runs a forward pass to capture neuron activation intensity.
+    With `layers` (block indices) only those blocks are hooked and the pass stops after the last one.
+    """
     activations = {}
-    layers = get_model_structure(model)
+    blocks, selected = get_model_structure(model), layers
     
     # Universal Hook
     def get_hook(layer_idx):
@@ -138,9 +176,12 @@ def get_activations(model, model_name, text="The future is vast and infinite", i
 
     hooks = []
     # CNNs (ResNet) have nested structures. We need to hook the 'convolution' layers or the blocks.
-    # For ResNet, `layers` is a flat list of blocks. We hook the block output.
-    for i, block in enumerate(layers):
-        hooks.append(block.register_forward_hook(get_hook(i)))
+    # For ResNet, `blocks` is a flat list of blocks. We hook the block output.
+    for i, block in enumerate(blocks):
+        if selected is None or i in selected:
+            hooks.append(block.register_forward_hook(get_hook(i)))
+    if selected:
+        hooks.append(stop_after(blocks[selected[-1]]))
     
     # INPUT HANDLING
     try:
@@ -156,6 +197,8 @@ def get_activations(model, model_name, text="The future is vast and infinite", i
             inputs = tokenizer(text, return_tensors="pt")
             model(**inputs)
             
+    except StopForward:
+        pass
     except Exception as e:
         print(f"Warning during forward pass: {e}")
     
@@ -0,0 +1,159 @@
+import json
+import os
+import numpy as np
+from lib.compare import layer_labels, layer_centroids, normalize_plane
+from lib.pack import sha256_file
+from lib.plyio import read_ply
+
+# Fingerprint: a fixed-length descriptor of a crystal's geometry, invariant to the arbitrary parts of a build
+# (PCA signs / rotation in the projection plane, scale, vertex count, layer count):
+#   trajectory  radius of the layer centroid track and its step lengths, resampled to DEPTH_SAMPLES relative depths
+#   spread      RMS distance of each layer's points to their centroid, same depths
+#   radial      histogram of point radii (unit RMS radius), RADIAL_BINS over [0, RADIAL_MAX]
+#   edges       histogram of edge lengths in the projection plane, EDGE_BINS over [0, EDGE_MAX]
+# Index (fingerprints.json next to manifest.json): {version, descriptor, weights, entries: {name: {sha256, model, ..., vector}}}
+VERSION = 1
+DEPTH_SAMPLES = 16
+RADIAL_BINS, RADIAL_MAX = 16, 3.0
+EDGE_BINS, EDGE_MAX = 16, 4.0 # ring edges join neurons in index order, so they span the whole cloud
+FAMILIES = {'trajectory': 2 * DEPTH_SAMPLES - 1, 'spread': DEPTH_SAMPLES, 'radial': RADIAL_BINS, 'edges': EDGE_BINS}
+
+def family_slices():
+    slices, start = {}, 0
+    for name, size in FAMILIES.items():
+        slices[name] = slice(start, start + size)
+        start += size
+    return slices
+
+def resample_depth(values):
+    """[Layers, ...] per-layer values -> [DEPTH_SAMPLES, ...] by linear interpolation over relative depth."""
+    depth = np.linspace(0, 1, len(values))
+    target = np.linspace(0, 1, DEPTH_SAMPLES)
+    if len(values) == 1:
+        return np.repeat(values, DEPTH_SAMPLES, axis=0)
+    if values.ndim == 1:
+        return np.interp(target, depth, values)
+    return np.stack([np.interp(target, depth, values[:, k]) for k in range(values.shape[1])], axis=1)
+
+def histogram(values, bins, limit):
+    """Fraction of values per bin over [0, limit], the last bin also takes everything beyond."""
+    counts = np.bincount(np.minimum((values * (bins / limit)).astype(np.int64), bins - 1), minlength=bins)
+    return counts / max(len(values), 1)
+
+def fingerprint(vertex, edge=None):
+    """Descriptor [sum(FAMILIES)] float32 of one crystal from its vertex (x, y, z) and edge (vertex1, vertex2) arrays."""
+    plane = normalize_plane(np.stack([vertex['x'], vertex['z']], axis=1).astype(np.float64))
+    labels = layer_labels(np.asarray(vertex['y'], dtype=np.float64))
+    n_layers = labels.max() + 1
+    centroids = layer_centroids(plane, labels, n_layers)
+    counts = np.maximum(np.bincount(labels, minlength=n_layers), 1)
+    spread = np.sqrt(np.bincount(labels, weights=((plane - centroids[labels]) ** 2).sum(axis=1), minlength=n_layers) / counts)
+
+    track = resample_depth(centroids)
+    radii = np.sqrt((plane ** 2).sum(axis=1))
+    if edge is not None and len(edge):
+        lengths = np.sqrt(((plane[edge['vertex1']] - plane[edge['vertex2']]) ** 2).sum(axis=1))
+    else:
+        lengths = np.zeros(0)
+    return np.concatenate([
+        np.linalg.norm(track, axis=1), np.linalg.norm(np.diff(track, axis=0), axis=1),
+        resample_depth(spread),
+        histogram(radii, RADIAL_BINS, RADIAL_MAX),
+        histogram(lengths, EDGE_BINS, EDGE_MAX),
+    ]).astype(np.float32)
+
+def fingerprint_file(path):
+    """(descriptor, {'vertices', 'edges', 'layers'}) of a crystal PLY."""
+    ply = read_ply(path)
+    vertex, edge = ply['vertex'], ply.get('edge')
+    info = {'vertices': len(vertex), 'edges': len(edge) if edge is not None else 0,
+            'layers': int(layer_labels(np.asarray(vertex['y'], dtype=np.float64)).max() + 1)}
+    return fingerprint(vertex, edge), info
+
+def family_weights(vectors):
+    """1 / mean pairwise distance of each family over the index, so every family weighs the same on average."""
+    weights = {}
+    for name, sl in family_slices().items():
+        block = vectors[:, sl]
+        d = np.sqrt(((block[:, None, :] - block[None, :, :]) ** 2).sum(axis=2))
+        mean = d.sum() / max(len(block) * (len(block) - 1), 1)
+        weights[name] = 1.0 / float(mean) if mean > 0 else 1.0
+    return weights
+
+def family_distances(query, vectors, weights):
+    """
+    {family: [N] weighted Euclidean distance} between `query` [D] and every row of `vectors` [N, D].
+    Their sum is 0 for identical geometry and about len(FAMILIES) for an average pair of the index.
+    """
+    return {name: weights[name] * np.sqrt(((vectors[:, sl] - query[sl]) ** 2).sum(axis=1)) for name, sl in family_slices().items()}
+
+def manifest_models(root):
+    """{crystal file (relative to root, as in manifest.json): model id} from <root>/crystals/manifest.json, if any."""
+    path = os.path.join(root, 'crystals', 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {c['file']: m['id'] for m in json.load(f) for c in m.get('crystals', []) if 'file' in c}
+
+def load_index(path):
+    if not os.path.exists(path):
+        return {'version': VERSION, 'entries': {}}
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != VERSION or index.get('descriptor') != FAMILIES:
+        return {'version': VERSION, 'entries': {}} # descriptor layout changed: everything is recomputed
+    return index
+
+def update_index(path, files, root, full=False):
+    """
+    files: {name relative to root: local path}. Crystals whose sha256 matches the index are kept as they are,
+    the rest are fingerprinted; entries whose file is gone from disk are dropped. Family weights are refitted
+    over the whole index (cheap: a few dozen vectors). Returns (index, stats).
+    """
+    index = {'version': VERSION, 'entries': {}} if full else load_index(path)
+    entries, models = index['entries'], manifest_models(root)
+    stats = {'computed': 0, 'unchanged': 0, 'removed': 0}
+    for name in sorted(files):
+        digest = sha256_file(files[name])
+        if name in entries and entries[name]['sha256'] == digest:
+            stats['unchanged'] += 1
+            continue
+        vector, info = fingerprint_file(files[name])
+        model = models.get(name) or os.path.basename(os.path.dirname(name)) or os.path.splitext(name)[0]
+        entries[name] = dict(sha256=digest, model=model, **info, vector=[round(float(v), 6) for v in vector])
+        stats['computed'] += 1
+    for name in [n for n in entries if n not in files and not os.path.exists(os.path.join(root, n))]:
+        del entries[name]
+        stats['removed'] += 1
+
+    names = sorted(entries)
+    vectors = np.array([entries[n]['vector'] for n in names], dtype=np.float32).reshape(len(names), -1)
+    index.update(version=VERSION, descriptor=FAMILIES, weights=family_weights(vectors) if len(names) > 1 else {n: 1.0 for n in FAMILIES},
+                 entries={n: entries[n] for n in names})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    return index, stats
+
+def query_index(index, queries, k=5, exclude=(), per_model=True):
+    """
+    The k entries nearest to any of `queries` ([Q, D] descriptors, e.g. every crystal of one model) as
+    [(distance, name, entry, {family: distance})], closest first. Entries of the models in `exclude` are skipped;
+    per_model keeps only each model's closest crystal.
+    """
+    names = [n for n, e in index['entries'].items() if e['model'] not in exclude]
+    if not names:
+        return []
+    vectors = np.array([index['entries'][n]['vector'] for n in names], dtype=np.float32)
+    parts = [family_distances(q, vectors, index['weights']) for q in np.asarray(queries, dtype=np.float32).reshape(-1, vectors.shape[1])]
+    totals = np.stack([sum(p.values()) for p in parts])
+    best, d = totals.argmin(axis=0), totals.min(axis=0)
+    results, seen = [], set()
+    for i in np.argsort(d, kind='stable'):
+        entry = index['entries'][names[i]]
+        if per_model and entry['model'] in seen:
+            continue
+        seen.add(entry['model'])
+        results.append((float(d[i]), names[i], entry, {f: float(v[i]) for f, v in parts[best[i]].items()}))
+        if len(results) == k:
+            break
+    return results
@@ -0,0 +1,204 @@
+import glob
+import json
+import os
+import re
+import struct
+import numpy as np
+from lib.quantized import find_quantized, logical_keys, may_be_quantized, quantization_config
+
+# Checkpoint layout from the safetensors headers and tensor names alone: which tensors make up each layer and
+# their shapes. Imports neither torch nor the model code, so --dry-run (lib/estimate.py) answers in milliseconds;
+# lib/checkpoints.py, lib/moe.py, lib/blocks.py and lib/embeddings.py read the tensors these helpers point at.
+
+def is_checkpoint(path):
+    """True for a local directory (or single file) holding safetensors weights."""
+    if os.path.isfile(path):
+        return path.endswith('.safetensors')
+    return os.path.isdir(path) and bool(glob.glob(os.path.join(path, '*.safetensors')))
+
+SAFETENSORS_DTYPE_BYTES = {'F64': 8, 'F32': 4, 'F16': 2, 'BF16': 2, 'I64': 8, 'I32': 4, 'I16': 2, 'I8': 1,
+                           'U8': 1, 'BOOL': 1, 'F8_E4M3': 1, 'F8_E5M2': 1}
+
+class CheckpointHeader:
+    """
+    Names, shapes and dtypes of a safetensors checkpoint from the JSON headers alone (first bytes of each shard,
+    no mmap, no torch). Has the keys()/shape() of Checkpoint, so the find_* helpers work on it; quantized
+    weights show up under their logical name and shape, like in Checkpoint.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tensors = {}
+        files = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '*.safetensors')))
+        for shard in files:
+            with open(shard, 'rb') as f:
+                header = json.loads(f.read(struct.unpack('<Q', f.read(8))[0]))
+            header.pop('__metadata__', None)
+            for name, info in header.items():
+                self.tensors[name] = (info['dtype'], tuple(info['shape']))
+        self.quantized = find_quantized(self.tensors, quantization_config(path)) if may_be_quantized(self.tensors) else {}
+        self.names = logical_keys(self.tensors, self.quantized)
+
+    def keys(self):
+        return list(self.names)
+
+    def __contains__(self, name):
+        return name in self.quantized or name in self.tensors
+
+    def shape(self, name):
+        return self.quantized[name].shape if name in self.quantized else self.tensors[name][1]
+
+    def nbytes(self, name=None):
+        """Bytes of one tensor, or of the whole checkpoint."""
+        names = [name] if name else self.tensors
+        return sum(int(np.prod(self.tensors[n][1], dtype=np.int64)) * SAFETENSORS_DTYPE_BYTES.get(self.tensors[n][0], 4) for n in names)
+
+# Attention projections per layer, by checkpoint key, mirroring extract_weights.
+# (pattern matching the first tensor, sibling tensors to concatenate, stored as [In, Out] Conv1D?)
+ATTENTION_PATTERNS = [
+    # Llama / Mistral / Qwen / Phi-3 style
+    (re.compile(r'^(.*layers\.(\d+)\.self_attn)\.q_proj\.weight$'), ['q_proj', 'k_proj', 'v_proj'], False),
+    # BERT
+    (re.compile(r'^(.*layer\.(\d+)\.attention\.self)\.query\.weight$'), ['query', 'key', 'value'], False),
+    # GPT-2 (Conv1D already stores [In, Out])
+    (re.compile(r'^(.*h\.(\d+)\.attn)\.c_attn\.weight$'), ['c_attn'], True),
+]
+
+def find_attention_layers(ckpt):
+    """[(layer index, [tensor names], is_conv1d)] sorted by layer, from the keys alone."""
+    found = []
+    for name in ckpt.keys():
+        for pattern, parts, conv1d in ATTENTION_PATTERNS:
+            m = pattern.match(name)
+            if m:
+                found.append((int(m.group(2)), [f"{m.group(1)}.{p}.weight" for p in parts], conv1d))
+                break
+    return sorted(found)
+
+# Router (gate) tensor per MoE layer -> template of the expert tensor we crystallize.
+# We take each expert's input projection (gate_proj / w1): [Intermediate, Hidden].
+MOE_PATTERNS = [
+    # Mixtral: model.layers.3.block_sparse_moe.gate.weight / ...experts.7.w1.weight
+    (re.compile(r'^(.*layers\.(\d+)\.block_sparse_moe)\.gate\.weight$'), '{prefix}.experts.{expert}.w1.weight'),
+    # Qwen-MoE / DeepSeek-MoE: model.layers.3.mlp.gate.weight / ...mlp.experts.7.gate_proj.weight
+    (re.compile(r'^(.*layers\.(\d+)\.mlp)\.gate\.weight$'), '{prefix}.experts.{expert}.gate_proj.weight'),
+]
+
+def find_moe_layers(ckpt):
+    """Returns [{'layer', 'router', 'expert_name'}] sorted by layer index, from the checkpoint keys alone."""
+    found = []
+    for name in ckpt.keys():
+        for pattern, template in MOE_PATTERNS:
+            m = pattern.match(name)
+            if m:
+                found.append({
+                    'layer': int(m.group(2)),
+                    'router': name,
+                    'expert_name': template.replace('{prefix}', m.group(1)),
+                })
+                break
+    return sorted(found, key=lambda l: l['layer'])
+
+# Full-block extraction (--block full): every tensor of interest of a block becomes rows tagged with its sub-module.
+# Rows are the sub-module's neurons and features the residual stream, so attention and MLP of one transformer
+# block share the feature axis (and the global projection):
+#   Linear [Out, In]: readers (q, k, v, gate, up) keep their rows, writers (o, down) are read by column;
+#   GPT-2's Conv1D stores [In, Out], so there it is the other way round.
+# Convolutions keep their output channels as rows ([Out, In * Kh * Kw]). When the tensors of a block differ in
+# width (CNN blocks) they are laid out block-diagonally as CSR, so each sub-module keeps its own feature columns.
+BLOCK_PARTS = ['q', 'k', 'v', 'qkv', 'o', 'gate', 'up', 'down', 'conv', 'linear']
+
+# (name relative to the block, part tag(s), rows are the tensor's columns). First match wins, so BERT's
+# attention.output.dense is an `o` before output.dense can be a `down`. Several tags split a fused tensor's
+# neurons evenly. MoE experts (mlp.experts.N.*) never match: checkpoints crystallize them with --experts.
+BLOCK_TENSORS = [(re.compile(rf'(^|\.)({pattern})\.weight$'), parts, by_column) for pattern, parts, by_column in [
+    (r'q_proj|query|q_lin|SelfAttention\.q|EncDecAttention\.q', 'q', False),
+    (r'k_proj|key|k_lin|SelfAttention\.k|EncDecAttention\.k', 'k', False),
+    (r'v_proj|value|v_lin|SelfAttention\.v|EncDecAttention\.v', 'v', False),
+    (r'qkv_proj|query_key_value|Wqkv', 'qkv', False),
+    (r'attn\.c_attn', ('q', 'k', 'v'), True), # GPT-2 Conv1D [Hidden, 3 * Hidden]
+    (r'o_proj|out_proj|out_lin|attention\.output\.dense|(self_)?attention\.dense|SelfAttention\.o|EncDecAttention\.o', 'o', True),
+    (r'attn\.c_proj', 'o', False),
+    (r'mlp\.gate_up_proj', ('gate', 'up'), False),
+    (r'mlp\.gate_proj|DenseReluDense\.wi_0', 'gate', False),
+    (r'mlp\.up_proj|mlp\.fc1|intermediate\.dense|ffn\.lin1|mlp\.dense_h_to_4h|DenseReluDense\.wi(_1)?', 'up', False),
+    (r'mlp\.c_fc', 'up', True),
+    (r'mlp\.down_proj|mlp\.fc2|output\.dense|ffn\.lin2|mlp\.dense_4h_to_h|DenseReluDense\.wo', 'down', True),
+    (r'mlp\.c_proj', 'down', False),
+]]
+
+# Block stacks in checkpoint keys: '<stack>.<index>.<name relative to the block>'
+LAYER_KEY = re.compile(r'^(.*?(?:^|\.)(?:layers|layer|h|block|blocks)\.)(\d+)\.(.+)$')
+
+def block_entries(named):
+    """
+    [(name, parts, by_column)] of one block's tensors of interest from its (relative name, shape) pairs, in
+    BLOCK_PARTS order, then natural name order (the same for a model and its checkpoint).
+    Unmatched convolutions are `conv`; a block with nothing else keeps its 2D weights as `linear`.
+    """
+    found, linear = [], []
+    for name, shape in named:
+        if not name.endswith('weight') or len(shape) < 2:
+            continue
+        for pattern, parts, by_column in BLOCK_TENSORS:
+            if pattern.search(name):
+                found.append((name, parts if isinstance(parts, tuple) else (parts,), by_column))
+                break
+        else:
+            if len(shape) > 2:
+                found.append((name, ('conv',), False))
+            else:
+                linear.append((name, ('linear',), False))
+    natural = lambda name: [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', name)]
+    return sorted(found or linear, key=lambda e: (BLOCK_PARTS.index(e[1][0]), natural(e[0])))
+
+def piece_shape(shape, by_column, step=1):
+    """(sampled rows, features) one tensor contributes."""
+    if by_column:
+        return (shape[1] + step - 1) // step, shape[0]
+    return (shape[0] + step - 1) // step, int(np.prod(shape[1:]))
+
+def block_shape(shapes, step=1):
+    """(rows, features) of a block from its [(tensor shape, by_column)]: features add up when widths differ."""
+    pieces = [piece_shape(shape, by_column, step) for shape, by_column in shapes]
+    widths = {w for _, w in pieces}
+    return sum(r for r, _ in pieces), widths.pop() if len(widths) == 1 else sum(w for _, w in pieces)
+
+def find_block_layers(ckpt):
+    """
+    [(layer index, [(key, parts, by_column)])] sorted by layer, from the keys and shapes alone (Checkpoint or
+    CheckpointHeader). Stacks (T5 encoder / decoder, ResNet stages) are numbered one after another, in the order
+    their first tensor appears.
+    """
+    stacks, shapes = {}, {}
+    for key in ckpt.keys():
+        m = LAYER_KEY.match(key) if key.endswith('weight') else None
+        if m:
+            layers = stacks.setdefault(m.group(1), {})
+            layers.setdefault(int(m.group(2)), []).append((m.group(3), key))
+            shapes[key] = tuple(ckpt.shape(key))
+    found, offset = [], 0
+    for layers in stacks.values():
+        for idx in sorted(layers):
+            keys = dict(layers[idx])
+            entries = block_entries((name, shapes[key]) for name, key in layers[idx])
+            if entries:
+                found.append((offset + idx, [(keys[name], parts, by_column) for name, parts, by_column in entries]))
+        offset += max(layers) + 1
+    return found
+
+# Token embedding tables by checkpoint key (first match wins)
+EMBEDDING_PATTERNS = [
+    re.compile(r'(^|\.)embed_tokens\.weight$'),      # Llama / Mistral / Qwen / Phi-3
+    re.compile(r'(^|\.)wte\.weight$'),               # GPT-2
+    re.compile(r'(^|\.)word_embeddings\.weight$'),   # BERT / BLOOM
+    re.compile(r'(^|\.)tok_embeddings\.weight$'),    # Meta Llama originals
+    re.compile(r'(^|\.)embed_in\.weight$'),          # GPT-NeoX / Pythia
+    re.compile(r'^shared\.weight$'),                 # T5
+]
+
+def find_embedding_key(ckpt):
+    for pattern in EMBEDDING_PATTERNS:
+        for name in ckpt.keys():
+            if pattern.search(name):
+                return name
+    return None
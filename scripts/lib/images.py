@@ -0,0 +1,167 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from transformers import AutoImageProcessor
+from lib.corpus import batched
+from lib.models import get_model_structure, StopForward, stop_after
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tif', '.tiff')
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+def list_images(directory):
+    """[(relative path, class)] sorted. Class is the first sub-directory (ImageFolder layout), '' for top-level files."""
+    found = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                rel = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+                found.append((rel, rel.split('/')[0] if '/' in rel else ''))
+    return sorted(found)
+
+def load_preprocessor(model, model_name, image_size=224):
+    """
+    PIL image -> [C, H, W] float32, built once per run. Uses the model's AutoImageProcessor when it has one;
+    mocks (and models without a processor) get resize + center crop + ImageNet normalization.
+    """
+    if hasattr(model, 'config'):
+        try:
+            processor = AutoImageProcessor.from_pretrained(model_name)
+            return lambda image: processor(images=image, return_tensors='np')['pixel_values'][0]
+        except Exception as e:
+            print(f"   ⚠️  No image processor for {model_name} ({e}). Using ImageNet preprocessing.")
+
+    def preprocess(image):
+        w, h = image.size
+        scale = image_size * 256 / 224 / min(w, h)
+        image = image.resize((max(round(w * scale), image_size), max(round(h * scale), image_size)), Image.BILINEAR)
+        left, top = (image.size[0] - image_size) // 2, (image.size[1] - image_size) // 2
+        x = np.asarray(image.crop((left, top, left + image_size, top + image_size)), dtype=np.float32) / 255.0
+        return ((x - IMAGENET_MEAN) / IMAGENET_STD).transpose(2, 0, 1)
+    return preprocess
+
+def load_image(path, preprocess):
+    with Image.open(path) as image:
+        return preprocess(image.convert('RGB'))
+
+def prefetch_batches(paths, preprocess, batch_size=16, workers=4, depth=4):
+    """
+    Yields (indices, [B, C, H, W] tensor) in order. A thread pool decodes and preprocesses images while the
+    model runs; at most `depth` batches are in flight, so memory stays bounded whatever the directory size.
+    Unreadable images are reported and left out of their batch.
+    """
+    batches = batched(list(enumerate(paths)), batch_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def submit():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append([(i, path, pool.submit(load_image, path, preprocess)) for i, path in batch])
+
+        for _ in range(depth):
+            submit()
+        while pending:
+            batch = pending.popleft()
+            submit()
+            indices, arrays = [], []
+            for i, path, future in batch:
+                try:
+                    arrays.append(future.result())
+                    indices.append(i)
+                except Exception as e:
+                    print(f"   ⚠️  Skipping {path}: {e}")
+            if arrays:
+                yield indices, torch.from_numpy(np.stack(arrays))
+
+def image_activations(model, model_name, image_dir, batch_size=16, workers=4, layers=None):
+    """
+    Batched activation pass over every image in `image_dir`. Hooks on every block from get_model_structure
+    (or the `layers` block indices, each batch then stops after the last one) record the per-image mean
+    activation per channel (same reduction as get_activations).
+    Returns (image names, classes, {layer_idx: [Images, Channels] float32}) for the images that ran.
+    """
+    images = list_images(image_dir)
+    if not images:
+        print(f"No images found in {image_dir}.")
+        return [], [], {}
+    selected, layers = layers, get_model_structure(model)
+    if hasattr(model, 'config'):
+        forward = lambda x: model(pixel_values=x)
+    elif isinstance(layers, nn.Sequential):
+        forward = layers # mock CNNs are weight containers: run the feature stack itself
+    else:
+        print("   ⚠️  This model has no runnable image forward pass.")
+        return [], [], {}
+
+    captured = {}
+    def get_hook(layer_idx):
+        def hook(module, input, output):
+            data = (output[0] if isinstance(output, tuple) else output).detach()
+            if data.dim() == 4: # CNN [Batch, Channels, H, W]
+                data = data.mean(dim=(2, 3))
+            elif data.dim() == 3: # ViT [Batch, Tokens, Dim]
+                data = data.mean(dim=1)
+            elif data.dim() != 2:
+                return
+            captured.setdefault(layer_idx, []).append(data.float().numpy())
+        return hook
+
+    preprocess = load_preprocessor(model, model_name)
+    hooks = [block.register_forward_hook(get_hook(i)) for i, block in enumerate(layers) if selected is None or i in selected]
+    if selected:
+        hooks.append(stop_after(layers[selected[-1]]))
+    model.eval()
+    print(f"🖼️  Seeing {len(images)} images from '{image_dir}' (batch {batch_size}, {workers} decode threads)...")
+    done, start = [], time.time()
+    try:
+        with torch.no_grad():
+            for indices, pixels in prefetch_batches([os.path.join(image_dir, rel) for rel, _ in images], preprocess, batch_size, workers):
+                try:
+                    forward(pixels)
+                except StopForward:
+                    pass
+                done.extend(indices)
+    finally:
+        for h in hooks: h.remove()
+
+    elapsed = max(time.time() - start, 1e-9)
+    print(f"   ↳ {len(done)} images in {elapsed:.1f}s ({len(done) / elapsed * 60:.0f} images/min)")
+    return [images[i][0] for i in done], [images[i][1] for i in done], {i: np.concatenate(c) for i, c in captured.items()}
+
+def save_image_intensities(filename, names, classes, per_image, layer_ids, counts, step, per_class=False, groups=None):
+    """
+    Per-image intensities aligned with the crystal's vertices (same neuron -> vertex mapping as layer_colors),
+    so any image can recolor the shared geometry: `intensity` [Images, Vertices] float16, plus `images` and
+    `classes`. per_class adds `class_names`, `class_counts` and `class_intensity` [Classes, Vertices].
+    groups (from voxel_groups) averages the columns of merged vertices, matching a consolidated crystal.
+    """
+    columns = []
+    for layer_id, count in zip(layer_ids, counts):
+        block = np.zeros((len(names), count), dtype=np.float32)
+        neuron_idx = np.arange(count) * step
+        acts = per_image.get(layer_id)
+        if acts is not None:
+            valid = neuron_idx < acts.shape[1]
+            block[:, valid] = acts[:, neuron_idx[valid]]
+        columns.append(block)
+    intensity = np.concatenate(columns, axis=1)
+    if groups is not None:
+        inverse, cell_counts, _ = groups
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(cell_counts)[:-1]])
+        intensity = np.add.reduceat(intensity[:, order], starts, axis=1) / cell_counts
+    arrays = {'images': np.array(names), 'classes': np.array(classes), 'intensity': intensity.astype(np.float16)}
+    if per_class:
+        class_names, inverse = np.unique(np.array(classes), return_inverse=True)
+        members = np.eye(len(class_names), dtype=np.float32)[inverse] # [Images, Classes] one-hot
+        sums = members.T @ intensity
+        class_counts = np.bincount(inverse, minlength=len(class_names))
+        arrays.update(class_names=class_names, class_counts=class_counts,
+                      class_intensity=(sums / class_counts[:, None]).astype(np.float32))
+    np.savez_compressed(filename, **arrays)
@@ -0,0 +1,83 @@
+import numpy as np
+from lib.rendering import get_colors, get_expert_colors, get_attention_colors
+
+# Same layout as the per-point loop in prismata_make.py, one whole layer at a time.
+
+# Per-vertex tags a layer record may carry -> vertex property (MoE experts, full-block sub-modules)
+TAG_PROPERTIES = {'experts': ('expert', 'u2'), 'parts': ('part', 'u1')}
+
+def layer_positions(projection, layer_idx):
+    """[N, 2|3] projection -> [N, 3] float32 positions (layers stacked along Y, hypercube in full 3D)."""
+    if projection.shape[1] == 3:
+        return (projection * 2.0).astype(np.float32)
+    pos = np.empty((projection.shape[0], 3), dtype=np.float32)
+    pos[:, 0] = projection[:, 0] * 1.5
+    pos[:, 1] = layer_idx * 0.15
+    pos[:, 2] = projection[:, 1] * 1.5
+    return pos
+
+def layer_edges(offset, count, prev_count=0, ring=True):
+    """
+    Ring inside the layer plus vertical/diagonal links to the relative position in the previous layer.
+    ring=False leaves out the ring (attention crystals draw their own intra-layer edges).
+    Returns [E, 2] int32 global vertex indices.
+    """
+    idx = offset + np.arange(count, dtype=np.int64)
+    parts = [np.stack([idx[:-1], idx[1:]], axis=1)] if ring else [np.empty((0, 2), dtype=np.int64)]
+    if prev_count:
+        prev_start = offset - prev_count
+        prev_idx = np.minimum((np.arange(count) / count * prev_count).astype(np.int64), prev_count - 1)
+        parts.append(np.stack([prev_start + prev_idx, idx], axis=1))
+        left = prev_idx > 0
+        parts.append(np.stack([prev_start + prev_idx[left] - 1, idx[left]], axis=1))
+        right = prev_idx < prev_count - 1
+        parts.append(np.stack([prev_start + prev_idx[right] + 1, idx[right]], axis=1))
+    return np.concatenate(parts).astype(np.int32)
+
+def count_edges(count, prev_count=0, ring=True):
+    """Number of edges layer_edges() will produce, without building them."""
+    n = max(count - 1, 0) if ring else 0
+    if prev_count:
+        prev_idx = np.minimum((np.arange(count) / count * prev_count).astype(np.int64), prev_count - 1)
+        n += count + int(np.count_nonzero(prev_idx > 0)) + int(np.count_nonzero(prev_idx < prev_count - 1))
+    return n
+
+def tag_dtype(tags):
+    """Extra vertex properties for the per-vertex tags any of the layer tag records carries."""
+    return [prop for key, prop in TAG_PROPERTIES.items() if any(t is not None and key in t for t in tags)]
+
+def fill_tags(vertex, tags):
+    """Writes one layer's tags into its vertex records (0 for properties the layer has no tags for)."""
+    for key, (name, _) in TAG_PROPERTIES.items():
+        if name in vertex.dtype.names:
+            vertex[name] = tags[key] if tags is not None and key in tags else 0
+
+def layer_colors(mode, layer_idx, total_layers, magnitudes, step, activations=None, tags=None, attention=None):
+    """
+    [N, 3] uint8 colors for one layer, in one vectorized call (same values as get_color per point for the
+    plain modes). attention: {'heads', 'n_heads', 'received'} per vertex.
+    tags: the layer's MoE record ({'experts', 'num_experts', 'router'}) or block record ({'parts', 'num_parts'}).
+    """
+    if attention is not None:
+        return get_attention_colors(attention['heads'], attention['n_heads'], attention['received'])
+    if tags is not None and 'experts' in tags and mode == 'default':
+        return get_expert_colors(tags['experts'], tags['num_experts'], tags['router'])
+    if tags is not None and 'parts' in tags and mode == 'parts':
+        # Hue = sub-module (q, k, v, o, gate, up, down, conv), brightness = the neuron's weight magnitude in its layer
+        return get_expert_colors(tags['parts'], tags['num_parts'], magnitudes / max(float(np.max(magnitudes)), 1e-12))
+
+    neuron_idx = np.arange(len(magnitudes)) * step
+    act_vals = None
+    if mode == 'latency':
+        act_vals = np.full(len(magnitudes), float(activations) if activations is not None else 0.0)
+    if mode == 'activation' and activations is not None and np.ndim(activations) > 0:
+        acts = np.asarray(activations)
+        act_vals = np.zeros(len(magnitudes), dtype=acts.dtype)
+        valid = neuron_idx < acts.shape[0]
+        act_vals[valid] = acts[neuron_idx[valid]]
+    if mode == 'attribution' and activations is not None:
+        # Attribution scores are already reduced to the sampled channels: one score per row
+        scores = np.asarray(activations, dtype=np.float64)
+        act_vals = np.zeros(len(magnitudes))
+        act_vals[:min(len(scores), len(act_vals))] = scores[:len(act_vals)]
+    return get_colors(mode, layer_idx, total_layers, neuron_idx, magnitudes, act_vals)
@@ -0,0 +1,66 @@
+import numpy as np
+
+# Parameter shapes of the mock models (MOCK_MODELS in lib/models.py) without building them: --dry-run sizes a
+# mock from these declared shapes in milliseconds, with neither torch nor transformers imported.
+# A mock is the list of its get_model_structure() blocks, each block the (name, shape) pairs its named_parameters()
+# reports (ReLU / pooling blocks have none). Keep in step with the mock classes.
+
+def linear(n_in, n_out, prefix='', bias=True):
+    """nn.Linear(n_in, n_out) registered as `prefix`."""
+    return [(f'{prefix}weight', (n_out, n_in))] + ([(f'{prefix}bias', (n_out,))] if bias else [])
+
+def conv(n_in, n_out, k):
+    """nn.Conv2d(n_in, n_out, kernel_size=k)."""
+    return [('weight', (n_out, n_in, k, k)), ('bias', (n_out,))]
+
+def attention(hidden, parts='qkv'):
+    """A mock transformer block: self_attn.{q,k,v}_proj Linear(hidden, hidden)."""
+    return [p for part in parts for p in linear(hidden, hidden, f'self_attn.{part}_proj.')]
+
+RELU = POOL = []
+
+MOCK_SHAPES = {
+    'alexnet': lambda: [conv(3, 64, 11), RELU, POOL, conv(64, 192, 5), RELU, POOL, conv(192, 384, 3), RELU,
+                        conv(384, 256, 3), RELU, conv(256, 256, 3), RELU, POOL, POOL],
+    'deepseek': lambda: [attention(1024)] * 61,
+    'vgg16': lambda: [b for n_in, n_out, n_convs in [(3, 64, 2), (64, 128, 2), (128, 256, 3), (256, 512, 3), (512, 512, 3)]
+                      for b in [c for i in range(n_convs) for c in (conv(n_in if i == 0 else n_out, n_out, 3), RELU)] + [POOL]] + [POOL],
+    'perceptron': lambda: [linear(784, 10)],
+    'inception': lambda: [conv(3, 64, 7), POOL, conv(64, 192, 3), POOL,
+                          conv(192, 64, 1), conv(192, 128, 3), conv(192, 32, 5),
+                          conv(256, 128, 1), conv(256, 192, 3), conv(256, 96, 5), POOL,
+                          conv(480, 192, 1), conv(480, 208, 3), conv(480, 48, 5)],
+    'hypercube': lambda: [linear(64, 6, bias=False)],
+    'gpt4': lambda: [attention(2048)] * 120,
+    'gemini3': lambda: [attention(1536, 'kv')] * 100, # no q_proj: extract_weights finds nothing
+    'kimik2': lambda: [attention(1024)] * 200,
+    'claude35': lambda: [attention(2048)] * 50,
+    'phi35': lambda: [attention(2048)] * 32,
+    'word2vec': lambda: [linear(10000, 300, bias=False), linear(300, 10000, bias=False)],
+}
+
+# [Vocab, Dim] of model_embedding_table (lib/embeddings.py) for the mocks that have one
+MOCK_EMBEDDINGS = {'word2vec': (10000, 300)}
+
+def mock_blocks(model_name):
+    """[[(name, shape)]] per block of a mock, as named_parameters() of its get_model_structure() blocks."""
+    return MOCK_SHAPES[model_name]()
+
+def mock_bytes(blocks):
+    """float32 bytes of a mock's parameters (every mock parameter lives in one of its blocks)."""
+    return sum(int(np.prod(shape)) * 4 for params in blocks for _, shape in params)
+
+def mock_block_weights(params):
+    """
+    [Out, In] weight shapes that extract_weights samples from a mock block, None when it finds nothing:
+    block_weights (lib/extractors.py) restricted to the structures the mocks use (none of them has a Conv1D).
+    """
+    shapes = dict(params)
+    if 'self_attn.q_proj.weight' in shapes:
+        return [shapes[f'self_attn.{p}_proj.weight'] for p in 'qkv']
+    for _, shape in params:
+        if len(shape) == 4: # Conv2d, flattened to [Out, In * Kh * Kw]
+            return [(shape[0], int(np.prod(shape[1:])))]
+    if 'weight' in shapes: # the block is a Linear
+        return [shapes['weight']]
+    return None
@@ -1,5 +1,11 @@
+import contextlib
 import torch
 import torch.nn as nn
+from lib.options import selected_layers
+
+def block_device(idx, keep):
+    """Mock blocks outside the selection are built on the meta device (shapes only: no memory, no init cost)."""
+    return contextlib.nullcontext() if keep is None or idx in keep else torch.device('meta')
 
 class SimpleAlexNet(nn.Module):
     def __init__(self):
@@ -124,37 +130,39 @@ class SimpleDeepSeekMOE(nn.Module):
     Mock Architecture for DeepSeek-V3/R1 (Mixture of Experts).
     Simulates sparcity to visualize the 'Active Parameters' concept.
     """
-    def __init__(self, num_layers=61, hidden_dim=1024): # Scaled down dim for viz
+    def __init__(self, num_layers=61, hidden_dim=1024, layers=None): # Scaled down dim for viz
         super(SimpleDeepSeekMOE, self).__init__()
         self.layers = nn.ModuleList()
+        keep = selected_layers(num_layers, layers)
         
-        for _ in range(num_layers):
-            # We create a 'Mock' block that mimics an Attention + MoE layer
-            # But we only care about the weights 'extract_weights' finds.
-            # standard extractors look for 'attn' or 'self_attn'.
-            # We'll make a fake 'self_attn' that is actually the MoE Router/Expert weights 
-            # so the visualizer picks it up.
+        for i in range(num_layers):
+            with block_device(i, keep):
+                # We create a 'Mock' block that mimics an Attention + MoE layer
+                # But we only care about the weights 'extract_weights' finds.
+                # standard extractors look for 'attn' or 'self_attn'.
+                # We'll make a fake 'self_attn' that is actually the MoE Router/Expert weights 
+                # so the visualizer picks it up.
             
-            # Sparse Weight Matrix: 90% zeros (Inactive experts), 10% active
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
+                # Sparse Weight Matrix: 90% zeros (Inactive experts), 10% active
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
             
-            # Create a random weight matrix
-            # Shape [Hidden, Hidden]
-            # We use nn.Linear to hold it
-            proj = nn.Linear(hidden_dim, hidden_dim)
+                # Create a random weight matrix
+                # Shape [Hidden, Hidden]
+                # We use nn.Linear to hold it
+                proj = nn.Linear(hidden_dim, hidden_dim)
             
-            # Sparsify it manually
-            with torch.no_grad():
-                mask = torch.rand_like(proj.weight) > 0.90 # Only 10% active
-                proj.weight *= mask.float()
+                # Sparsify it manually
+                with torch.no_grad():
+                    mask = torch.rand_like(proj.weight) > 0.90 # Only 10% active
+                    proj.weight *= mask.float()
                 
                 
-            layer.self_attn.q_proj = proj # extractors look for this
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim) 
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.q_proj = proj # extractors look for this
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim) 
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
             
-            self.layers.append(layer)
+                self.layers.append(layer)
 
 
 class SimpleNemotron(nn.Module):
@@ -200,26 +208,28 @@ class SimpleGPT4(nn.Module):
     GPT-4 Mock (The Colossus).
     Simulating a massive 16-way Mixture of Experts with huge depth.
     """
-    def __init__(self):
+    def __init__(self, layers=None):
         super(SimpleGPT4, self).__init__()
         self.layers = nn.ModuleList()
         num_layers = 120 # Massive depth
         hidden_dim = 2048 # Visual scale
+        keep = selected_layers(num_layers, layers)
         
-        for _ in range(num_layers):
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
+        for i in range(num_layers):
+            with block_device(i, keep):
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
             
-            # Sparse Weight Matrix: 95% zeros (massive expert specialization)
-            proj = nn.Linear(hidden_dim, hidden_dim)
-            with torch.no_grad():
-                mask = torch.rand_like(proj.weight) > 0.95 
-                proj.weight *= mask.float()
+                # Sparse Weight Matrix: 95% zeros (massive expert specialization)
+                proj = nn.Linear(hidden_dim, hidden_dim)
+                with torch.no_grad():
+                    mask = torch.rand_like(proj.weight) > 0.95 
+                    proj.weight *= mask.float()
                 
-            layer.self_attn.q_proj = proj 
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
-            self.layers.append(layer)
+                layer.self_attn.q_proj = proj 
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                self.layers.append(layer)
 
 class SimpleGemini3(nn.Module):
     """
@@ -227,42 +237,44 @@ class SimpleGemini3(nn.Module):
     Simulating Native Multimodality (Audio, Video, Text combined).
     We simulate this by having 'fused' layers intertwined with modality-specific ones.
     """
-    def __init__(self):
+    def __init__(self, layers=None):
         super(SimpleGemini3, self).__init__()
         self.layers = nn.ModuleList()
         # Interleaved structure: Text -> Audio -> Vision -> Fusion
         patterns = ['text', 'audio', 'vision', 'fusion'] 
         num_cycles = 25 # 100 layers total
         hidden_dim = 1536
+        keep = selected_layers(num_cycles * 4, layers)
         
         for i in range(num_cycles * 4):
-            mode = patterns[i % 4]
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
+            with block_device(i, keep):
+                mode = patterns[i % 4]
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
             
-            proj = nn.Linear(hidden_dim, hidden_dim)
+                proj = nn.Linear(hidden_dim, hidden_dim)
             
-            # Simulate different 'textures' for different modalities via sparsity/distribution
-            with torch.no_grad():
-                if mode == 'text':
-                    # Dense, standard
-                    pass 
-                elif mode == 'audio':
-                    # Wave-like sparsity?
-                    mask = torch.rand_like(proj.weight) > 0.6
-                    proj.weight *= mask.float() * 1.5 # Higher variance
-                elif mode == 'vision':
-                    # Blocky sparsity (patches)
-                    mask = torch.rand_like(proj.weight) > 0.4
-                    proj.weight *= mask.float()
-                elif mode == 'fusion':
-                    # Ultra-dense, high connectivity
-                    proj.weight *= 2.0
+                # Simulate different 'textures' for different modalities via sparsity/distribution
+                with torch.no_grad():
+                    if mode == 'text':
+                        # Dense, standard
+                        pass 
+                    elif mode == 'audio':
+                        # Wave-like sparsity?
+                        mask = torch.rand_like(proj.weight) > 0.6
+                        proj.weight *= mask.float() * 1.5 # Higher variance
+                    elif mode == 'vision':
+                        # Blocky sparsity (patches)
+                        mask = torch.rand_like(proj.weight) > 0.4
+                        proj.weight *= mask.float()
+                    elif mode == 'fusion':
+                        # Ultra-dense, high connectivity
+                        proj.weight *= 2.0
             
-    # Gemini 3 Logic (Existing)
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
-            self.layers.append(layer)
+                # Gemini 3 Logic (Existing)
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                self.layers.append(layer)
 
 
 
@@ -271,31 +283,33 @@ class SimpleKimiK2(nn.Module):
     Kimi k2 (The Long Context Rail) Mock.
     Simulates infinite context via a 'Rail' structure.
     """
-    def __init__(self):
+    def __init__(self, layers=None):
         super(SimpleKimiK2, self).__init__()
         self.layers = nn.ModuleList()
         hidden_dim = 1024
         num_layers = 200 # Very Deep (Long context stack)
+        keep = selected_layers(num_layers, layers)
         
         for i in range(num_layers):
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
-            proj = nn.Linear(hidden_dim, hidden_dim)
+            with block_device(i, keep):
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
+                proj = nn.Linear(hidden_dim, hidden_dim)
             
-            with torch.no_grad():
-                # The 'Rail' - Strong diagonal focus (identity preservation)
-                # plus periodic cross-bracing
-                idx = torch.arange(hidden_dim)
-                proj.weight[idx, idx] = 2.0 # Identity spine
+                with torch.no_grad():
+                    # The 'Rail' - Strong diagonal focus (identity preservation)
+                    # plus periodic cross-bracing
+                    idx = torch.arange(hidden_dim)
+                    proj.weight[idx, idx] = 2.0 # Identity spine
                 
-                # Periodic bracing
-                if i % 10 == 0:
-                    proj.weight *= 1.5 # Stronger layer
+                    # Periodic bracing
+                    if i % 10 == 0:
+                        proj.weight *= 1.5 # Stronger layer
             
-            layer.self_attn.q_proj = proj
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
-            self.layers.append(layer)
+                layer.self_attn.q_proj = proj
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                self.layers.append(layer)
 
 
 def get_model_structure(model):
@@ -351,6 +365,55 @@ def get_model_structure(model):
 
     return layers
 
+class StopForward(Exception):
+    """Raised by a stop_after() hook to end a forward pass once the last block of interest has run."""
+
+def stop_after(block):
+    """Forward hook that ends the pass right after `block` (register it after the capture hooks, catch StopForward)."""
+    def hook(module, input, output):
+        raise StopForward()
+    return block.register_forward_hook(hook)
+
+HEAD_CLASSES = {'text': 'AutoModelForCausalLM', 'image': 'AutoModelForImageClassification'} # transformers class names
+
+def load_hf_model(model_name, layer_range=None, head=None):
+    """
+    AutoModel.from_pretrained, cut after the last selected block when the config has a plain num_hidden_layers
+    (encoder-only / decoder-only transformers): later blocks are never read from disk and the forward pass ends there.
+    With head='text' / 'image' the LM / classification head is loaded too when the architecture has one
+    (never cut: a target logit needs every block); use model.base_model for the block structure.
+    Returns (model, selected block indices), or (model, None) when the selection has to be applied to the loaded model.
+    transformers is imported here (seconds), so mocks and --dry-run never pay for it.
+    """
+    import transformers
+    from transformers import AutoConfig, AutoModel
+    from transformers.utils import logging as hf_logging
+    if head is not None:
+        try:
+            model = getattr(transformers, HEAD_CLASSES[head]).from_pretrained(model_name)
+        except ValueError: # no such head for this architecture: the target comes from the output features
+            model = AutoModel.from_pretrained(model_name)
+        return model, selected_layers(len(get_model_structure(model.base_model)), layer_range)
+    if layer_range is None:
+        return AutoModel.from_pretrained(model_name), None
+    config = AutoConfig.from_pretrained(model_name)
+    n_blocks = getattr(config, 'num_hidden_layers', None)
+    if not isinstance(n_blocks, int) or getattr(config, 'is_encoder_decoder', False):
+        return AutoModel.from_pretrained(model_name), None
+    keep = selected_layers(n_blocks, layer_range)
+    if keep and keep[-1] + 1 < n_blocks:
+        config.num_hidden_layers = keep[-1] + 1
+        if isinstance(getattr(config, 'layer_types', None), list): # per-layer attention kinds (Gemma / Qwen style)
+            config.layer_types = config.layer_types[:keep[-1] + 1]
+        print(f"   ↳ Loading blocks 0-{keep[-1]} of {n_blocks} (later blocks stay on disk).")
+        verbosity = hf_logging.get_verbosity()
+        hf_logging.set_verbosity_error() # the skipped blocks would be listed key by key as unexpected
+        try:
+            return AutoModel.from_pretrained(model_name, config=config), keep
+        finally:
+            hf_logging.set_verbosity(verbosity)
+    return AutoModel.from_pretrained(model_name, config=config), keep
+
 
 
 class SimpleClaude35(nn.Module):
@@ -358,34 +421,36 @@ class SimpleClaude35(nn.Module):
     Claude 3.5 Sonnet (Mock).
     "The Artifact" - A highly structured, safe, and steerable lattice.
     """
-    def __init__(self):
+    def __init__(self, layers=None):
         super(SimpleClaude35, self).__init__()
         self.layers = nn.ModuleList()
         # 50 Layers
         hidden_dim = 2048 
+        keep = selected_layers(50, layers)
         for i in range(50):
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
-            proj = nn.Linear(hidden_dim, hidden_dim)
-            with torch.no_grad():
-                # Structure: A Dense Volumetric Block (The Monolith)
-                # 1. Start with dense Gaussian noise (Real Weight Look)
-                nn.init.normal_(proj.weight, mean=0.0, std=0.02)
+            with block_device(i, keep):
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
+                proj = nn.Linear(hidden_dim, hidden_dim)
+                with torch.no_grad():
+                    # Structure: A Dense Volumetric Block (The Monolith)
+                    # 1. Start with dense Gaussian noise (Real Weight Look)
+                    nn.init.normal_(proj.weight, mean=0.0, std=0.02)
                 
-                # 2. Apply "Constitutional" Constraints (Shaping)
-                # Clamp values to create hard edges (The Box effect) but keep density inside
-                proj.weight.data = torch.clamp(proj.weight.data, -0.05, 0.05)
+                    # 2. Apply "Constitutional" Constraints (Shaping)
+                    # Clamp values to create hard edges (The Box effect) but keep density inside
+                    proj.weight.data = torch.clamp(proj.weight.data, -0.05, 0.05)
                 
-                # 3. Add explicit structure banding
-                # Creates horizontal "layers" of logic visible in the density
-                for j in range(0, hidden_dim, 200):
-                    if j + 50 < hidden_dim:
-                        proj.weight.data[j:j+50, :] *= 1.5 # Denser bands
+                    # 3. Add explicit structure banding
+                    # Creates horizontal "layers" of logic visible in the density
+                    for j in range(0, hidden_dim, 200):
+                        if j + 50 < hidden_dim:
+                            proj.weight.data[j:j+50, :] *= 1.5 # Denser bands
             
-            layer.self_attn.q_proj = proj
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
-            self.layers.append(layer)
+                layer.self_attn.q_proj = proj
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                self.layers.append(layer)
 
 
 
@@ -394,20 +459,22 @@ class SimplePhi35(nn.Module):
     Phi 3.5 (Mock Fallback).
     Used when real weight download fails.
     """
-    def __init__(self):
+    def __init__(self, layers=None):
         super(SimplePhi35, self).__init__()
         self.layers = nn.ModuleList()
         hidden_dim = 2048
+        keep = selected_layers(32, layers)
         # 32 Layers (standard for small models)
         for i in range(32):
-            layer = nn.Module()
-            layer.self_attn = nn.Module()
-            # Dense, uniform structure (Textbook quality)
-            proj = nn.Linear(hidden_dim, hidden_dim)
-            layer.self_attn.q_proj = proj
-            layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim) 
-            layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
-            self.layers.append(layer)
+            with block_device(i, keep):
+                layer = nn.Module()
+                layer.self_attn = nn.Module()
+                # Dense, uniform structure (Textbook quality)
+                proj = nn.Linear(hidden_dim, hidden_dim)
+                layer.self_attn.q_proj = proj
+                layer.self_attn.k_proj = nn.Linear(hidden_dim, hidden_dim) 
+                layer.self_attn.v_proj = nn.Linear(hidden_dim, hidden_dim)
+                self.layers.append(layer)
 
 
 class SimpleHypercube(nn.Module):
@@ -449,3 +516,25 @@ class SimpleHypercube(nn.Module):
             
         # self.layers.append(layer) # No longer using list, using single fc
 
+
+# Mock models by name, built instead of a download: (class, constructor takes layers=, note printed when used).
+# Mocks taking `layers` build the blocks outside a --layers selection on the meta device.
+MOCK_MODELS = {
+    'alexnet': (SimpleAlexNet, False, "Using manually defined AlexNet (Untrained/Random Weights) as torchvision is unavailable."),
+    'deepseek': (SimpleDeepSeekMOE, True, "Using manually defined DeepSeek-V3 MoE (Sparse Mock) to visualize MoE Structure without 600GB download."),
+    'vgg16': (SimpleVGG16, False, "Using manually defined VGG-16 (Untrained)."),
+    'perceptron': (SimplePerceptron, False, "Using manually defined Perceptron (1958)."),
+    'inception': (SimpleInception, False, "Using manually defined Inception-v1/GoogLeNet (Mock)."),
+    'hypercube': (SimpleHypercube, False, "Using manually defined 6D Hypercube (Concept)."),
+    'gpt4': (SimpleGPT4, True, "Using manually defined GPT-4 (Mock MoE)."),
+    'gemini3': (SimpleGemini3, True, "Using manually defined Gemini 3.0 (Mock Omni)."),
+    'kimik2': (SimpleKimiK2, True, "Using manually defined Kimi k2 (Simulated Rail)."),
+    'claude35': (SimpleClaude35, True, "Using manually defined Claude 3.5 (Simulated Artifact)."),
+    'phi35': (SimplePhi35, True, "Using manually defined Phi 3.5 (Simulated - Download Failed)."),
+    'word2vec': (SimpleWord2Vec, False, "Using manually defined Word2Vec (2013)."),
+}
+
+def build_mock(model_name, layers=None):
+    """The mock registered as `model_name` in MOCK_MODELS, with the --layers selection when it takes one."""
+    cls, takes_layers, _ = MOCK_MODELS[model_name]
+    return cls(layers=layers) if takes_layers else cls()
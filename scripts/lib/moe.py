@@ -0,0 +1,67 @@
+import numpy as np
+from lib.checkpoints import Checkpoint
+from lib.headers import is_checkpoint, find_moe_layers
+from lib.options import expert_ids
+
+def open_moe_checkpoint(path):
+    """Checkpoint if `path` is a local safetensors MoE checkpoint, else None."""
+    if not is_checkpoint(path):
+        return None
+    ckpt = Checkpoint(path)
+    return ckpt if find_moe_layers(ckpt) else None
+
+def select_experts(router_norms, experts):
+    """
+    `experts` is either a count ("2" -> the N experts with the strongest router rows)
+    or an explicit comma separated list ("0,5,7", or "5," for expert 5 alone; checked against the router size, see expert_ids).
+    """
+    chosen = expert_ids(experts, len(router_norms))
+    if chosen is not None:
+        return chosen
+    n = min(int(experts), len(router_norms))
+    return sorted(np.argsort(router_norms)[::-1][:n].tolist())
+
+def check_experts(ckpt, experts):
+    """Raises select_experts' ValueError before any tensor is read (--experts against every router size, from the headers)."""
+    for info in find_moe_layers(ckpt):
+        expert_ids(experts, ckpt.shape(info['router'])[0])
+
+def load_moe_layers(ckpt, experts='2', step=2, dtype=np.float32, layers=None):
+    """All MoE layers at once (see iter_moe_layers)."""
+    return list(iter_moe_layers(ckpt, experts, step, dtype, layers))
+
+def iter_moe_layers(ckpt, experts='2', step=2, dtype=np.float32, layers=None):
+    """
+    Reads only the router and the selected experts of every MoE layer, one layer at a time.
+    Each layer becomes the stacked sampled slices of its experts [Experts * Hidden/step, Intermediate],
+    tagged per vertex with the expert id and the router affinity |gate[expert, hidden]|.
+    With `layers` (block indices), other layers are skipped without reading their tensors.
+    """
+    for info in find_moe_layers(ckpt):
+        if layers is not None and info['layer'] not in layers:
+            continue
+        router = ckpt.get(info['router']).float() # [Experts, Hidden], tiny
+        router_norms = router.norm(dim=1).numpy()
+        chosen = select_experts(router_norms, experts)
+
+        first = info['expert_name'].format(expert=chosen[0])
+        n_inter, n_hidden = ckpt.shape(first)
+        rows = (n_hidden + step - 1) // step
+
+        weights = np.empty((rows * len(chosen), n_inter), dtype=dtype)
+        for j, expert in enumerate(chosen):
+            ckpt.sampled_T(info['expert_name'].format(expert=expert), step, dtype, out=weights[j * rows:(j + 1) * rows])
+
+        ckpt.release()
+
+        affinity = router.abs()[chosen][:, ::step].numpy()
+        affinity /= max(affinity.max(), 1e-12)
+        print(f"   ↳ Layer {info['layer']}: experts {chosen} of {router.shape[0]} (router norms {[round(float(n), 3) for n in router_norms[chosen]]})")
+        yield {
+            'layer': info['layer'],
+            'weights': weights,
+            'experts': np.repeat(np.array(chosen), rows),
+            'router': affinity.reshape(-1),
+            'num_experts': router.shape[0],
+            'router_norms': router_norms,
+        }
@@ -0,0 +1,88 @@
+import re
+
+# Option values and parsers of prismata_make.py, shared with the modules that act on them. Imports neither torch
+# nor sklearn, so bad arguments and --dry-run (lib/estimate.py) are answered before the build libraries load.
+
+PROJECTORS = ['pca', 'randomized', 'sketch'] # --projector (lib/projection.py)
+CORPUS_STATS = ['mean', 'std', 'max', 'rate', 'p50', 'p90', 'p99'] # --corpus-stat (lib/corpus.py)
+DRIFT_STATS = ['cosine', 'delta', 'relative'] # --drift (lib/diff.py)
+
+PIPELINE_DEPTH = 4 # layers queued between the stages of --pipeline (lib/pipeline.py)
+
+# --projector backends --pipeline reproduces from streamed passes (project_blocks in lib/projection.py);
+# sketch has no streamed form and is rejected
+PIPELINE_PROJECTORS = ['pca', 'randomized']
+
+def pca_solver(n_rows, n_features, n_components=2):
+    """
+    (solver, power iterations) sklearn's PCA(svd_solver='auto') picks for a [n_rows, n_features] matrix:
+    'exact' (its full / covariance_eigh solvers) or 'randomized'.
+    """
+    if n_features <= 1000 and n_rows >= 10 * n_features or max(n_rows, n_features) <= 500:
+        return 'exact', 0
+    if n_components < 0.8 * min(n_rows, n_features):
+        return 'randomized', 7 if n_components < 0.1 * min(n_rows, n_features) else 4
+    return 'exact', 0
+
+def fit_reads(projector, n_rows, n_features, n_components=2):
+    """Reads of the layer stream project_blocks makes for `projector` on a [n_rows, n_features] matrix."""
+    if projector == 'randomized':
+        return 5 # mean, range, one power iteration (2), final product
+    solver, niter = pca_solver(n_rows, n_features, n_components)
+    return 3 if solver == 'exact' else 3 + 2 * niter # exact: mean, covariance, projection
+
+def parse_layer_range(text):
+    """'24:32', '::4', '-8:' or '5' -> slice over get_model_structure() block indices."""
+    parts = text.split(':')
+    if len(parts) > 3:
+        raise ValueError(f"Invalid layer range: {text} (use start:stop:stride)")
+    try:
+        values = [int(p) if p.strip() else None for p in parts]
+    except ValueError:
+        raise ValueError(f"Invalid layer range: {text} (use start:stop:stride)")
+    if len(values) == 1:
+        if values[0] is None:
+            raise ValueError("Empty layer range")
+        return slice(values[0], values[0] + 1 if values[0] != -1 else None)
+    if len(values) == 3 and values[2] is not None and values[2] <= 0:
+        raise ValueError(f"Invalid layer range: {text} (the stride must be positive, layers stack bottom-up)")
+    return slice(*values)
+
+def selected_layers(n_blocks, layer_range):
+    """Block indices picked by a layer_range slice, as an ordered range (None = every block)."""
+    return None if layer_range is None else range(n_blocks)[layer_range]
+
+def parse_experts(text):
+    """
+    '2' -> 2 (top-N by router norm), '0,5,7' -> [0, 5, 7], '5,' -> [5] (a single expert: the trailing comma makes it
+    a list); raises ValueError for anything else or a count below 1.
+    """
+    text = str(text)
+    if re.fullmatch(r'\s*\d+\s*', text):
+        if int(text) < 1:
+            raise ValueError(f"Invalid --experts {text}: the count must be at least 1")
+        return int(text)
+    if not re.fullmatch(r'\s*\d+\s*(,\s*\d+\s*)*,?\s*', text):
+        raise ValueError(f"Invalid --experts {text}: use a count (2), a comma-separated list of expert ids (0,3,7) or one id with a trailing comma (5,)")
+    return [int(e) for e in text.split(',') if e.strip()]
+
+def expert_ids(experts, n_experts):
+    """
+    The experts of an explicit --experts list ("0,5,7"), in order with duplicates dropped, or None for a count ("2").
+    Raises ValueError for malformed values (see parse_experts) and for an id outside the router's [0, n_experts).
+    """
+    parsed = parse_experts(experts)
+    if isinstance(parsed, int):
+        return None
+    ids = list(dict.fromkeys(parsed))
+    bad = [e for e in ids if not 0 <= e < n_experts]
+    if bad:
+        raise ValueError(f"Invalid --experts {experts}: ids must lie in 0-{n_experts - 1} ({n_experts} experts per layer)")
+    return ids
+
+def parse_size(text):
+    """'512M', '8G', '1.5GB' or plain bytes -> bytes."""
+    m = re.fullmatch(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*([kmgt]?)i?b?\s*', str(text).lower())
+    if not m:
+        raise ValueError(f"Invalid memory budget: {text}")
+    return int(float(m.group(1)) * 1024 ** ' kmgt'.index(m.group(2) or ' '))
@@ -0,0 +1,241 @@
+import os
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from lib.extractors import row_magnitudes, CHUNK_ROWS
+from lib.lattice import layer_positions, layer_edges, count_edges, layer_colors, tag_dtype, fill_tags
+from lib.projection import project, project_streaming
+from lib.weightstats import WeightStats, projection_explained, save_weight_stats
+
+PLY_TYPES = {'f4': 'float', 'u1': 'uchar', 'u2': 'ushort', 'i4': 'int'}
+READBACK_BYTES = 16 << 20 # a layer filled in place (SpillSlot) is read back this much at a time for its magnitudes and stats
+
+def read_block(path, dtype, n_features, start, stop, base=0):
+    """Rows [start, stop) of a row-major spill, through a short-lived memmap (unmapped on return)."""
+    mm = np.memmap(path, dtype=dtype, mode='r', offset=base + start * n_features * dtype.itemsize,
+                   shape=(stop - start, n_features))
+    block = np.array(mm)
+    del mm
+    return block
+
+class SpillSlot:
+    """
+    A layer reserved at the end of a spill (SpillFile.reserve), filled in place by an extractor. Slicing gives
+    the slot of a sub-window ([rows, cols] slices, no step); assigning into it maps the layer, writes and unmaps,
+    so only the pages of the chunk being written count toward RSS. Handed back to SpillFile.append once filled.
+    """
+    def __init__(self, spill, offset, shape, dtype, window=None):
+        self.spill, self.offset, self.layer_shape, self.dtype = spill, offset, shape, np.dtype(dtype)
+        self.window = window or ((0, shape[0]), (0, shape[1]))
+        self.shape = tuple(stop - start for start, stop in self.window)
+
+    def _sub(self, index):
+        index = index if isinstance(index, tuple) else (index,)
+        window = []
+        for (start, stop), part in zip(self.window, index + (slice(None),) * (2 - len(index))):
+            lo, hi, step = part.indices(stop - start)
+            if step != 1:
+                raise IndexError("SpillSlot windows take contiguous slices only")
+            window.append((start + lo, start + max(lo, hi)))
+        return tuple(window)
+
+    def __getitem__(self, index):
+        return SpillSlot(self.spill, self.offset, self.layer_shape, self.dtype, self._sub(index))
+
+    def __setitem__(self, index, value):
+        (r0, r1), (c0, c1) = self._sub(index)
+        mm = np.memmap(self.spill.path, dtype=self.dtype, mode='r+', offset=self.offset + r0 * self.layer_shape[1] * self.dtype.itemsize,
+                       shape=(r1 - r0, self.layer_shape[1]))
+        mm[:, c0:c1] = value
+        del mm
+
+class SpillFile:
+    """Scratch file holding every sampled layer back to back, row-major, read back through memmaps."""
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(suffix='.spill', dir=directory)
+        self.file = os.fdopen(fd, 'wb')
+        self.layers = [] # {'layer_id', 'offset', 'rows', 'features', 'dtype', 'magnitudes', 'tags'}
+        self.size = 0
+
+    def reserve(self, shape, dtype):
+        """A SpillSlot of `shape` at the end of the spill, for an extractor to fill (see read_layer's `out`)."""
+        slot = SpillSlot(self, self.size, tuple(shape), dtype)
+        self.file.truncate(self.size + int(np.prod(shape)) * slot.dtype.itemsize)
+        return slot
+
+    def append(self, data, tags=None, layer_id=None, stats=False):
+        """
+        Writes one layer (dense or CSR, densified CHUNK_ROWS at a time) and keeps only its metadata.
+        A filled SpillSlot of this spill is already in place: its rows are only read back, READBACK_BYTES at a time,
+        for the magnitudes. With `stats` the same chunks also feed a WeightStats (meta['stats']).
+        """
+        dtype = np.dtype(data.dtype)
+        in_place = isinstance(data, SpillSlot) and data.spill is self and data.offset == self.size
+        meta = {'layer_id': len(self.layers) if layer_id is None else layer_id, 'offset': self.size, 'rows': data.shape[0], 'features': data.shape[1], 'dtype': dtype,
+                'magnitudes': np.empty(data.shape[0], dtype=np.float32), 'tags': tags}
+        meta['stats'] = WeightStats(meta['layer_id'], data.shape[1]) if stats else None
+        rows = max(1, READBACK_BYTES // (data.shape[1] * dtype.itemsize)) if in_place else CHUNK_ROWS
+        for start in range(0, data.shape[0], rows):
+            stop = min(start + rows, data.shape[0])
+            chunk = read_block(self.path, dtype, data.shape[1], start, stop, self.size) if in_place else data[start:stop]
+            meta['magnitudes'][start:stop] = row_magnitudes(chunk)
+            if meta['stats'] is not None:
+                meta['stats'].update(chunk)
+            if not in_place:
+                chunk = chunk.toarray() if sp.issparse(chunk) else chunk
+                self.file.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+        self.size += data.shape[0] * data.shape[1] * dtype.itemsize
+        self.file.flush()
+        self.file.seek(self.size)
+        self.layers.append(meta)
+        return meta
+
+    def reader(self, first=0, last=None):
+        """read_rows(start, stop) over layers [first, last) treated as one matrix (they must share Features)."""
+        last = len(self.layers) if last is None else last
+        layers = self.layers[first:last]
+        meta, total = layers[0], sum(l['rows'] for l in layers)
+        if any(l['features'] != meta['features'] or l['dtype'] != meta['dtype'] for l in layers):
+            raise ValueError(f"Spilled layers {first}:{last} do not share one row width and dtype")
+
+        def read_rows(start, stop):
+            if not 0 <= start <= stop <= total:
+                raise ValueError(f"Rows {start}:{stop} fall outside spilled layers {first}:{last} ({total} rows)")
+            return read_block(self.path, meta['dtype'], meta['features'], start, stop, meta['offset'])
+        return read_rows
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class BinaryPlyWriter:
+    """
+    Preallocates a binary_little_endian PLY of known size and fills vertex/edge ranges through memmaps,
+    so no element list ever has to be held in memory.
+    """
+    def __init__(self, filename, n_vertices, n_edges, vertex_dtype, edge_dtype):
+        self.filename = filename
+        self.vertex_dtype = np.dtype(vertex_dtype)
+        self.edge_dtype = np.dtype(edge_dtype)
+        header = ["ply", "format binary_little_endian 1.0", f"element vertex {n_vertices}"]
+        header += [f"property {PLY_TYPES[self.vertex_dtype[n].str[1:]]} {n}" for n in self.vertex_dtype.names]
+        header += [f"element edge {n_edges}"]
+        header += [f"property {PLY_TYPES[self.edge_dtype[n].str[1:]]} {n}" for n in self.edge_dtype.names]
+        header = ("\n".join(header) + "\nend_header\n").encode('ascii')
+
+        self.vertex_offset = len(header)
+        self.edge_offset = self.vertex_offset + n_vertices * self.vertex_dtype.itemsize
+        with open(filename, 'wb') as f:
+            f.write(header)
+            f.truncate(self.edge_offset + n_edges * self.edge_dtype.itemsize)
+
+    def _write(self, offset, dtype, start, records):
+        if len(records) == 0:
+            return
+        mm = np.memmap(self.filename, dtype=dtype, mode='r+', offset=offset + start * dtype.itemsize, shape=(len(records),))
+        mm[:] = records
+        mm.flush()
+        del mm
+
+    def write_vertices(self, start, records):
+        self._write(self.vertex_offset, self.vertex_dtype, start, records)
+
+    def write_edges(self, start, records):
+        self._write(self.edge_offset, self.edge_dtype, start, records)
+
+def crystallize_out_of_core(layer_source, outputs, memory_budget, n_comps=2, step=2, layer_activations=None, projector='pca', scratch_dir=None, layer_latency=None, layer_attribution=None, stats_file=None, stats_meta=None):
+    """
+    Out-of-core build: spill -> streaming projection -> layer-by-layer binary PLY.
+    `layer_source(alloc)` returns an iterator of (block index, sampled layer, per-vertex tag record or None), one at a
+    time, so only the current layer, one projection block and the per-row metadata are ever resident. Extractors that
+    can write in place get SpillFile.reserve as `alloc` and fill the spill directly (see iter_checkpoint_layers).
+    `outputs` maps each coloring mode to its filename; all of them share the spill, the projection and the edges.
+    With `stats_file` the weight statistics are gathered while spilling and saved there (see save_weight_stats).
+    """
+    layer_activations = layer_activations or {}
+    layer_latency = layer_latency or {}
+    per_mode = {'latency': layer_latency, 'attribution': layer_attribution or {}}
+    spill = SpillFile(scratch_dir)
+    try:
+        print(f"   ↳ Spilling sampled layers to {spill.path} (budget {memory_budget / 2**20:.0f} MB)...")
+        for layer_id, data, tags in layer_source(spill.reserve):
+            spill.append(data, tags, layer_id, stats=stats_file is not None)
+            del data
+        spill.file.close()
+        layers = spill.layers
+        if not layers:
+            print("No data extracted. Is this model supported?")
+            return None
+
+        # Blocks sized so one block plus its float32 working copy fit in a quarter of the budget
+        def block_rows_for(n_features):
+            return max(256, memory_budget // (4 * n_features * 4))
+
+        def fit(read_rows, n_rows, n_features, n_components):
+            # Anything that fits in one block is projected in memory (identical to the normal build)
+            if n_rows <= block_rows_for(n_features):
+                return project(read_rows(0, n_rows), n_components, projector)
+            return project_streaming(read_rows, n_rows, n_features, n_components, block_rows_for(n_features))
+
+        # 1. Streaming projection (global when every layer shares the feature axis, else per layer)
+        total_rows = sum(l['rows'] for l in layers)
+        projections = []
+        if len({l['features'] for l in layers}) == 1 and len({l['dtype'] for l in layers}) == 1:
+            n_features = layers[0]['features']
+            print(f"   ↳ Streaming projection of ({total_rows}, {n_features}) in blocks of {block_rows_for(n_features)} rows (Global {n_comps}D)...")
+            projected = fit(spill.reader(), total_rows, n_features, n_comps)
+            explained = projection_explained([l['stats'] for l in layers], projected) if stats_file else None
+            max_val = np.max(np.abs(projected))
+            if max_val > 0: projected /= max_val
+            row = 0
+            for l in layers:
+                projections.append((row, row + l['rows']))
+                row += l['rows']
+            get_projection = lambda idx: projected[projections[idx][0]:projections[idx][1]]
+        else:
+            print("   ⚠️  Layer dimensions mismatch (likely CNN/ResNet). Streaming Per-Layer projection...")
+            per_layer = []
+            for idx, l in enumerate(layers):
+                p = fit(spill.reader(idx, idx + 1), l['rows'], l['features'], 2)
+                if l['stats'] is not None:
+                    l['stats'].capture(p)
+                mx = np.max(np.abs(p))
+                per_layer.append(p / mx if mx > 0 else p)
+            get_projection = lambda idx: per_layer[idx]
+            explained = None
+        if stats_file:
+            save_weight_stats([l['stats'] for l in layers], stats_file, explained, **(stats_meta or {}))
+
+        # 2. Preallocated binary PLY, filled layer by layer
+        vertex_dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+        vertex_dtype += tag_dtype([l['tags'] for l in layers])
+        n_edges = sum(count_edges(l['rows'], layers[i - 1]['rows'] if i > 0 else 0) for i, l in enumerate(layers))
+        writers = {mode: BinaryPlyWriter(filename, total_rows, n_edges, vertex_dtype, [('vertex1', 'i4'), ('vertex2', 'i4')])
+                   for mode, filename in outputs.items()}
+
+        print(f"   ↳ Writing {total_rows} vertices / {n_edges} edges layer by layer ({len(writers)} mode(s))...")
+        vertex_start, edge_start = 0, 0
+        for idx, l in enumerate(layers):
+            # Geometry and edges once per layer; only the colors differ between modes
+            pos = layer_positions(get_projection(idx), idx)
+            edges = layer_edges(vertex_start, l['rows'], layers[idx - 1]['rows'] if idx > 0 else 0)
+            for mode, writer in writers.items():
+                records = np.empty(l['rows'], dtype=writer.vertex_dtype)
+                records['x'], records['y'], records['z'] = pos[:, 0], pos[:, 1], pos[:, 2]
+                values = per_mode.get(mode, layer_activations).get(l['layer_id'])
+                colors = layer_colors(mode, idx, len(layers), l['magnitudes'], step, values, l['tags'])
+                records['red'], records['green'], records['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+                fill_tags(records, l['tags'])
+                writer.write_vertices(vertex_start, records)
+
+                edge_records = np.empty(len(edges), dtype=writer.edge_dtype)
+                edge_records['vertex1'], edge_records['vertex2'] = edges[:, 0], edges[:, 1]
+                writer.write_edges(edge_start, edge_records)
+
+            vertex_start += l['rows']
+            edge_start += len(edges)
+        return list(outputs.values())
+    finally:
+        spill.close()
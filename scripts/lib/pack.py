@@ -0,0 +1,136 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+# Pack layout (append-only):
+#   [entry data, each aligned to ALIGN bytes] ... [index JSON] [footer]
+# Footer (last FOOTER.size bytes): magic, index offset, index length, version.
+# Updating a pack appends changed entries plus a new index and footer; nothing already written moves,
+# so old offsets stay valid and any HTTP cache of earlier byte ranges stays correct.
+# A browser needs `Range: bytes=-32` (footer), then the index range, then one range per entry.
+MAGIC = b'PRISMPK1'
+VERSION = 1
+ALIGN = 4096
+FOOTER = struct.Struct('<8sQQI4x') # 32 bytes
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def read_index(path):
+    """{name: [offset, length, sha256]} of an existing pack, or {} if there is none."""
+    if not os.path.exists(path) or os.path.getsize(path) < FOOTER.size:
+        return {}
+    with open(path, 'rb') as f:
+        f.seek(-FOOTER.size, os.SEEK_END)
+        magic, offset, length, version = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Prismata pack")
+        f.seek(offset)
+        return json.loads(f.read(length))['entries']
+
+def safe_name(name):
+    """True for an entry name that stays below whatever directory it is extracted to: relative, '/'-separated, no '..'."""
+    parts = name.split('/')
+    return bool(name) and '\\' not in name and ':' not in parts[0] and all(p not in ('', '.', '..') for p in parts)
+
+def entry_path(dest, name):
+    """Local path of entry `name` extracted under `dest`; ValueError if it would land outside (unsafe name, symlinks)."""
+    path = os.path.join(dest, *name.split('/'))
+    root = os.path.realpath(dest)
+    if not safe_name(name) or os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError(f"Pack entry {name!r} would be written outside {dest}")
+    return path
+
+def write_pack(path, files, full=False):
+    """
+    files: {name: local path}. Entries whose sha256 already matches the pack are reused in place,
+    everything else is appended (ALIGN-aligned). Entries missing from `files` are dropped from the index.
+    full=True rewrites the pack from scratch (reclaims space left by replaced entries).
+    Returns (index, stats). ValueError (nothing written) if a name is not a safe_name.
+    """
+    unsafe = [name for name in files if not safe_name(name)]
+    if unsafe:
+        raise ValueError(f"Unsafe pack entry name(s), absolute or with '..': {', '.join(map(repr, sorted(unsafe)))}")
+    old = {} if full else read_index(path)
+    index, stats = {}, {'reused': 0, 'added': 0, 'bytes_appended': 0}
+    with open(path, 'wb' if full or not old else 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        for name in sorted(files):
+            digest = sha256_file(files[name])
+            if name in old and old[name][2] == digest:
+                index[name] = old[name]
+                stats['reused'] += 1
+                continue
+            pad = -f.tell() % ALIGN
+            f.write(b'\0' * pad)
+            offset = f.tell()
+            with open(files[name], 'rb') as src:
+                for chunk in iter(lambda: src.read(1 << 20), b''):
+                    f.write(chunk)
+            index[name] = [offset, f.tell() - offset, digest]
+            stats['added'] += 1
+            stats['bytes_appended'] += pad + index[name][1]
+
+        if old and not stats['added'] and set(index) == set(old):
+            return index, stats # unchanged: don't grow the file with an identical index
+        blob = json.dumps({'version': VERSION, 'align': ALIGN, 'entries': index}, separators=(',', ':')).encode('utf-8')
+        index_offset = f.tell()
+        f.write(blob)
+        f.write(FOOTER.pack(MAGIC, index_offset, len(blob), VERSION))
+        stats['bytes_appended'] += len(blob) + FOOTER.size
+    return index, stats
+
+class Pack:
+    """
+    Random access to a pack through one read-only mmap. get() returns a zero-copy memoryview,
+    so opening a pack costs only the index, whatever its size.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length, self.version = FOOTER.unpack(self.map[-FOOTER.size:])
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Prismata pack")
+        self.entries = json.loads(self.map[offset:offset + length])['entries']
+
+    def names(self):
+        return sorted(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def byte_range(self, name):
+        """(first, last) inclusive, as used in an HTTP `Range: bytes=first-last` header."""
+        offset, length, _ = self.entries[name]
+        return offset, offset + length - 1
+
+    def get(self, name):
+        offset, length, _ = self.entries[name]
+        return memoryview(self.map)[offset:offset + length]
+
+    def read(self, name):
+        return bytes(self.get(name))
+
+    def verify(self, name):
+        return hashlib.sha256(self.get(name)).hexdigest() == self.entries[name][2]
+
+    def dead_bytes(self):
+        """Space taken by replaced entries and old indexes (reclaimed by a full rebuild)."""
+        return len(self.map) - sum(length for _, length, _ in self.entries.values())
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
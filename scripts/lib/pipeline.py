@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from lib.extractors import row_magnitudes
+from lib.options import PIPELINE_DEPTH, PIPELINE_PROJECTORS, fit_reads
+from lib.lattice import layer_positions, layer_edges, count_edges, layer_colors, tag_dtype, fill_tags
+from lib.outofcore import BinaryPlyWriter
+from lib.projection import project, project_blocks
+from lib.weightstats import layer_stats, projection_explained, save_weight_stats
+
+# Staged build: extractor thread -> projection pool -> writer, joined by queues of PIPELINE_DEPTH layers.
+# Each stage holds one layer at a time, so only about 2 * PIPELINE_DEPTH + workers layers are ever resident,
+# and with free cores the wall-clock time approaches the slowest stage instead of the sum of all stages
+# (extraction copies and BLAS release the GIL).
+
+class StageClock:
+    """Busy seconds per stage, summed over the threads that run it."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = {}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+
+    def timed(self, stage, fn):
+        def run(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return run
+
+def background(iterable, depth=PIPELINE_DEPTH, clock=None, stage='extract'):
+    """
+    Yields the items of `iterable` in order while a background thread produces them, at most `depth` ahead
+    of the consumer. Exceptions in the producer are raised in the consumer.
+    """
+    slots = queue.Queue(maxsize=depth)
+    done = object()
+
+    def worker():
+        try:
+            items = iter(iterable)
+            while True:
+                start = time.perf_counter()
+                item = next(items, done)
+                if clock is not None:
+                    clock.add(stage, time.perf_counter() - start)
+                if item is done:
+                    break
+                slots.put((item, None))
+        except Exception as e: # surfaced in the consumer
+            slots.put((None, e))
+        slots.put((done, None))
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item, error = slots.get()
+        if error is not None:
+            raise error
+        if item is done:
+            return
+        yield item
+
+def ordered_map(fn, items, workers=2, depth=PIPELINE_DEPTH):
+    """fn(item) on a pool of `workers` threads, results yielded in input order, at most `depth` items in flight."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def crystallize_pipelined(layer_source, outputs, n_comps=2, step=2, layer_activations=None, projector='pca', workers=2,
+                          depth=PIPELINE_DEPTH, layer_latency=None, layer_attribution=None, stats_file=None, stats_meta=None, seed=0):
+    """
+    Two passes over `layer_source()`, a callable returning a fresh iterator of (block index, sampled layer,
+    per-vertex tag record or None), e.g. the out-of-core layer iterator of prismata_make.py.
+    Pass 1 (fit): the extractor thread runs ahead while each layer's shape, magnitudes and statistics are kept; when
+    every layer shares the feature axis, project_blocks then replays `projector` over fit_reads() more reads of the
+    stream, so the [Sum(rows), k] projection (and the crystal) is the one the in-memory build makes.
+    Pass 2 (stream): projection pool -> writer. Every layer's vertices and edges go straight into binary PLYs
+    preallocated from the pass 1 shapes (one per mode). Global layers are sliced from the normalized projection
+    without reading the model again; layers of different widths (CNNs) are re-extracted and projected one by one.
+    """
+    layer_activations = layer_activations or {}
+    per_mode = {'latency': layer_latency or {}, 'attribution': layer_attribution or {}}
+    clock, wall = StageClock(), time.perf_counter()
+
+    if projector not in PIPELINE_PROJECTORS:
+        raise ValueError(f"--pipeline projects in streamed passes: use --projector {' or '.join(PIPELINE_PROJECTORS)} (got {projector})")
+
+    # 1. Fit pass: only metadata and statistics survive each layer, then the global projection over further reads
+    layers = []
+    for layer_id, data, tags in background(layer_source(), depth, clock):
+        start = time.perf_counter()
+        layers.append({'layer_id': layer_id, 'rows': data.shape[0], 'features': data.shape[1],
+                       'magnitudes': row_magnitudes(data).astype(np.float32), 'tags': tags,
+                       'stats': layer_stats(data, layer_id) if stats_file else None})
+        del data
+        clock.add('fit', time.perf_counter() - start)
+    if not layers:
+        print("No data extracted. Is this model supported?")
+        return None
+
+    global_basis = len({l['features'] for l in layers}) == 1 # else every layer gets its own projection in pass 2
+    explained = None
+    if global_basis:
+        shape = (sum(l['rows'] for l in layers), layers[0]['features'])
+        print(f"   ↳ Pass 1: Global {projector.upper()} {n_comps}D of {shape} over {fit_reads(projector, *shape, n_comps)} reads of the layers...")
+        start = time.perf_counter()
+        blocks = lambda: (d.toarray() if sp.issparse(d) else d for _, d, _ in background(layer_source(), depth, clock))
+        projected_matrix = project_blocks(blocks, shape[1], n_comps, projector, seed)
+        if stats_file:
+            explained = projection_explained([l['stats'] for l in layers], projected_matrix)
+        max_val = np.max(np.abs(projected_matrix)) # normalize global, as the in-memory build does
+        if max_val > 0: projected_matrix /= max_val
+        clock.add('fit', time.perf_counter() - start) # wall time of the fit passes, extraction included
+
+    counts = [l['rows'] for l in layers]
+    prev_counts = [counts[i - 1] if i > 0 else 0 for i in range(len(layers))]
+    edge_counts = [count_edges(counts[i], prev_counts[i]) for i in range(len(layers))]
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    edge_offsets = np.concatenate([[0], np.cumsum(edge_counts)[:-1]]).astype(np.int64)
+    if not global_basis:
+        print(f"   ⚠️  Layer dimensions mismatch (likely CNN/ResNet). Pass 1 kept shapes only; Per-Layer {projector.upper()} in pass 2...")
+
+    vertex_dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    vertex_dtype += tag_dtype([l['tags'] for l in layers])
+    writers = {mode: BinaryPlyWriter(filename, sum(counts), sum(edge_counts), vertex_dtype, [('vertex1', 'i4'), ('vertex2', 'i4')])
+               for mode, filename in outputs.items()}
+
+    def project_layer(item):
+        idx, (layer_id, data, _) = item
+        l = layers[idx]
+        if global_basis:
+            projected = projected_matrix[offsets[idx]:offsets[idx] + counts[idx]]
+        else:
+            if layer_id != l['layer_id'] or data.shape[0] != l['rows']:
+                raise RuntimeError(f"Layer {layer_id} changed between the two passes.")
+            projected = project(data, 2, projector)
+            if l['stats'] is not None:
+                l['stats'].capture(projected)
+            mx = np.max(np.abs(projected))
+            if mx > 0: projected = projected / mx
+        colors = {mode: layer_colors(mode, idx, len(layers), l['magnitudes'], step, per_mode.get(mode, layer_activations).get(layer_id), l['tags'])
+                  for mode in writers}
+        return idx, layer_positions(projected, idx), layer_edges(offsets[idx], counts[idx], prev_counts[idx]), colors
+
+    # 2. Streaming pass: the writer (this thread) fills layer idx while later layers are projected (and, per layer, extracted)
+    print(f"   ↳ Pass 2: streaming {sum(counts)} vertices / {sum(edge_counts)} edges through {workers} projection thread(s) "
+          f"into {len(writers)} binary PLY(s)...")
+    if global_basis:
+        stream = ((idx, (l['layer_id'], None, l['tags'])) for idx, l in enumerate(layers))
+    else:
+        stream = enumerate(background(layer_source(), depth, clock))
+    for idx, pos, edges, colors in ordered_map(clock.timed('project', project_layer), stream, workers, depth):
+        start = time.perf_counter()
+        for mode, writer in writers.items():
+            records = np.empty(counts[idx], dtype=writer.vertex_dtype)
+            records['x'], records['y'], records['z'] = pos[:, 0], pos[:, 1], pos[:, 2]
+            records['red'], records['green'], records['blue'] = colors[mode][:, 0], colors[mode][:, 1], colors[mode][:, 2]
+            fill_tags(records, layers[idx]['tags'])
+            writer.write_vertices(offsets[idx], records)
+            edge_records = np.empty(len(edges), dtype=writer.edge_dtype)
+            edge_records['vertex1'], edge_records['vertex2'] = edges[:, 0], edges[:, 1]
+            writer.write_edges(edge_offsets[idx], edge_records)
+        clock.add('write', time.perf_counter() - start)
+
+    if stats_file:
+        save_weight_stats([l['stats'] for l in layers], stats_file, explained, **(stats_meta or {}))
+    busy = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in clock.busy.items())
+    print(f"   ↳ Stages busy: {busy}; wall {time.perf_counter() - wall:.1f}s")
+    return list(outputs.values())
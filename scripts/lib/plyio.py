@@ -0,0 +1,61 @@
+import io
+import numpy as np
+from plyfile import PlyData, PlyElement
+
+PLY_DTYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+              'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4', 'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+# Same bytes as PlyData([...], text=True).write(), without plyfile's one-savetxt-call-per-row loop:
+# a whole element is formatted with a single savetxt ('%.18g', like plyfile), so text crystals with
+# several coloring modes can format the shared edge block once and reuse it.
+
+def ascii_rows(records):
+    """Body text of one structured element array, exactly as plyfile formats it."""
+    buf = io.StringIO()
+    if len(records):
+        table = np.column_stack([records[name].astype(np.float64) for name in records.dtype.names])
+        np.savetxt(buf, table, '%.18g', newline='\n')
+    return buf.getvalue()
+
+def write_ascii_ply(filename, vertex, edge_array, edge_text=None):
+    """Text PLY with 'vertex' and 'edge' elements. Pass edge_text (from ascii_rows) to reuse a formatted edge block."""
+    header = PlyData([PlyElement.describe(vertex[:0], 'vertex'), PlyElement.describe(edge_array[:0], 'edge')], text=True).header
+    header = header.replace('element vertex 0', f'element vertex {len(vertex)}', 1).replace('element edge 0', f'element edge {len(edge_array)}', 1)
+    with open(filename, 'w', newline='\n', encoding='ascii') as f:
+        f.write(header + '\n')
+        f.write(ascii_rows(vertex))
+        f.write(ascii_rows(edge_array) if edge_text is None else edge_text)
+
+def read_ply(path):
+    """
+    {element name: structured array} of a PLY with scalar properties only (every crystal this repo writes).
+    Text bodies go through numpy's C parser (np.loadtxt), binary ones through np.fromfile, so a whole gallery
+    reads in well under a second; plyfile's per-row text parsing is ~15x slower. List properties are delegated to plyfile.
+    """
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise ValueError(f"{path} is not a PLY file")
+        fmt, elements = None, []
+        for line in iter(f.readline, b''):
+            words = line.split()
+            if not words or words[0] in (b'comment', b'obj_info'):
+                continue
+            if words[0] == b'end_header':
+                break
+            if words[0] == b'format':
+                fmt = words[1].decode()
+            elif words[0] == b'element':
+                elements.append((words[1].decode(), int(words[2]), []))
+            elif words[0] == b'property':
+                if words[1] == b'list':
+                    return {e.name: e.data for e in PlyData.read(path).elements}
+                elements[-1][2].append((words[2].decode(), PLY_DTYPES[words[1].decode()]))
+        order = {'binary_little_endian': '<', 'binary_big_endian': '>'}.get(fmt, '=')
+        data = {}
+        for name, count, props in elements:
+            dtype = np.dtype([(prop, order + code) for prop, code in props])
+            if fmt == 'ascii':
+                data[name] = np.loadtxt(f, dtype=dtype, max_rows=count, ndmin=1) if count else np.empty(0, dtype=dtype)
+            else:
+                data[name] = np.fromfile(f, dtype=dtype, count=count)
+        return data
@@ -0,0 +1,178 @@
+import json
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils._python_dispatch import TorchDispatchMode
+from lib.models import get_model_structure, StopForward, stop_after
+
+def tensor_bytes(output):
+    """Bytes of every tensor in a (possibly nested) module output."""
+    if isinstance(output, torch.Tensor):
+        return output.numel() * output.element_size()
+    if isinstance(output, (tuple, list)):
+        return sum(tensor_bytes(o) for o in output)
+    if isinstance(output, dict):
+        return sum(tensor_bytes(o) for o in output.values())
+    if hasattr(output, 'to_tuple'): # transformers ModelOutput
+        return tensor_bytes(output.to_tuple())
+    return 0
+
+class AllocationCounter(TorchDispatchMode):
+    """Adds up the bytes of every tensor an aten op returns while a block is active (CPU has no allocator stats)."""
+    def __init__(self):
+        super().__init__()
+        self.active = None
+        self.bytes = {}
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        if self.active is not None:
+            self.bytes[self.active] = self.bytes.get(self.active, 0) + tensor_bytes(out)
+        return out
+
+def synthetic_input(module, batch_size, image_size=224):
+    """Random input shaped for the first Conv2d / Linear / Embedding inside `module` (mock models have no processor)."""
+    for m in module.modules():
+        if isinstance(m, nn.Conv2d):
+            return torch.randn(batch_size, m.in_channels, image_size, image_size)
+        if isinstance(m, nn.Linear):
+            return torch.randn(batch_size, m.in_features)
+        if isinstance(m, nn.Embedding):
+            return torch.randint(0, m.num_embeddings, (batch_size, 16))
+    return None
+
+def build_runner(model, layers, batch_size=1, seq_len=128, selected=None):
+    """
+    A no-argument callable that runs one forward pass.
+    Hugging Face models get random token ids (or pixels); mocks are run block by block on synthetic inputs,
+    or as a chain when the structure is an nn.Sequential (CNN 'features').
+    With `selected` (block indices) the block-by-block runner only runs those blocks.
+    """
+    config = getattr(model, 'config', None)
+    if config is not None:
+        inputs = {}
+        if hasattr(config, 'num_channels') and not hasattr(config, 'vocab_size'):
+            size = getattr(config, 'image_size', 224)
+            size = size[0] if isinstance(size, (list, tuple)) else size
+            inputs['pixel_values'] = torch.randn(batch_size, config.num_channels, size, size)
+        else:
+            vocab = getattr(config, 'vocab_size', None) or getattr(getattr(config, 'text_config', None), 'vocab_size', 1000)
+            inputs['input_ids'] = torch.randint(0, vocab, (batch_size, seq_len))
+            inputs['attention_mask'] = torch.ones(batch_size, seq_len, dtype=torch.long)
+            if getattr(config, 'is_encoder_decoder', False):
+                inputs['decoder_input_ids'] = inputs['input_ids']
+        return lambda: model(**inputs)
+
+    if isinstance(layers, nn.Sequential):
+        x = synthetic_input(layers, batch_size)
+        return lambda: layers(x)
+
+    blocks = list(layers) if selected is None else [layers[i] for i in selected]
+    runnable = []
+    for block in blocks:
+        x = synthetic_input(block, batch_size)
+        try:
+            with torch.no_grad():
+                block(x)
+            runnable.append((block, x))
+        except Exception:
+            pass # weight containers (mock blocks without a forward)
+    if len(runnable) < len(blocks):
+        print(f"   ⚠️  {len(blocks) - len(runnable)} of {len(blocks)} blocks have no runnable forward (weight containers). They stay cold.")
+    return lambda: [block(x) for block, x in runnable]
+
+def profile_layers(model, batch_size=1, seq_len=128, warmup=2, runs=5, layers=None):
+    """
+    Per-block forward profile over `runs` timed passes after `warmup` untimed ones.
+    Pre/post forward hooks on every block from get_model_structure record wall time and output bytes;
+    one extra pass under AllocationCounter records the bytes allocated inside each block.
+    With `layers` (block indices) only those blocks are hooked and each pass stops after the last one.
+    Returns a dict ready for JSON (see save_latency).
+    """
+    blocks = get_model_structure(model)
+    selected = range(len(blocks)) if layers is None else layers
+    n = len(selected)
+    times = {i: [] for i in selected}
+    output_bytes = dict.fromkeys(selected, 0)
+    started = {}
+    counter = None
+    recording = {'on': False}
+
+    def pre_hook(idx):
+        def hook(module, args):
+            if counter is not None:
+                counter.active = idx
+            started[idx] = time.perf_counter()
+        return hook
+
+    def post_hook(idx):
+        def hook(module, args, output):
+            elapsed = time.perf_counter() - started.pop(idx, time.perf_counter())
+            if counter is not None:
+                counter.active = None
+            elif recording['on']:
+                times[idx].append(elapsed)
+                output_bytes[idx] = tensor_bytes(output)
+        return hook
+
+    hooks = []
+    for i in selected:
+        hooks.append(blocks[i].register_forward_pre_hook(pre_hook(i)))
+        hooks.append(blocks[i].register_forward_hook(post_hook(i)))
+    forward = build_runner(model, blocks, batch_size, seq_len, layers)
+    if layers: # after build_runner, whose trial forward of each block would read the stop as a failure
+        hooks.append(stop_after(blocks[selected[-1]]))
+
+    def run():
+        try:
+            forward()
+        except StopForward:
+            pass
+    model.eval()
+    print(f"⏱️  Profiling {n} blocks: batch {batch_size}, seq {seq_len}, {warmup} warm-up + {runs} timed passes...")
+    totals = []
+    try:
+        with torch.no_grad():
+            for _ in range(warmup):
+                run()
+            recording['on'] = True
+            for _ in range(runs):
+                start = time.perf_counter()
+                run()
+                totals.append(time.perf_counter() - start)
+            recording['on'] = False
+            counter = AllocationCounter()
+            with counter:
+                run()
+    finally:
+        for h in hooks: h.remove()
+
+    per_layer = []
+    for i in selected:
+        t = np.array(times[i]) * 1000
+        per_layer.append({
+            'layer': i,
+            'type': type(blocks[i]).__name__,
+            'time_ms': {'mean': float(t.mean()), 'median': float(np.median(t)), 'min': float(t.min()), 'std': float(t.std()), 'runs': t.tolist()} if len(t) else None,
+            'allocated_bytes': int(counter.bytes.get(i, 0)),
+            'output_bytes': int(output_bytes[i]),
+        })
+    measured = sum(l['time_ms']['median'] for l in per_layer if l['time_ms'])
+    for l in per_layer:
+        l['share'] = l['time_ms']['median'] / measured if l['time_ms'] and measured > 0 else 0.0
+
+    total_ms = float(np.median(totals) * 1000)
+    print(f"   ↳ Forward pass: {total_ms:.1f} ms (median), {measured / max(total_ms, 1e-9) * 100:.0f}% inside profiled blocks")
+    return {'batch_size': batch_size, 'seq_len': seq_len, 'warmup': warmup, 'runs': runs,
+            'threads': torch.get_num_threads(), 'forward_ms': total_ms, 'layers': per_layer}
+
+def layer_heat(profile):
+    """{layer: 0..1} median time relative to the slowest block (the hot-spot scale of the crystal)."""
+    medians = {l['layer']: l['time_ms']['median'] for l in profile['layers'] if l['time_ms']}
+    peak = max(medians.values(), default=0)
+    return {i: (t / peak if peak > 0 else 0.0) for i, t in medians.items()}
+
+def save_latency(profile, filename):
+    with open(filename, 'w') as f:
+        json.dump(profile, f, indent=2)
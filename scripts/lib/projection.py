@@ -0,0 +1,361 @@
+import warnings
+import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+import torch
+from scipy.sparse.linalg import LinearOperator, svds
+from sklearn.decomposition import PCA
+from sklearn.random_projection import johnson_lindenstrauss_min_dim
+from lib.options import pca_solver
+
+def as_tensor(matrix):
+    """Shares memory with the numpy array (no copy). Half precision is lifted since CPU BLAS has no fp16 GEMM."""
+    X = torch.from_numpy(np.ascontiguousarray(matrix))
+    if X.dtype != torch.float32 and X.dtype != torch.float64:
+        X = X.float()
+    return X
+
+def svd_flip_signs(projected, components):
+    """Deterministic orientation, same rule as sklearn PCA: the largest |loading| of every component is positive."""
+    signs = np.sign(components[range(components.shape[0]), np.argmax(np.abs(components), axis=1)])
+    signs[signs == 0] = 1
+    return projected * signs
+
+def orient_by_features(matrix, projected):
+    """
+    svd_flip_signs with the loadings on the original features, for projections computed in another space (a sketch):
+    (X - mu)^T @ projected is proportional to the principal axes, and the mean drops out since projected is centered.
+    """
+    P = np.ascontiguousarray(projected, dtype=np.float32)
+    if sp.issparse(matrix):
+        loadings = matrix.T @ P
+    else:
+        X = as_tensor(matrix)
+        loadings = (X.T @ torch.from_numpy(P).to(X.dtype)).numpy()
+    return svd_flip_signs(projected, loadings.T)
+
+def project_pca(matrix, n_components=2, seed=0):
+    """Exact PCA (sklearn). float16 is lifted to float32, otherwise sklearn would go to float64."""
+    pca = PCA(n_components=n_components, random_state=seed)
+    return pca.fit_transform(matrix.astype(np.float32, copy=False))
+
+def centered_products(X):
+    """
+    (x_times, xt_times) of the implicitly centered CSR matrix X - 1 mu^T, for randomized_range:
+    every product costs O(nnz) and the centered (dense) matrix is never built.
+    """
+    mu = np.asarray(X.mean(axis=0)).ravel().astype(np.float32)
+    ones = np.ones(X.shape[0], dtype=np.float32)
+    return lambda M: X @ M - np.outer(ones, mu @ M), lambda Q: X.T @ Q - np.outer(mu, ones @ Q)
+
+def project_randomized(matrix, n_components=2, seed=0, oversample=8, niter=1):
+    """
+    Randomized SVD (Halko et al.): randomized_range with its products as GEMMs on the tensor storage.
+    The mean is subtracted implicitly inside every product (X @ G - mu @ G), so the centered
+    matrix is never materialized and the only passes over X are 2 + 2 * niter GEMMs.
+    Real weight spectra decay fast, so a single power iteration already matches exact PCA
+    to ~1e-3 correlation on the leading components.
+    CSR input is multiplied as it is (see centered_products), without densifying.
+    """
+    gen = torch.Generator().manual_seed(seed)
+    if sp.issparse(matrix):
+        X = matrix.tocsr().astype(np.float32, copy=False)
+        x_times, xt_times = centered_products(X)
+        dtype = torch.float32
+    else:
+        X = as_tensor(matrix)
+        mu = X.mean(dim=0, keepdim=True)
+        dtype = X.dtype
+
+        def x_times(M):
+            M = torch.from_numpy(M)
+            return (X @ M - mu @ M).numpy()
+
+        def xt_times(Q):
+            Q = torch.from_numpy(Q)
+            return (X.T @ Q - mu.T @ Q.sum(dim=0, keepdim=True)).numpy()
+
+    q = min(n_components + oversample, *X.shape)
+    omega = torch.randn(X.shape[1], q, generator=gen, dtype=dtype).numpy()
+    Q, B = randomized_range(x_times, xt_times, omega, niter) # B = Q^T (X - mu), only [q, Features]
+    Ub, S, Vh = np.linalg.svd(B, full_matrices=False)
+    return svd_flip_signs((Q @ Ub[:, :n_components]) * S[:n_components], Vh[:n_components])
+
+# Rows multiplied per sparse product in project_sketch: a block of X stays in cache while R's nonzeros gather from it
+SKETCH_ROWS = 64
+
+def project_sketch(matrix, n_components=2, seed=0, eps=0.5):
+    """
+    Seeded very sparse random projection (Li et al., density 1/sqrt(Features), entries +/-sqrt(s/k))
+    of the feature axis, then exact PCA on the much narrower sketch. R is a sparse CSR tensor and is applied
+    SKETCH_ROWS rows at a time, so the cost is O(Samples * nnz(R)) instead of a dense Samples x Features x k GEMM.
+
+    What is guaranteed (Johnson-Lindenstrauss): with k = johnson_lindenstrauss_min_dim(Samples, eps) sketch
+    dimensions, every pairwise distance between points is preserved within a factor (1 +/- eps) with high
+    probability (eps=0.5 -> k ~ 480 for 20k points), so the sketch keeps the cloud's geometry and its total
+    variance. Nothing is guaranteed for the 2-3 PCA coordinates themselves: when the leading eigenvalues are
+    close, the top components of the sketch can rotate or swap relative to exact PCA.
+    If k is not smaller than the feature count the sketch is skipped (exact PCA).
+    Signs follow the rule of exact PCA on the original features (orient_by_features), not on the sketch axes.
+    CSR input is sketched with a sparse x sparse product (X @ R, only the [Samples, k] sketch is dense).
+    """
+    n_rows, n_features = matrix.shape
+    k = johnson_lindenstrauss_min_dim(n_rows, eps=eps)
+    if k >= n_features:
+        return project_sparse(matrix, n_components, seed) if sp.issparse(matrix) else project_pca(matrix, n_components, seed)
+
+    rng = np.random.default_rng(seed)
+    density = 1.0 / np.sqrt(n_features)
+    cells = rng.choice(n_features * k, rng.binomial(n_features * k, density), replace=False)
+    values = np.where(rng.random(len(cells)) < 0.5, -1.0, 1.0) * np.sqrt(1.0 / density / k)
+    Rt = sp.csr_matrix((values, (cells % k, cells // k)), shape=(k, n_features), dtype=np.float32) # R^T [k, Features]
+    if sp.issparse(matrix):
+        sketch = (matrix.tocsr().astype(np.float32, copy=False) @ Rt.T.tocsc()).toarray()
+        return orient_by_features(matrix, project_pca(sketch, n_components, seed))
+
+    X = as_tensor(matrix)
+    with warnings.catch_warnings(): # torch flags sparse CSR as beta on every construction
+        warnings.simplefilter('ignore', UserWarning)
+        Rt = torch.sparse_csr_tensor(torch.from_numpy(Rt.indptr).long(), torch.from_numpy(Rt.indices).long(),
+                                     torch.from_numpy(Rt.data).to(X.dtype), size=(k, n_features), check_invariants=False)
+    sketch = torch.empty(n_rows, k, dtype=X.dtype)
+    for start in range(0, n_rows, SKETCH_ROWS):
+        sketch[start:start + SKETCH_ROWS] = (Rt @ X[start:start + SKETCH_ROWS].T).T
+    return orient_by_features(matrix, project_pca(sketch.numpy(), n_components, seed))
+
+def randomized_range(x_times, xt_times, omega, niter=1):
+    """
+    Randomized range finder (Halko et al.) on an implicitly centered X, given its products
+    x_times(M) = (X - mu) @ M and xt_times(Q) = (X - mu).T @ Q, starting from omega [Features, q].
+    Returns (Q [Samples, q] orthonormal, B = Q^T (X - mu) [q, Features]), after niter power iterations.
+    """
+    Q = np.linalg.qr(x_times(omega))[0]
+    for _ in range(niter):
+        Z = np.linalg.qr(xt_times(Q))[0]
+        Q = np.linalg.qr(x_times(Z))[0]
+    return Q, xt_times(Q).T
+
+# Above this density a CSR matrix (a masked tensor stored next to dense ones) takes the randomized SVD:
+# ARPACK multiplies one vector at a time and needs hundreds of products, a few block products are cheaper
+ARPACK_DENSITY = 0.2
+
+def project_sparse(matrix, n_components=2, seed=0, oversample=10, niter=7):
+    """
+    PCA of a scipy.sparse matrix without densifying it, on the implicitly centered operator X - 1 mu^T
+    (every product costs O(nnz)). Up to ARPACK_DENSITY: truncated SVD (ARPACK), the same projection as
+    exact PCA. Denser: randomized SVD with sklearn PCA's randomized settings (10 oversamples, 7 power
+    iterations), which is what PCA runs on such a matrix dense.
+    """
+    X = matrix.tocsr().astype(np.float32)
+    if X.nnz > ARPACK_DENSITY * X.shape[0] * X.shape[1]:
+        return project_randomized(X, n_components, seed, oversample, niter)
+
+    x_times, xt_times = centered_products(X)
+    matvec = lambda v: x_times(np.asarray(v).reshape(X.shape[1], -1))
+    rmatvec = lambda u: xt_times(np.asarray(u).reshape(X.shape[0], -1))
+    centered = LinearOperator(X.shape, matvec=matvec, rmatvec=rmatvec, matmat=matvec, rmatmat=rmatvec, dtype=np.float32)
+    v0 = np.random.default_rng(seed).standard_normal(min(X.shape)).astype(np.float32)
+    U, S, Vt = svds(centered, k=n_components, v0=v0)
+    order = np.argsort(S)[::-1] # ARPACK returns ascending
+    projected = U[:, order] * S[order]
+    return svd_flip_signs(projected, Vt[order])
+
+def project(matrix, n_components=2, method='pca', seed=0):
+    """
+    Projects [Samples, Features] down to [Samples, n_components] with the selected backend.
+    Sparse (CSR) input is never densified: pca takes the sparse truncated SVD (project_sparse),
+    randomized and sketch multiply the CSR matrix directly.
+    """
+    if method == 'randomized':
+        return project_randomized(matrix, n_components, seed)
+    elif method == 'sketch':
+        return project_sketch(matrix, n_components, seed)
+    if sp.issparse(matrix):
+        return project_sparse(matrix, n_components, seed)
+    return project_pca(matrix, n_components, seed)
+
+def project_streaming(read_rows, n_rows, n_features, n_components=2, block_rows=4096, seed=0, oversample=8, niter=1):
+    """
+    Randomized SVD (same scheme as project_randomized) when X is only reachable block by block,
+    e.g. from an out-of-core spill: read_rows(start, stop) -> [stop - start, Features].
+    Makes 4 + 2 * niter sequential passes over X. Memory is one block plus O(Samples * q)
+    for the range basis; the centered matrix never exists.
+    """
+    blocks = [(start, min(start + block_rows, n_rows)) for start in range(0, n_rows, block_rows)]
+    rng = np.random.default_rng(seed)
+    q = min(n_components + oversample, n_rows, n_features)
+
+    mu = np.zeros(n_features)
+    for start, stop in blocks:
+        mu += read_rows(start, stop).sum(axis=0, dtype=np.float64)
+    mu /= n_rows
+
+    def x_times(M):
+        out = np.empty((n_rows, M.shape[1]))
+        shift = mu @ M
+        for start, stop in blocks:
+            out[start:stop] = read_rows(start, stop).astype(np.float32, copy=False) @ M.astype(np.float32) - shift
+        return out
+
+    def xt_times(Q):
+        acc = np.zeros((n_features, Q.shape[1]))
+        for start, stop in blocks:
+            acc += read_rows(start, stop).astype(np.float32, copy=False).T @ Q[start:stop].astype(np.float32)
+        return acc - np.outer(mu, Q.sum(axis=0))
+
+    Q, B = randomized_range(x_times, xt_times, rng.standard_normal((n_features, q)), niter)
+    Ub, S, Vh = np.linalg.svd(B, full_matrices=False)
+    projected = (Q @ Ub[:, :n_components]) * S[:n_components]
+    return svd_flip_signs(projected, Vh[:n_components])
+
+def fit_basis_streaming(iter_blocks, n_features, n_components=2, seed=0, oversample=8, niter=1):
+    """
+    The randomized SVD of project_streaming, over blocks produced by iter_blocks() (called once per pass,
+    same order every time), returning the basis instead of the projection:
+    (mean [Features], components [n_components, Features]), so other matrices can be projected into it
+    with (X - mean) @ components.T. Signs follow the same rule as sklearn PCA.
+    """
+    rng = np.random.default_rng(seed)
+    mu, n_rows = np.zeros(n_features), 0
+    for block in iter_blocks():
+        mu += block.sum(axis=0, dtype=np.float64)
+        n_rows += block.shape[0]
+    mu /= n_rows
+    q = min(n_components + oversample, n_rows, n_features)
+
+    def x_times(M):
+        shift = mu @ M
+        return np.concatenate([block.astype(np.float32, copy=False) @ M.astype(np.float32) - shift for block in iter_blocks()])
+
+    def xt_times(Q):
+        acc, row = np.zeros((n_features, Q.shape[1])), 0
+        for block in iter_blocks():
+            acc += block.astype(np.float32, copy=False).T @ Q[row:row + block.shape[0]].astype(np.float32)
+            row += block.shape[0]
+        return acc - np.outer(mu, Q.sum(axis=0))
+
+    _, B = randomized_range(x_times, xt_times, rng.standard_normal((n_features, q)), niter)
+    Vh = np.linalg.svd(B, full_matrices=False)[2][:n_components]
+    return mu, svd_flip_signs(Vh.T, Vh).T
+
+def block_products(iter_blocks, mu):
+    """
+    (x_times, xt_times) of the implicitly centered X - mu stacked from iter_blocks(), one pass per call:
+    x_times(M) = (X - mu) @ M [Samples, q] and xt_times(Q) = (X - mu).T @ Q [Features, q], in float32 like the blocks.
+    """
+    def x_times(M):
+        M = np.asarray(M, dtype=np.float32)
+        shift = (mu @ M).astype(np.float32)
+        return np.concatenate([block.astype(np.float32, copy=False) @ M - shift for block in iter_blocks()])
+
+    def xt_times(Q):
+        Q = np.asarray(Q, dtype=np.float32)
+        acc, row = np.zeros((len(mu), Q.shape[1])), 0
+        for block in iter_blocks():
+            acc += block.astype(np.float32, copy=False).T @ Q[row:row + block.shape[0]]
+            row += block.shape[0]
+        return (acc - np.outer(mu, Q.sum(axis=0, dtype=np.float64))).astype(np.float32)
+    return x_times, xt_times
+
+def project_blocks(iter_blocks, n_features, n_components=2, method='pca', seed=0):
+    """
+    project(np.vstack(blocks), n_components, method, seed) for blocks only reachable one at a time from iter_blocks()
+    (called once per pass, same order every time), e.g. layers re-extracted from a model (see fit_reads for the pass count).
+    Each pass replays the in-memory backend on the implicitly centered matrix, so the result matches it to float32
+    rounding: pca follows sklearn PCA's solver choice (exact solvers through the covariance matrix, else its randomized
+    SVD: same seeded start, LU power iterations, transposed when Samples < Features), randomized is project_randomized.
+    Only [Samples, q] and [Features, q] factors are held. sketch has no streamed form (ValueError).
+    """
+    mu, n_rows = np.zeros(n_features), 0
+    for block in iter_blocks():
+        mu += block.sum(axis=0, dtype=np.float64)
+        n_rows += block.shape[0]
+    if method not in ('pca', 'randomized'):
+        raise ValueError(f"No streamed form of the {method} projector (use pca or randomized)")
+    mu /= n_rows
+    x_times, xt_times = block_products(iter_blocks, mu)
+
+    if method == 'randomized':
+        q = min(n_components + 8, n_rows, n_features)
+        omega = torch.randn(n_features, q, generator=torch.Generator().manual_seed(seed), dtype=torch.float32).numpy()
+        Q, B = randomized_range(x_times, xt_times, omega, 1)
+        Ub, S, Vh = np.linalg.svd(B, full_matrices=False)
+        return svd_flip_signs((Q @ Ub[:, :n_components]) * S[:n_components], Vh[:n_components])
+
+    solver, niter = pca_solver(n_rows, n_features, n_components)
+    if solver == 'exact':
+        if n_features > 1000: # sklearn's full solver on a handful of rows: they fit in memory
+            return project_pca(np.vstack(list(iter_blocks())), n_components, seed)
+        cov = np.zeros((n_features, n_features))
+        for block in iter_blocks():
+            block = block.astype(np.float64)
+            cov += block.T @ block
+        cov -= n_rows * np.outer(mu, mu)
+        Vt = np.linalg.eigh(cov)[1][:, ::-1][:, :n_components].T
+        Vt = svd_flip_signs(Vt.T, Vt).T
+        return x_times(Vt.T)
+
+    # sklearn's _randomized_svd on X - mu (or its transpose) with PCA's defaults: 10 oversamples, RandomState(seed)
+    transpose = n_rows < n_features
+    a_times, at_times = (xt_times, x_times) if transpose else (x_times, xt_times)
+    Q = np.random.RandomState(seed).normal(size=(n_rows if transpose else n_features, n_components + 10)).astype(np.float32)
+    for _ in range(niter):
+        Q = scipy.linalg.lu(a_times(Q), permute_l=True, check_finite=False)[0]
+        Q = scipy.linalg.lu(at_times(Q), permute_l=True, check_finite=False)[0]
+    Q = scipy.linalg.qr(a_times(Q), mode='economic', check_finite=False)[0]
+    Uhat, S, Vt = scipy.linalg.svd(at_times(Q).T, full_matrices=False, check_finite=False) # B = Q^T A
+    U = Q @ Uhat
+    if transpose:
+        U, Vt = Vt.T, U.T
+    return svd_flip_signs(U[:, :n_components] * S[:n_components], Vt[:n_components])
+
+class IncrementalBasis:
+    """
+    PCA basis updated one batch at a time (IncrementalPCA's merge rule, with each batch first compressed
+    to rank `rank` by a randomized range finder warm-started from the current basis).
+    Each update costs a few thin matmuls plus the SVD of a (2 * rank + 1) x Features matrix,
+    so a long sequence of batches (training checkpoints) can be folded in without a second pass.
+    components() keeps each axis's sign aligned with the previous call, so consecutive frames do not flip.
+    """
+    def __init__(self, n_components=2, rank=10, seed=0):
+        self.n_components = n_components
+        self.rank = max(rank, n_components)
+        self.rng = np.random.default_rng(seed)
+        self.n = 0
+        self.mean = None
+        self.S = None
+        self.Vt = None
+        self.previous = None
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        m, n_features = X.shape
+        mean = X.mean(axis=0, dtype=np.float64)
+        q = min(self.rank, m, n_features)
+        omega = self.Vt[:q].T if self.Vt is not None else self.rng.standard_normal((n_features, q))
+        shift = mean.astype(np.float32)
+        _, B = randomized_range(lambda M: X @ M - shift @ M, lambda Q: X.T @ Q - np.outer(shift, Q.sum(axis=0)),
+                                omega.astype(np.float32)) # [q, Features], = Q^T (X - mean)
+        if self.Vt is None:
+            stacked = B
+            self.mean = mean
+        else:
+            correction = np.sqrt(self.n * m / (self.n + m)) * (self.mean - mean)
+            stacked = np.vstack([self.S[:, None] * self.Vt, B, correction[None, :]])
+            self.mean = (self.n * self.mean + m * mean) / (self.n + m)
+        _, S, Vt = np.linalg.svd(stacked, full_matrices=False)
+        self.S, self.Vt = S[:self.rank], Vt[:self.rank]
+        self.n += m
+        return self
+
+    def components(self):
+        """[n_components, Features], signs matched to the previous call (sklearn's rule the first time)."""
+        Vh = self.Vt[:self.n_components]
+        if self.previous is None:
+            Vh = svd_flip_signs(Vh.T, Vh).T
+        else:
+            signs = np.sign(np.einsum('ij,ij->i', Vh, self.previous))
+            signs[signs == 0] = 1
+            Vh = Vh * signs[:, None]
+        self.previous = Vh
+        return Vh
@@ -0,0 +1,224 @@
+import json
+import os
+import numpy as np
+
+# Quantized checkpoints (GPTQ, AWQ, compressed-tensors, bitsandbytes int8) are read as stored. Every format comes
+# down to integer codes C of the logical Linear weight [Out, In] plus per-group scales S and zero points Z
+# ([Groups, Out], input feature i belongs to group g[i]):
+#     W[o, i] = (C[o, i] - Z[g[i], o]) * S[g[i], o]
+# Only the sampled rows (W[::step]) or columns (W[:, ::step].T) are unpacked and dequantized, CHUNK_ROWS at a time,
+# so no float copy of a whole layer is ever made. Stored tensors next to the logical 'X.weight':
+#   gptq    X.qweight int32 [In / pack, Out] (packed along In), X.qzeros [G, Out / pack], X.scales [G, Out], X.g_idx [In]
+#   awq     X.qweight int32 [In, Out / pack] (packed along Out, in AWQ_ORDER), X.qzeros likewise, X.scales [G, Out]
+#   packed  X.weight_packed int32 [Out, In / pack], symmetric codes offset by 2^(bits-1), X.weight_scale [Out, G]
+#   int8    X.weight int8 [Out, In] + X.SCB [Out] (bitsandbytes absmax) or X.weight_scale [Out, G] (compressed-tensors)
+AWQ_ORDER = [0, 2, 4, 6, 1, 3, 5, 7] # bit slot k of an AWQ word holds column 8w + AWQ_ORDER[k]
+
+# (stored tensors of one quantized weight, axes of the stored codes, packed axis)
+FORMATS = {
+    'gptq': (('qweight', 'qzeros', 'scales', 'g_idx'), ('in', 'out'), 'in'),
+    'awq': (('qweight', 'qzeros', 'scales'), ('in', 'out'), 'out'),
+    'packed': (('weight_packed', 'weight_scale', 'weight_zero_point', 'weight_shape', 'weight_g_idx'), ('out', 'in'), 'in'),
+    'int8': (('weight', 'SCB', 'weight_format', 'weight_scale', 'weight_zero_point'), ('out', 'in'), None),
+}
+
+def quantization_config(path):
+    """quantization_config from config.json (or AutoGPTQ's quantize_config.json) next to the shards, {} if none."""
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    for name in ('config.json', 'quantize_config.json'):
+        file = os.path.join(directory, name)
+        if os.path.exists(file):
+            with open(file) as f:
+                config = json.load(f)
+            config = config if name == 'quantize_config.json' else config.get('quantization_config') or {}
+            if config:
+                return config
+    return {}
+
+def config_bits(config):
+    """Weight bits of a GPTQ / AWQ / compressed-tensors quantization_config, 4 when it does not say."""
+    for group in (config.get('config_groups') or {}).values():
+        if (group.get('weights') or {}).get('num_bits'):
+            return int(group['weights']['num_bits'])
+    return int(config.get('bits') or config.get('w_bit') or 4)
+
+def config_group_size(config):
+    """Input features per scale group, None when the config does not say (or uses one group per row)."""
+    for group in (config.get('config_groups') or {}).values():
+        size = (group.get('weights') or {}).get('group_size')
+        if size:
+            return int(size)
+    size = config.get('group_size') or config.get('q_group_size')
+    return int(size) if size and int(size) > 0 else None
+
+def unpack(words, bits, slot, axis=-1):
+    """int32 words -> uint32 codes, pack per word along `axis` (0 or -1); code k of each word sits in bit slot slot[k]."""
+    shifts = (bits * np.asarray(slot)).astype(np.uint32)
+    mask = np.uint32((1 << bits) - 1)
+    if axis == 0:
+        return ((words.view(np.uint32)[:, None] >> shifts[:, None]) & mask).reshape(-1, *words.shape[1:])
+    return ((words.view(np.uint32)[..., None] >> shifts) & mask).reshape(*words.shape[:-1], -1)
+
+def per_out(values, n_out):
+    """Scales / zero points stored [Out, G], [Out] or per tensor -> [G, Out] float32."""
+    values = np.asarray(values, dtype=np.float32)
+    if values.size == 1:
+        return np.full((1, n_out), values.item(), dtype=np.float32)
+    return values.reshape(n_out, -1).T
+
+class QuantizedTensor:
+    """
+    One quantized Linear weight of a checkpoint: logical shape [Out, In], how its codes are stored and where its
+    scales live. Every read goes through read(name) -> safetensors slice of a stored tensor.
+    """
+    def __init__(self, kind, prefix, shape, bits, names, zero_offset=0, group_size=None):
+        suffixes, self.stored, self.packed = FORMATS[kind]
+        self.kind, self.prefix, self.shape, self.bits = kind, prefix, tuple(shape), bits
+        self.pack = 32 // bits if self.packed else 1
+        self.slot = np.argsort(AWQ_ORDER) if kind == 'awq' else np.arange(self.pack) # bit slot of code k of a word
+        self.zero_offset, self.group_size = zero_offset, group_size
+        self.components = [f'{prefix}.{s}' for s in suffixes if f'{prefix}.{s}' in names]
+
+    def load(self, suffix, read):
+        name = f'{self.prefix}.{suffix}'
+        return read(name)[:] if name in self.components else None
+
+    def groups(self, read):
+        """(scales [G, Out], zero points [G, Out] or a scalar, group of every input feature [In]); all small."""
+        n_out, n_in = self.shape
+        if self.kind in ('gptq', 'awq'):
+            scales = self.load('scales', read).float().numpy()
+            zeros = self.load('qzeros', read)
+            zeros = (unpack(zeros.numpy(), self.bits, self.slot)[:, :n_out] + self.zero_offset).astype(np.float32) \
+                if zeros is not None else float(1 << (self.bits - 1))
+        elif self.kind == 'packed':
+            scales = per_out(self.load('weight_scale', read).float(), n_out)
+            zeros = self.load('weight_zero_point', read)
+            zeros = float(1 << (self.bits - 1)) + (per_out(zeros.float(), n_out) if zeros is not None else 0.0)
+        else:
+            scb = self.load('SCB', read)
+            scales = per_out(scb.float() / 127, n_out) if scb is not None else per_out(self.load('weight_scale', read).float(), n_out)
+            zeros = self.load('weight_zero_point', read)
+            zeros = per_out(zeros.float(), n_out) if zeros is not None else 0.0
+        g_idx = self.load('g_idx' if self.kind == 'gptq' else 'weight_g_idx', read)
+        if g_idx is not None:
+            g = g_idx.numpy().astype(np.int64)
+        else:
+            # The last group may be short (In not a multiple of group_size), so the size is not always In / G
+            size = self.group_size if self.group_size and -(-n_in // self.group_size) == len(scales) else -(-n_in // len(scales))
+            g = np.arange(n_in) // size
+        return scales, zeros, g
+
+    def codes(self, read, out_sel, in_sel):
+        """Integer codes of W[out_sel, in_sel] ((start, stop, step) ranges), in the stored orientation (self.stored)."""
+        sel = {'out': out_sel, 'in': in_sel}
+        ranges = [sel[axis] for axis in self.stored]
+        t = read(f'{self.prefix}.{FORMATS[self.kind][0][0]}')
+        index = [slice(*r) for r in ranges]
+        if self.packed is None:
+            return t[tuple(index)].numpy()
+        p = self.stored.index(self.packed)
+        start, stop, step = ranges[p]
+        n = len(range(start, stop, step))
+        if step < self.pack:
+            # Every word in range holds sampled codes: read them in one go, unpack all, keep every step-th
+            index[p] = slice(start // self.pack, (stop - 1) // self.pack + 1)
+            codes = unpack(t[tuple(index)].numpy(), self.bits, self.slot, axis=0 if p == 0 else -1)
+            index = [slice(None), slice(None)]
+            index[p] = slice(start % self.pack, start % self.pack + n * step, step)
+            return codes[tuple(index)]
+        # Sampled codes j, j + m, j + 2m... (m = pack / gcd) share a bit slot and sit at evenly spaced words:
+        # m strided reads touch exactly the words holding sampled codes
+        m = self.pack // np.gcd(step, self.pack)
+        shape = [len(range(*r)) for r in ranges]
+        shape[p] = n
+        codes = np.empty(shape, dtype=np.uint32)
+        mask = np.uint32((1 << self.bits) - 1)
+        for j in range(min(m, n)):
+            first = start + j * step
+            last = first + (n - 1 - j) // m * m * step
+            index[p] = slice(first // self.pack, last // self.pack + 1, step * m // self.pack)
+            target = [slice(None), slice(None)]
+            target[p] = slice(j, None, m)
+            codes[tuple(target)] = (t[tuple(index)].numpy().view(np.uint32) >> np.uint32(self.bits * self.slot[first % self.pack])) & mask
+        return codes
+
+    def block(self, read, out_sel, in_sel, groups):
+        """Dequantized W[out_sel, in_sel] float32, in the stored orientation."""
+        scales, zeros, g = groups
+        w = self.codes(read, out_sel, in_sel).astype(np.float32)
+        gi, cols = g[slice(*in_sel)], slice(*out_sel)
+        orient = (lambda a: a) if self.stored[0] == 'in' else (lambda a: a.T) # group tables index [In, Out]
+        w -= orient(zeros[:, cols][gi]) if np.ndim(zeros) else zeros
+        w *= orient(scales[:, cols][gi])
+        return w
+
+    def sampled(self, read, chunk_rows, step=1, dtype=np.float32, out=None, columns=False):
+        """
+        W[::step] [Out/step, In], or W[:, ::step].T [In/step, Out] with `columns` (Checkpoint.sampled_rows /
+        sampled_T). Chunks run along the stored leading axis, so each read is chunk_rows contiguous (packed) rows.
+        """
+        n_out, n_in = self.shape
+        axis = 'in' if columns else 'out'
+        sel = {'out': (0, n_out, 1), 'in': (0, n_in, 1)}
+        sel[axis] = (0, self.shape[columns], step)
+        if out is None:
+            out = np.empty((len(range(*sel[axis])), n_out if columns else n_in), dtype=dtype)
+        groups = self.groups(read)
+        lead = self.stored[0]
+        _, stop, s = sel[lead]
+        for begin in range(0, stop, chunk_rows * s):
+            part = dict(sel, **{lead: (begin, min(stop, begin + chunk_rows * s), s)})
+            w = self.block(read, part['out'], part['in'], groups)
+            if lead == axis:
+                out[begin // s:begin // s + w.shape[0]] = w
+            else:
+                out[:, begin:begin + w.shape[0]] = w.T
+        return out
+
+def may_be_quantized(names):
+    """Cheap test on the keys alone, before looking at dtypes and shapes."""
+    return any(n.endswith(('.qweight', '.weight_packed', '.SCB', '.weight_scale')) for n in names)
+
+def find_quantized(tensors, config=None):
+    """
+    {logical 'X.weight': QuantizedTensor} from {name: (dtype, shape)} of every stored tensor. Bits come from the
+    quantization_config (see quantization_config), 4 when it does not say; int8 tensors are recognized by dtype.
+    """
+    config = config or {}
+    bits, group_size = config_bits(config), config_group_size(config)
+    found = {}
+    for name, (dtype, shape) in tensors.items():
+        prefix, _, suffix = name.rpartition('.')
+        has = lambda s: f'{prefix}.{s}' in tensors
+        if suffix in ('qweight', 'weight_packed') and 32 % bits:
+            raise ValueError(f"{bits}-bit codes span int32 words ({name}); only 2, 4 and 8-bit packing is supported")
+        if suffix == 'qweight' and has('scales') and len(shape) == 2:
+            n_scales = tensors[f'{prefix}.scales'][1][-1]
+            if shape[1] == n_scales:
+                # GPTQ v1 (AutoGPTQ, the usual 'gptq' checkpoint_format) stores zero points minus one
+                offset = 0 if config.get('checkpoint_format') == 'gptq_v2' else 1
+                found[f'{prefix}.weight'] = QuantizedTensor('gptq', prefix, (shape[1], shape[0] * 32 // bits), bits, tensors, offset, group_size)
+            elif shape[1] * 32 // bits == n_scales:
+                found[f'{prefix}.weight'] = QuantizedTensor('awq', prefix, (n_scales, shape[0]), bits, tensors, group_size=group_size)
+        elif suffix == 'weight_packed' and has('weight_scale') and len(shape) == 2:
+            found[f'{prefix}.weight'] = QuantizedTensor('packed', prefix, (shape[0], shape[1] * 32 // bits), bits, tensors, group_size=group_size)
+        elif suffix == 'weight' and dtype == 'I8' and len(shape) == 2 and (has('SCB') or has('weight_scale')):
+            found[name] = QuantizedTensor('int8', prefix, shape, 8, tensors, group_size=group_size)
+    return found
+
+def logical_keys(names, quantized):
+    """Stored tensor names with each quantized weight's components folded into its 'X.weight', in stored order."""
+    owner = {c: key for key, q in quantized.items() for c in q.components}
+    keys, seen = [], set()
+    for name in names:
+        key = owner.get(name, name)
+        if key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
+
+def describe_quantized(quantized):
+    """'gptq 4-bit, 96 tensors' style summary for messages."""
+    kinds = sorted({(q.kind, q.bits) for q in quantized.values()})
+    return ", ".join(f"{kind} {bits}-bit" for kind, bits in kinds) + f", {len(quantized)} tensors"
@@ -45,3 +45,85 @@ def get_color(mode, layer_idx, total_layers, neuron_idx, weight_val, activation_
         # Default "Ice"
         intensity = int(np.clip(weight_val * 800, 50, 255))
         return intensity, 200 + int(intensity*0.2), 255
+
+# Vectorized versions: one call per layer instead of one per point (get_colors gives get_color's output).
+
+def hsv_to_rgb_array(h, s, v):
+    """
+    colorsys.hsv_to_rgb over numpy arrays: same branch table and same float math, including
+    staying in float32 when h is float32 (s and v are usually plain Python floats).
+    """
+    h = np.asarray(h)
+    if not np.issubdtype(h.dtype, np.floating):
+        h = h.astype(np.float64)
+    i = (h * 6.0).astype(np.int64) # int() truncation, h >= 0
+    f = (h * 6.0) - i.astype(h.dtype)
+    p, q, t = v * (1.0 - s), v * (1.0 - s * f), v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    v, p, q, t = np.broadcast_arrays(v, p, q, t)
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    if np.all(np.asarray(s) == 0.0):
+        return v, v, v
+    return r, g, b
+
+def _to_uint8(r, g, b):
+    # int(x*255) for x in [0, 1] is a truncation
+    return np.stack([(np.asarray(c) * 255).astype(np.int64) for c in (r, g, b)], axis=1).astype(np.uint8)
+
+def get_colors(mode, layer_idx, total_layers, neuron_idx, weight_vals, activation_vals=None):
+    """[N, 3] uint8: get_color applied to every neuron of one layer at once (dtypes kept, so results match exactly)."""
+    neuron_idx = np.asarray(neuron_idx)
+    n = len(neuron_idx)
+    if mode == 'layers':
+        return np.tile(np.array(get_color(mode, layer_idx, total_layers, 0, 0), dtype=np.uint8), (n, 1))
+
+    elif mode == 'heads':
+        head_idx = (neuron_idx // 64) % 12
+        return _to_uint8(*hsv_to_rgb_array(head_idx / 12.0, 0.8, 1.0))
+
+    elif mode == 'activation':
+        acts = np.zeros(n) if activation_vals is None else np.asarray(activation_vals)
+        intensity = np.tanh(acts)
+        val = np.clip((intensity - 0.2) / 0.8, 0, 1)
+        red = hsv_to_rgb_array(0.0 + (1.0 - val) * 0.6, 1.0, 1.0)[0]
+        colors = np.stack([(red * 255).astype(np.int64), (val * 255).astype(np.int64), (val * 50).astype(np.int64)], axis=1)
+        colors[intensity < 0.2] = (20, 20, 50)
+        return colors.astype(np.uint8)
+
+    elif mode == 'latency':
+        # Hot-spot map: activation_vals are the layer's time relative to the slowest layer (0-1)
+        # Cool blue (cheap) -> red (hot), brighter as it gets slower
+        heat = np.clip(np.zeros(n) if activation_vals is None else np.asarray(activation_vals, dtype=np.float64), 0, 1)
+        return _to_uint8(*hsv_to_rgb_array(0.66 * (1.0 - heat), 0.9, 0.35 + 0.65 * heat))
+
+    elif mode == 'diff':
+        # Fine-tune drift: activation_vals are each neuron's drift relative to the most changed neuron (0-1)
+        # Untouched = dim teal, drifted = bright orange/red
+        drift = np.clip(np.zeros(n) if activation_vals is None else np.asarray(activation_vals, dtype=np.float64), 0, 1)
+        return _to_uint8(*hsv_to_rgb_array(0.5 * (1.0 - drift), 0.85, 0.3 + 0.7 * drift))
+
+    elif mode == 'attribution':
+        # Gradient x activation: activation_vals are signed scores relative to the strongest neuron (-1..1)
+        # Pushed the target up = orange, pushed it down = blue, brighter as |score| grows (sqrt: scores are heavy-tailed)
+        score = np.clip(np.zeros(n) if activation_vals is None else np.asarray(activation_vals, dtype=np.float64), -1, 1)
+        return _to_uint8(*hsv_to_rgb_array(np.where(score >= 0, 0.08, 0.6), 0.9, 0.2 + 0.8 * np.sqrt(np.abs(score))))
+
+    else:
+        intensity = np.clip(np.asarray(weight_vals) * 800, 50, 255).astype(np.int64)
+        return np.stack([intensity, 200 + (intensity * 0.2).astype(np.int64), np.full(n, 255)], axis=1).astype(np.uint8)
+
+def get_expert_colors(expert_idx, num_experts, router_vals):
+    hue = np.asarray(expert_idx) / max(num_experts, 1)
+    value = 0.35 + 0.65 * np.clip(np.asarray(router_vals, dtype=np.float64), 0, 1)
+    return _to_uint8(*hsv_to_rgb_array(hue, 0.85, value))
+
+def get_attention_colors(head_idx, n_heads, received_vals):
+    hue = np.asarray(head_idx) / max(n_heads, 1)
+    value = 0.25 + 0.75 * np.clip(np.asarray(received_vals, dtype=np.float64), 0, 1)
+    return _to_uint8(*hsv_to_rgb_array(hue, 0.8, value))
+
+def get_embedding_colors(id_ranks, norm_vals):
+    value = 0.35 + 0.65 * np.clip(np.asarray(norm_vals, dtype=np.float64), 0, 1)
+    return _to_uint8(*hsv_to_rgb_array(0.75 * np.asarray(id_ranks, dtype=np.float64), 0.7, value))
@@ -0,0 +1,132 @@
+import os
+import re
+import numpy as np
+from lib.checkpoints import Checkpoint, read_layer
+from lib.headers import is_checkpoint, find_attention_layers
+from lib.extractors import row_magnitudes
+from lib.lattice import layer_positions, layer_edges, layer_colors
+from lib.pipeline import background
+from lib.plyio import write_ascii_ply
+from lib.projection import fit_basis_streaming, IncrementalBasis
+
+# Frames file (<name>.npz next to the crystal):
+#   keyframe [V, 3] int16   first frame, positions quantized to +-(2**(bits-1) - 1) over `extent`
+#   deltas   [F-1, V, 3] int16   frame-to-frame differences of the quantized positions (exact, no drift)
+#   extent, bits, checkpoints (names in order), counts (vertices per layer)
+# Vertex order and edges are those of the crystal PLY, which shows the last frame.
+BASES = ['final', 'incremental']
+
+def checkpoint_sequence(root):
+    """Checkpoints under `root` (sub-directories or .safetensors files) in training order (last number in the name)."""
+    paths = [os.path.join(root, name) for name in os.listdir(root)]
+    paths = [p for p in paths if is_checkpoint(p)]
+
+    def order(path):
+        numbers = re.findall(r'\d+', os.path.basename(path))
+        return (int(numbers[-1]) if numbers else -1, os.path.basename(path))
+    return sorted(paths, key=order)
+
+def load_checkpoint_layers(path, step=1, dtype=np.float32):
+    """{layer: sampled slice} of one checkpoint, same rows as the regular crystal."""
+    ckpt = Checkpoint(path)
+    layers = {layer: read_layer(ckpt, names, conv1d, step, dtype) for layer, names, conv1d in find_attention_layers(ckpt)}
+    ckpt.release()
+    return layers
+
+def prefetch(paths, load, depth=1):
+    """Yields (path, load(path)) in order; the next `depth` checkpoints are read by a background thread meanwhile."""
+    return background(((path, load(path)) for path in paths), depth)
+
+def encode_frames(frames, bits=15):
+    """[F, V, 3] float positions -> (keyframe, deltas, extent). bits <= 15 so every delta fits in int16."""
+    extent = float(np.max(np.abs(frames))) or 1.0
+    levels = 2 ** (bits - 1) - 1
+    quantized = np.rint(frames / extent * levels).astype(np.int16)
+    return quantized[0], np.diff(quantized, axis=0), extent
+
+def load_frames(filename):
+    """Decoded [F, V, 3] float32 positions and checkpoint names from a frames .npz."""
+    data = np.load(filename)
+    quantized = np.concatenate([data['keyframe'][None].astype(np.int32), data['deltas'].astype(np.int32)]).cumsum(axis=0)
+    levels = 2 ** (int(data['bits']) - 1) - 1
+    return (quantized * (float(data['extent']) / levels)).astype(np.float32), [str(n) for n in data['checkpoints']]
+
+def shared_layout(layers, which):
+    """(layer ids, slice shapes) every frame must share, None (after a message) when `layers` cannot give one."""
+    layer_ids = sorted(layers)
+    if not layer_ids:
+        print(f"No attention layers found in the {which} checkpoint.")
+        return None
+    shapes = [layers[l].shape for l in layer_ids]
+    if len({s[1] for s in shapes}) > 1:
+        print("   ⚠️  Layer widths differ; a shared basis needs equal widths.")
+        return None
+    return layer_ids, shapes
+
+def crystallize_timelapse(paths, filename, step=2, dtype=np.float32, basis='final', mode='layers', bits=15, seed=0):
+    """
+    One crystal per checkpoint, all in one projection basis, stored as quantized delta frames over a shared topology.
+    basis='final' fits the basis on the last checkpoint (one extra read) so every frame lands in the trained model's
+    axes; 'incremental' folds each checkpoint into a running basis in a single pass (frames use the basis so far),
+    taking the layout from the first checkpoint and the colors from the last one.
+    Checkpoints are read by a background thread while the previous one is projected.
+    """
+    layout, magnitudes = None, None
+    if basis == 'final':
+        reference = load_checkpoint_layers(paths[-1], step, dtype)
+        layout = shared_layout(reference, 'last')
+        if layout is None:
+            return None
+        reference = [reference[l] for l in layout[0]]
+        print(f"   ↳ Fitting the basis on {os.path.basename(paths[-1])}...")
+        mu, components = fit_basis_streaming(lambda: iter(reference), layout[1][0][1], 2, seed)
+        magnitudes = [row_magnitudes(b) for b in reference]
+        del reference
+    else:
+        running = IncrementalBasis(2, seed=seed)
+
+    print(f"   ↳ Projecting {len(paths)} checkpoints (next one loading in the background)...")
+    names, projections = [], []
+    for path, layers in prefetch(paths, lambda p: load_checkpoint_layers(p, step, dtype)):
+        if layout is None:
+            layout = shared_layout(layers, 'first')
+            if layout is None:
+                return None
+        layer_ids, shapes = layout
+        if sorted(layers) != layer_ids or any(layers[l].shape != s for l, s in zip(layer_ids, shapes)):
+            print(f"   ⚠️  {os.path.basename(path)} has a different layout. Skipped.")
+            continue
+        blocks = [layers[l] for l in layer_ids]
+        del layers
+        if basis == 'incremental':
+            running.update(np.vstack(blocks))
+            mu, components = running.mean, running.components()
+            magnitudes = [row_magnitudes(b) for b in blocks] # the last matching checkpoint colors the crystal
+        projections.append(np.vstack([(b - mu) @ components.T for b in blocks]).astype(np.float32))
+        names.append(os.path.basename(os.path.normpath(path)))
+        del blocks
+    if not projections:
+        print("No checkpoint matched the shared layout.")
+        return None
+    counts = [s[0] for s in layout[1]]
+
+    # One scale for every frame, so growth over training stays visible
+    scale = float(max(np.max(np.abs(p)) for p in projections)) or 1.0
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    frames = np.stack([
+        np.concatenate([layer_positions(p[offsets[i]:offsets[i] + counts[i]] / scale, i) for i in range(len(counts))])
+        for p in projections])
+
+    keyframe, deltas, extent = encode_frames(frames, bits)
+    np.savez_compressed(filename.replace('.ply', '.npz'), keyframe=keyframe, deltas=deltas, extent=extent, bits=bits,
+                        checkpoints=np.array(names), counts=np.array(counts))
+
+    edges = np.concatenate([layer_edges(offsets[i], counts[i], counts[i - 1] if i > 0 else 0) for i in range(len(counts))])
+    edge_array = np.empty(len(edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4')])
+    edge_array['vertex1'], edge_array['vertex2'] = edges[:, 0], edges[:, 1]
+    colors = np.concatenate([layer_colors(mode, i, len(counts), magnitudes[i], step) for i in range(len(counts))])
+    vertex = np.empty(frames.shape[1], dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    vertex['x'], vertex['y'], vertex['z'] = frames[-1, :, 0], frames[-1, :, 1], frames[-1, :, 2]
+    vertex['red'], vertex['green'], vertex['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+    write_ascii_ply(filename, vertex, edge_array)
+    return names
@@ -0,0 +1,127 @@
+import json
+import numpy as np
+import scipy.sparse as sp
+from lib.extractors import CHUNK_ROWS
+
+# Value histograms use the same fixed bins for every layer and model, so they compare directly:
+# HIST_BINS linear bins over [-HIST_LIMIT, HIST_LIMIT], the two outer bins also catch everything beyond.
+HIST_BINS = 256
+HIST_LIMIT = 1.0
+ROW_NORM_QUANTILES = [0, 5, 25, 50, 75, 95, 100]
+
+class WeightStats:
+    """
+    Statistics of one sampled layer, accumulated CHUNK_ROWS rows at a time without copying the layer:
+    zeros, min/max, sum and sum of squares, per-feature sums (so the variance a projection captures can be
+    measured afterwards), the L2 norm of every row and a fixed-bin value histogram.
+    CSR chunks only touch their stored values; the implicit zeros are added in bulk.
+    """
+    def __init__(self, layer_id, n_features):
+        self.layer_id = layer_id
+        self.rows, self.features = 0, n_features
+        self.zeros = 0
+        self.min, self.max = np.inf, -np.inf
+        self.total_sq = 0.0
+        self.col_sum = np.zeros(n_features)
+        self.row_norms = []
+        self.hist = np.zeros(HIST_BINS, dtype=np.int64)
+        self.explained = None
+        self.projected_sum = self.projected_sq = None
+
+    def update(self, chunk):
+        n_rows = chunk.shape[0]
+        if sp.issparse(chunk):
+            values = chunk.data.astype(np.float32, copy=False)
+            implicit = n_rows * self.features - chunk.nnz
+            sq_rows = np.asarray(chunk.multiply(chunk).sum(axis=1), dtype=np.float64).ravel()
+            self.col_sum += np.asarray(chunk.sum(axis=0)).ravel()
+        else:
+            values = chunk.astype(np.float32, copy=False)
+            implicit = 0
+            sq_rows = np.einsum('ij,ij->i', values, values)
+            self.col_sum += values.sum(axis=0)
+        if values.size:
+            self.min, self.max = min(self.min, float(values.min())), max(self.max, float(values.max()))
+        if implicit:
+            self.min, self.max = min(self.min, 0.0), max(self.max, 0.0)
+        self.zeros += values.size - np.count_nonzero(values) + implicit
+        self.total_sq += float(sq_rows.sum())
+        self.row_norms.append(np.sqrt(sq_rows).astype(np.float32))
+
+        bins = np.multiply(values, HIST_BINS / (2 * HIST_LIMIT), dtype=np.float32)
+        bins += HIST_BINS / 2
+        np.clip(bins, 0, HIST_BINS - 1, out=bins)
+        self.hist += np.bincount(bins.astype(np.intp).ravel(), minlength=HIST_BINS)
+        self.hist[HIST_BINS // 2] += implicit
+        self.rows += n_rows
+        return self
+
+    def variance(self):
+        """Total variance (sum over features) of the layer's rows around their own mean."""
+        return self.total_sq - float(self.col_sum @ self.col_sum) / max(self.rows, 1)
+
+    def capture(self, projected):
+        """
+        Fraction of this layer's variance kept by each projected axis (the layer's rows of the projection, unnormalized).
+        Also keeps the per-axis sums, so projection_explained can combine layers projected one at a time.
+        """
+        projected = np.asarray(projected, dtype=np.float64)
+        self.projected_sum, self.projected_sq = projected.sum(axis=0), (projected ** 2).sum(axis=0)
+        captured = self.projected_sq - self.projected_sum ** 2 / max(self.rows, 1)
+        total = self.variance()
+        self.explained = (captured / total).tolist() if total > 0 else [0.0] * projected.shape[1]
+
+    def summary(self):
+        count = self.rows * self.features
+        mean = float(self.col_sum.sum()) / max(count, 1)
+        norms = np.concatenate(self.row_norms) if self.row_norms else np.zeros(1, dtype=np.float32)
+        return {
+            'layer': self.layer_id, 'rows': self.rows, 'features': self.features,
+            'sparsity': self.zeros / max(count, 1), 'min': self.min, 'max': self.max, 'mean': mean,
+            'std': float(np.sqrt(max(self.total_sq / max(count, 1) - mean ** 2, 0.0))),
+            'row_norm': dict({f"p{q}": float(v) for q, v in zip(ROW_NORM_QUANTILES, np.percentile(norms, ROW_NORM_QUANTILES))},
+                             mean=float(norms.mean())),
+            'explained_variance_ratio': self.explained,
+        }
+
+def layer_stats(data, layer_id):
+    """One streaming pass over a sampled layer (dense or CSR), CHUNK_ROWS rows at a time."""
+    stats = WeightStats(layer_id, data.shape[1])
+    for start in range(0, data.shape[0], CHUNK_ROWS):
+        stats.update(data[start:start + CHUNK_ROWS])
+    return stats
+
+def projection_explained(stats, projected=None):
+    """
+    Explained variance ratio of a global projection over every layer stacked, from the accumulated sums alone.
+    `projected` ([Sum(rows), k], unnormalized) fills in each layer's share first (WeightStats.capture);
+    without it every layer must already have been captured (e.g. while streaming).
+    """
+    if projected is not None:
+        row = 0
+        for s in stats:
+            s.capture(projected[row:row + s.rows])
+            row += s.rows
+    rows = sum(s.rows for s in stats)
+    col_sum = sum(s.col_sum for s in stats)
+    total = sum(s.total_sq for s in stats) - float(col_sum @ col_sum) / max(rows, 1)
+    p_sum, p_sq = sum(s.projected_sum for s in stats), sum(s.projected_sq for s in stats)
+    captured = p_sq - p_sum ** 2 / max(rows, 1)
+    return (captured / total).tolist() if total > 0 else [0.0] * len(p_sum)
+
+def save_weight_stats(stats, filename, explained=None, **meta):
+    """
+    <name>_stats.json (per-layer summary, readable by INFO.md / report scripts) and <name>_stats.npz
+    (hist_<layer> counts over hist_edges, row_norms_<layer> for every sampled row).
+    `explained` is the global projection's ratio per axis, None when every layer was projected on its own.
+    """
+    edges = np.linspace(-HIST_LIMIT, HIST_LIMIT, HIST_BINS + 1)
+    summary = dict(meta, explained_variance_ratio=explained, histogram={'bins': HIST_BINS, 'limit': HIST_LIMIT},
+                   layers=[s.summary() for s in stats])
+    with open(filename.replace('.npz', '.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    arrays = {}
+    for s in stats:
+        arrays[f"hist_{s.layer_id}"] = s.hist
+        arrays[f"row_norms_{s.layer_id}"] = np.concatenate(s.row_norms) if s.row_norms else np.zeros(0, dtype=np.float32)
+    np.savez_compressed(filename, hist_edges=edges, **arrays)
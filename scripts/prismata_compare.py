@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+
+from lib.compare import build_compare_bundle
+from lib.fingerprint import manifest_models
+
+def crystal_name(path):
+    """'public/crystals/gpt2/structure_layers.ply' -> 'gpt2_structure_layers'."""
+    parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return f"{parent}_{os.path.splitext(os.path.basename(path))[0]}"
+
+def manifest_entries(output, sources, names, root):
+    """[(model id in <root>/crystals/manifest.json or None, crystal entry loading one half of the bundle)] per source."""
+    models = manifest_models(root)
+    relative = lambda path: os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, '/')
+    entries = []
+    for model, source in enumerate(sources):
+        other = names[1 - model]
+        entries.append((models.get(relative(source)), {
+            'id': f"compare_{other}", 'name': f"VS {other}", 'file': relative(output),
+            'desc': f"Aligned with {other}; load the other half in the Compare viewer.", 'bundleModel': model}))
+    return entries
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Align two crystals offline and write one compact bundle for Compare Mode.")
+    parser.add_argument('a', help="Reference crystal PLY (its orientation is kept)")
+    parser.add_argument('b', help="Crystal aligned onto the reference")
+    parser.add_argument('-o', '--output', default=None, help="Default: compare_<a>__<b>.ply")
+    parser.add_argument('--points', type=int, default=20000, help="Shared point budget (split evenly between the two models)")
+    parser.add_argument('--links', type=int, default=32, help="Correspondence edges per depth-matched layer pair")
+    parser.add_argument('--root', default='public', help="Directory holding crystals/manifest.json (its file paths are relative to it)")
+    args = parser.parse_args()
+
+    names = [crystal_name(args.a), crystal_name(args.b)]
+    output = args.output or f"compare_{names[0]}__{names[1]}.ply"
+    print(f"⚖️  Aligning {names[1]} onto {names[0]}...")
+    info = build_compare_bundle(args.a, args.b, output, names, args.points, args.links)
+    if info['residual'] is None:
+        print("   ⚠️  Layer centroids sit at the origin (per-layer projection?): planes left unaligned.")
+    else:
+        print(f"   ↳ Procrustes on layer centroids: residual {info['residual']:.2f}{' (reflected)' if info['reflected'] else ''}")
+    print(f"   ↳ Points {info['source_points'][0]} + {info['source_points'][1]} -> {info['points'][0]} + {info['points'][1]}, {info['links']} correspondence edges")
+    size = os.path.getsize(output)
+    sources = os.path.getsize(args.a) + os.path.getsize(args.b)
+    print(f"✨ Saved: {output} ({size / 2**20:.1f} MB, was {sources / 2**20:.1f} MB in two files)")
+    print("📋 Manifest entries (add each to the `crystals` of its model in manifest.json):")
+    for model_id, entry in manifest_entries(output, [args.a, args.b], names, args.root):
+        print(f"   ↳ {model_id or '<model id>'}: {json.dumps(entry)}")
@@ -0,0 +1,30 @@
+import argparse
+import sys
+from plyfile import PlyData, PlyElement
+
+from lib.consolidate import consolidate, MAX_CELL
+from lib.plyio import write_ascii_ply
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge points that share a voxel in an existing crystal (fewer vertices, same look at normal zoom).")
+    parser.add_argument('input', help="Crystal PLY, e.g. public/crystals/gpt2/structure_solid.ply")
+    parser.add_argument('-o', '--output', default=None, help="Default: <input>_consolidated.ply")
+    parser.add_argument('--ratio', type=float, default=4.0, help="Target reduction in vertex count")
+    parser.add_argument('--cell', type=float, default=None, help="Fixed voxel size instead of the adaptive one")
+    parser.add_argument('--max-cell', type=float, default=MAX_CELL, help="Largest voxel the adaptive grid may use")
+    args = parser.parse_args()
+
+    ply = PlyData.read(args.input)
+    if 'edge' not in ply:
+        print(f"{args.input} has no edge element.")
+        sys.exit(1)
+    vertex, edges = ply['vertex'].data, ply['edge'].data
+    merged_vertex, merged_edges, cell = consolidate(vertex, edges, args.ratio, args.cell, args.max_cell)
+    output = args.output or args.input.replace('.ply', '_consolidated.ply')
+    if ply.text:
+        write_ascii_ply(output, merged_vertex, merged_edges)
+    else:
+        PlyData([PlyElement.describe(merged_vertex, 'vertex'), PlyElement.describe(merged_edges, 'edge')]).write(output)
+    print(f"   ↳ {len(vertex)} -> {len(merged_vertex)} vertices ({len(vertex) / len(merged_vertex):.1f}x), "
+          f"{len(edges)} -> {len(merged_edges)} edges, voxel {cell:.4f}")
+    print(f"✨ Saved: {output}")
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from lib.fingerprint import FAMILIES, fingerprint_file, load_index, query_index, update_index
+
+def collect_crystals(inputs, root):
+    """{name relative to root (forward slashes, as in manifest.json): local path} for every crystal PLY."""
+    files = {}
+    for item in inputs:
+        paths = [item] if os.path.isfile(item) else [
+            os.path.join(d, f) for d, _, names in os.walk(item) for f in names]
+        for path in paths:
+            if path.lower().endswith('.ply'):
+                files[os.path.relpath(path, root).replace(os.sep, '/')] = path
+    return files
+
+def build(args):
+    # The index sits next to manifest.json, whose crystal paths are relative to the directory above it
+    root = args.root or os.path.dirname(os.path.dirname(os.path.abspath(args.index)))
+    files = collect_crystals(args.inputs, root)
+    if not files:
+        print("No crystals found.")
+        return 1
+    start = time.perf_counter()
+    print(f"🧬 Fingerprinting {len(files)} crystals from {', '.join(args.inputs)}...")
+    index, stats = update_index(args.index, files, root, full=args.full)
+    print(f"   ↳ {stats['computed']} computed, {stats['unchanged']} unchanged, {stats['removed']} removed "
+          f"in {time.perf_counter() - start:.2f}s ({len(index['entries'])} crystals, {sum(FAMILIES.values())} values each)")
+    print(f"✨ Saved: {args.index}")
+    return 0
+
+def resolve(index, query):
+    """(descriptors [Q, D], models to exclude, label) for a PLY path, an index entry, a model id or a unique name fragment."""
+    entries = index['entries']
+    if query.lower().endswith('.ply') and os.path.isfile(query):
+        vector, _ = fingerprint_file(query)
+        return vector[None], set(), query
+    if query in entries:
+        return np.array([entries[query]['vector']]), {entries[query]['model']}, query
+    names = [n for n, e in entries.items() if e['model'] == query] or [n for n in entries if query in n]
+    models = {entries[n]['model'] for n in names}
+    if len(models) != 1:
+        hint = f": {', '.join(sorted(models))}" if models else ""
+        raise ValueError(f"'{query}' matches {len(models)} models in the index{hint}")
+    return np.array([entries[n]['vector'] for n in names]), models, f"{next(iter(models))} ({len(names)} crystals)"
+
+def similar(args):
+    start = time.perf_counter()
+    index = load_index(args.index)
+    if not index['entries']:
+        print(f"No index at {args.index}. Run: prismata_index.py build public/crystals")
+        return 1
+    try:
+        queries, exclude, label = resolve(index, args.query)
+    except ValueError as e:
+        print(e)
+        return 1
+    results = query_index(index, queries, args.k, exclude, per_model=not args.crystals)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"🔎 Most similar to {label} ({len(index['entries'])} crystals, {elapsed:.1f} ms):")
+    for rank, (distance, name, entry, parts) in enumerate(results, 1):
+        breakdown = ", ".join(f"{family} {value:.2f}" for family, value in parts.items())
+        print(f"   {rank:>2}. {distance:5.2f}  {entry['model']:<14} {name}  ({breakdown})")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint crystals into one index and find structurally similar models.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help="Create or incrementally update the index (only new or changed crystals are read)")
+    p.add_argument('inputs', nargs='*', default=['public/crystals'], help="Crystal PLYs or directories (default: public/crystals)")
+    p.add_argument('--index', default='public/crystals/fingerprints.json', help="Index file, next to manifest.json by default")
+    p.add_argument('--root', default=None, help="Entry names are relative to this (default: the index's parent directory, so they match manifest.json)")
+    p.add_argument('--full', action='store_true', help="Recompute every fingerprint")
+    p.set_defaults(func=build)
+
+    p = sub.add_parser('similar', help="Nearest crystals to a model id, an indexed crystal or any PLY file")
+    p.add_argument('query', help="Model id from manifest.json (gpt2), index entry (crystals/gpt2/structure_layers.ply) or a PLY path")
+    p.add_argument('--k', type=int, default=5, help="Results to list")
+    p.add_argument('--crystals', action='store_true', help="List every close crystal instead of each model's closest one")
+    p.add_argument('--index', default='public/crystals/fingerprints.json')
+    p.set_defaults(func=similar)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
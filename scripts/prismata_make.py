@@ -1,84 +1,346 @@
 import argparse
+import os
 import sys
-import numpy as np
-from sklearn.decomposition import PCA
-from plyfile import PlyData, PlyElement
-from transformers import AutoModel
 
-from lib.models import SimpleAlexNet, SimpleDeepSeekMOE, SimpleVGG16, SimplePerceptron, SimpleInception, SimpleGPT4, SimpleGemini3, SimpleKimiK2, SimpleClaude35, SimplePhi35, SimpleWord2Vec, SimpleNemotron, SimpleHypercube, get_model_structure
-from lib.extractors import extract_weights, get_activations
-from lib.rendering import get_color
+from lib.options import PIPELINE_PROJECTORS, PROJECTORS, CORPUS_STATS, DRIFT_STATS, parse_layer_range, selected_layers, parse_size, parse_experts
+from lib.headers import is_checkpoint, find_attention_layers, find_moe_layers, find_embedding_key, find_block_layers
+from lib.estimate import estimate_build, print_estimate
+
+MODES = ['default', 'layers', 'heads', 'activation', 'attention', 'latency', 'embedding', 'diff', 'attribution', 'parts']
+
+def layer_tag(layers):
+    """'24:32' -> '_L24-32', '::4' -> '_L0-end_s4' (file name suffix of a --layers crystal)."""
+    if not layers:
+        return ""
+    r = parse_layer_range(layers)
+    stride = f"_s{r.step}" if r.step and r.step != 1 else ""
+    return f"_L{r.start if r.start is not None else 0}-{r.stop if r.stop is not None else 'end'}{stride}"
+
+def sample_tag(full_block, step, precision):
+    """'_full_s4_float16' style suffix naming the sampled rows behind a stats sidecar ('' for the attention / --step 2 / float32 defaults)."""
+    return f"{'_full' if full_block else ''}{f'_s{step}' if step != 2 else ''}{f'_{precision}' if precision != 'float32' else ''}"
+
+def output_filename(model_name, mode, text, image_path, corpus=None, images=None, layers=None, full_block=False):
+    # Custom filename based on input; a --block full crystal is tagged '_full' like its stats sidecar (see sample_tag)
+    prefix, tag = model_name.replace('/', '_'), f"{'_full' if full_block else ''}{layer_tag(layers)}"
+    if mode in ('activation', 'attention', 'attribution'):
+        if corpus and mode == 'activation':
+            clean_name = corpus.split("/")[-1].replace('.', '_')
+            return f"{prefix}_{mode}_corpus_{clean_name}{tag}.ply"
+        if images and mode == 'activation':
+            clean_name = os.path.basename(os.path.normpath(images)).replace('.', '_')
+            return f"{prefix}_{mode}_images_{clean_name}{tag}.ply"
+        if image_path:
+            clean_name = image_path.split("/")[-1].replace('.', '_')
+            return f"{prefix}_{mode}_{clean_name}{tag}.ply"
+        clean_text = "".join(x for x in text if x.isalnum())[:15]
+        return f"{prefix}_{mode}_{clean_text}{tag}.ply"
+    return f"{prefix}_{mode}{tag}.ply"
+
+def extract_and_crystallize(model_name='bert-base-uncased', *, step=2, mode='layers', text="The future is vast and infinite", image_path=None, precision='float32', projector='pca', experts='2', memory_budget=None, corpus=None, corpus_stat='mean', batch_size=16, top_k=8, samples=16384, seq_len=128, runs=5, warmup=2, base=None, drift='cosine', images=None, per_class=False, workers=4, consolidate=None, layers=None, target=None, stats=True, pipeline=False, block='attention'):
+    # The build needs torch, transformers and sklearn (seconds to import): loaded here, so --dry-run and argument
+    # errors answer without them
+    import numpy as np
+    import scipy.sparse as sp
+    from lib.models import MOCK_MODELS, build_mock, get_model_structure, load_hf_model
+    from lib.extractors import extract_weights, get_activations, row_magnitudes, as_csr, CHUNK_ROWS
+    from lib.lattice import layer_positions, layer_edges, layer_colors, tag_dtype, fill_tags
+    from lib.plyio import ascii_rows, write_ascii_ply
+    from lib.projection import project
+    from lib.moe import open_moe_checkpoint, check_experts, load_moe_layers, iter_moe_layers
+    from lib.checkpoints import Checkpoint, iter_checkpoint_layers, chunk_bytes
+    from lib.quantized import describe_quantized
+    from lib.outofcore import crystallize_out_of_core
+    from lib.corpus import corpus_activation_stats, save_corpus_stats
+    from lib.attention import get_attention_links, head_cluster_edges
+    from lib.embeddings import crystallize_embeddings, model_embedding_table
+    from lib.profiling import profile_layers, layer_heat, save_latency
+    from lib.diff import crystallize_diff
+    from lib.images import image_activations, save_image_intensities
+    from lib.consolidate import fit_cell, voxel_groups, remap_edges, consolidate_vertex
+    from lib.attribution import get_attributions, normalize_attributions, save_attributions
+    from lib.weightstats import layer_stats, projection_explained, save_weight_stats
+    from lib.pipeline import crystallize_pipelined
+    from lib.blocks import index_model_blocks, extract_block, iter_checkpoint_blocks
 
-def extract_and_crystallize(model_name='bert-base-uncased', step=2, mode='layers', text="The future is vast and infinite", image_path=None):
     print(f"💎 Loading universal model: {model_name}...")
+    # Several coloring modes ('default,layers,heads') share one load, one projection and one geometry
+    modes = list(mode) if isinstance(mode, (list, tuple)) else [m.strip() for m in mode.split(',') if m.strip()]
+    for own in ('embedding', 'diff'):
+        if own in modes and len(modes) > 1:
+            print(f"   ⚠️  {own.capitalize()} crystals have their own geometry. Run --mode {own} on its own; skipping it here.")
+            modes = [m for m in modes if m != own]
+    dtype = np.dtype(precision)
+    # Embedding crystals use a randomized projection unless a backend was picked explicitly
+    projector = projector or ('randomized' if modes == ['embedding'] else 'pca')
+    budget = parse_size(memory_budget) if memory_budget else None
+    # --layers start:stop:stride: only the selected blocks are loaded, hooked, extracted and projected
+    layer_range = parse_layer_range(layers) if layers else None
+    if layer_range is not None and modes in (['diff'], ['embedding']):
+        print(f"   ⚠️  --layers does not apply to {modes[0]} crystals; using the whole model.")
+        layer_range = layers = None
+    needs_forward = any(m in modes for m in ('activation', 'attention', 'latency', 'attribution'))
+    # Full blocks: attention q/k/v/o, MLP and every convolution of each block, tagged per vertex (colored by `parts`)
+    full_block = block == 'full' or 'parts' in modes
+
+    # Fine-tune drift: both checkpoints are streamed layer by layer, nothing is instantiated
+    if modes == ['diff']:
+        if not base or not is_checkpoint(base) or not is_checkpoint(model_name):
+            print("Diff mode compares two local safetensors checkpoints: prismata_make.py <fine-tune> --mode diff --base <base>")
+            return
+        filename = output_filename(model_name, 'diff', text, image_path)
+        if crystallize_diff(base, model_name, filename, step, dtype, drift):
+            print(f"✨ Saved: {filename} (+ _base.ply in the same basis, drift in .npz)")
+        return
+
+    # Local checkpoints: the embedding table is read memory-mapped, the model is never instantiated
+    if modes == ['embedding'] and is_checkpoint(model_name):
+        ckpt = Checkpoint(model_name)
+        key = find_embedding_key(ckpt)
+        if key is None:
+            print(f"No token embedding table found in {model_name}.")
+            return
+        print(f"   ↳ Reading '{key}' {ckpt.shape(key)} memory-mapped from safetensors.")
+        filename = output_filename(model_name, 'embedding', text, image_path)
+        if crystallize_embeddings(ckpt.slice(key), model_name, filename, samples, projector, dtype, budget):
+            print(f"✨ Saved: {filename}")
+        return
+
+    # Local MoE checkpoints are read tensor by tensor from the safetensors shards
+    moe_ckpt = open_moe_checkpoint(model_name)
+    if moe_ckpt is not None:
+        try:
+            check_experts(moe_ckpt, experts) # explicit ids against the router size, known once the headers are read
+        except ValueError as e:
+            sys.exit(str(e))
+    # Out-of-core and pipelined builds of local dense checkpoints stream attention (or full block) tensors from
+    # the shards too, and so do builds that need no forward pass when they select layers (only the selected tensors
+    # are read) or the checkpoint is quantized (only the sampled rows are unpacked and dequantized)
+    stream_ckpt, stream_layers, keep, attribution_model = None, [], None, None
+    ckpt = Checkpoint(model_name) if moe_ckpt is None and is_checkpoint(model_name) else None
+    if ckpt is not None and (memory_budget or pipeline or (not needs_forward and (layer_range is not None or ckpt.quantized))):
+        stream_ckpt = ckpt
+        stream_layers = [l[0] for l in (find_block_layers(stream_ckpt) if full_block else find_attention_layers(stream_ckpt))]
+        if not stream_layers:
+            stream_ckpt = None
+    elif ckpt is not None and ckpt.quantized:
+        print(f"   ⚠️  Quantized checkpoint ({describe_quantized(ckpt.quantized)}): forward modes load it with from_pretrained, "
+              "which needs its quantization backend. Weight-only modes read it directly.")
     try:
-        if model_name == 'alexnet':
-            model = SimpleAlexNet()
-            print("   ⚠️  Using manually defined AlexNet (Untrained/Random Weights) as torchvision is unavailable.")
-        elif model_name == 'deepseek':
-            model = SimpleDeepSeekMOE()
-            print("   ⚠️  Using manually defined DeepSeek-V3 MoE (Sparse Mock) to visualize MoE Structure without 600GB download.")
-        elif model_name == 'vgg16':
-            model = SimpleVGG16()
-            print("   ⚠️  Using manually defined VGG-16 (Untrained).")
-        elif model_name == 'perceptron':
-            model = SimplePerceptron()
-            print("   ⚠️  Using manually defined Perceptron (1958).")
-        elif model_name == 'inception':
-            model = SimpleInception()
-            print("   ⚠️  Using manually defined Inception-v1/GoogLeNet (Mock).")
-
-        elif model_name == 'hypercube':
-            model = SimpleHypercube()
-            print("   ⚠️  Using manually defined 6D Hypercube (Concept).")
-
-        elif model_name == 'gpt4':
-            model = SimpleGPT4()
-            print("   ⚠️  Using manually defined GPT-4 (Mock MoE).")
-        elif model_name == 'gemini3':
-            model = SimpleGemini3()
-            print("   ⚠️  Using manually defined Gemini 3.0 (Mock Omni).")
-        elif model_name == 'kimik2':
-            model = SimpleKimiK2()
-            print("   ⚠️  Using manually defined Kimi k2 (Simulated Rail).")
-        elif model_name == 'claude35':
-            model = SimpleClaude35()
-            print("   ⚠️  Using manually defined Claude 3.5 (Simulated Artifact).")
-        elif model_name == 'phi35':
-            model = SimplePhi35()
-            print("   ⚠️  Using manually defined Phi 3.5 (Simulated - Download Failed).")
-        elif model_name == 'word2vec':
-            model = SimpleWord2Vec()
-            print("   ⚠️  Using manually defined Word2Vec (2013).")
+        if moe_ckpt is not None:
+            model = None
+            print(f"   ↳ MoE checkpoint: reading routers + experts [{experts}] per layer from safetensors (model not instantiated).")
+            if full_block:
+                print("   ⚠️  Full-block extraction does not apply to MoE checkpoints; crystallizing the selected experts.")
+            if layer_range is not None:
+                keep = selected_layers(max(info['layer'] for info in find_moe_layers(moe_ckpt)) + 1, layer_range)
+        elif stream_ckpt is not None:
+            model = None
+            print(f"   ↳ Streaming {'full block' if full_block else 'attention'} weights layer by layer from safetensors (model not instantiated).")
+            if stream_ckpt.quantized:
+                print(f"   ↳ Quantized ({describe_quantized(stream_ckpt.quantized)}): unpacking and dequantizing only the sampled rows.")
+            if layer_range is not None:
+                keep = selected_layers(max(stream_layers) + 1, layer_range)
+        elif model_name in MOCK_MODELS:
+            model = build_mock(model_name, layer_range)
+            print(f"   ⚠️  {MOCK_MODELS[model_name][2]}")
         else:
-            model = AutoModel.from_pretrained(model_name)
+            # Attribution needs the LM / classification head for its target logit; everything else uses the block stack
+            head = ('image' if image_path else 'text') if 'attribution' in modes else None
+            model, keep = load_hf_model(model_name, layer_range, head)
+            if head:
+                attribution_model, model = model, model.base_model
     except Exception as e:
         print(f"Error loading model '{model_name}': {e}")
         return
+    if layer_range is not None:
+        if keep is None:
+            keep = selected_layers(len(get_model_structure(model)), layer_range)
+        if not keep:
+            print(f"--layers {layers} selects no block.")
+            return
+        print(f"   ↳ Keeping {len(keep)} blocks ({keep[0]}-{keep[-1]}{f', every {keep.step}' if keep.step > 1 else ''}) for --layers {layers}")
+
+    if modes == ['embedding']:
+        table = model_embedding_table(model) if model is not None else None
+        if table is None:
+            print("No token embedding table found. Is this a language model?")
+            return
+        filename = output_filename(model_name, 'embedding', text, image_path)
+        tokenizer_name = model_name if hasattr(model, 'config') else None # mocks have no tokenizer
+        if crystallize_embeddings(table.detach(), model_name, filename, samples, projector, dtype, budget, tokenizer_name=tokenizer_name):
+            print(f"✨ Saved: {filename}")
+        return
 
     # If doing MRI scan, get the thoughts first
-    layer_activations = {}
-    if mode == 'activation':
-        layer_activations = get_activations(model, model_name, text, image_path)
+    layer_activations, per_image = {}, {}
+    if 'activation' in modes:
+        if model is None:
+            print("   ⚠️  Activation mode needs an instantiated model. Skipping the forward pass.")
+        elif corpus:
+            # Corpus heatmap: per-neuron statistics over every token of the corpus, not one sentence
+            corpus_stats = corpus_activation_stats(model, model_name, corpus, batch_size, layers=keep)
+            corpus_file = output_filename(model_name, 'activation', text, image_path, corpus, layers=layers).replace('.ply', '.npz')
+            save_corpus_stats(corpus_stats, corpus_file)
+            print(f"   ↳ Saved corpus statistics: {corpus_file} (heatmap uses '{corpus_stat}')")
+            layer_activations = {i: s.get(corpus_stat) for i, s in corpus_stats.items()}
+        elif images:
+            # Image directory: batched forward passes, the heatmap is the mean over all images
+            image_names, image_classes, per_image = image_activations(model, model_name, images, batch_size, workers, layers=keep)
+            layer_activations = {i: a.mean(axis=0) for i, a in per_image.items()}
+        else:
+            layer_activations = get_activations(model, model_name, text, image_path, layers=keep)
+
+    # Attention crystals: top-k links per query, captured without ever building [Seq, Seq]
+    attention_links, n_heads, n_tokens = None, 0, 0
+    if 'attention' in modes:
+        if model is None or not hasattr(model, 'config'):
+            print("   ⚠️  Attention mode needs a Hugging Face transformer. Falling back to the ring lattice.")
+        else:
+            attention_links, n_heads, n_tokens = get_attention_links(model, model_name, text, top_k, layers=keep)
+            links_file = output_filename(model_name, 'attention', text, image_path, layers=layers).replace('.ply', '_links.npz')
+            np.savez_compressed(links_file, seq_len=n_tokens, n_heads=n_heads, **attention_links.arrays())
+            print(f"   ↳ Saved attention links: {links_file}")
 
-    print(f"💎 Extracting layers and growing crystal lattice for {model_name} [Mode: {mode}]...")
+    # Latency crystals: per-block forward time, allocations and output size as a hot-spot map
+    layer_latency = {}
+    if 'latency' in modes:
+        if model is None:
+            print("   ⚠️  Latency mode needs an instantiated model. Skipping the profile.")
+        else:
+            profile = profile_layers(model, batch_size, seq_len, warmup, runs, layers=keep)
+            profile['model'] = model_name
+            latency_file = output_filename(model_name, 'latency', text, image_path, layers=layers).replace('.ply', '.json')
+            save_latency(profile, latency_file)
+            print(f"   ↳ Saved timings: {latency_file}")
+            layer_latency = layer_heat(profile)
+
+    # Attribution crystals: gradient x activation per sampled channel from one backward pass (checkpointed blocks)
+    layer_attribution = {}
+    if 'attribution' in modes:
+        if attribution_model is None:
+            print("   ⚠️  Attribution mode needs a Hugging Face model. Skipping the backward pass.")
+        else:
+            scores, info = get_attributions(attribution_model, model_name, text, image_path, target, step, keep)
+            attribution_file = output_filename(model_name, 'attribution', text, image_path, layers=layers).replace('.ply', '.npz')
+            save_attributions(scores, info, attribution_file, step, text, image_path)
+            print(f"   ↳ Saved attribution scores: {attribution_file}")
+            layer_attribution = normalize_attributions(scores)
+
+    print(f"💎 Extracting layers and growing crystal lattice for {model_name} [Mode: {', '.join(modes)}]...")
     
     all_layer_data = []
-    layers = get_model_structure(model)
+    # Sub-module tensors of every block, resolved once from the parameter names (--block full)
+    block_index = index_model_blocks(get_model_structure(model)) if full_block and model is not None else None
+
+    def extract_layer(layer_idx, block):
+        """(sampled slice, per-vertex tag record or None) of one block; slice None for an unknown architecture."""
+        if block_index is not None:
+            return extract_block(block_index[layer_idx], step, dtype)
+        return extract_weights(block, step=step, dtype=dtype), None
+    n_comps = 3 if model_name == 'hypercube' else 2
+    sampled_full = full_block and moe_ckpt is None # MoE checkpoints always sample the selected experts
+    outputs = {mode: output_filename(model_name, mode, text, image_path, corpus, images, layers, sampled_full) for mode in modes}
+    # Weight statistics sidecar (.json + .npz), accumulated while each sampled layer is streamed anyway.
+    # Named after the sampled rows (block, step, precision), so builds sampling other rows keep their own
+    stats_file = output_filename(model_name, 'stats' + sample_tag(sampled_full, step, precision), text, image_path, layers=layers).replace('.ply', '.npz') if stats else None
+    stats_meta = {'model': model_name, 'step': step, 'precision': precision, 'block': 'full' if sampled_full else 'attention',
+                  'projector': projector, 'components': n_comps, 'layers': layers}
+
+    if memory_budget or pipeline:
+        build = 'pipelined' if pipeline else 'out-of-core'
+        if consolidate:
+            print(f"   ⚠️  --consolidate needs every position in memory; the {build} crystal is written unconsolidated.")
+        if per_image:
+            print("   ⚠️  Per-image intensities are only written by the in-memory build; the crystal shows the mean over all images.")
+        if attention_links is not None:
+            print(f"   ⚠️  Attention links are only drawn by the in-memory build; the {build} crystal keeps the ring lattice.")
+        # Out-of-core: one layer at a time -> scratch spill -> streaming projection -> binary PLY
+        # Pipelined: the same layer stream, read twice (fit, then extract -> project -> write concurrently)
+        unknown = set() # blocks already reported (the pipelined build reads the stream twice)
+        def iter_layers(alloc=None):
+            if moe_ckpt is not None:
+                for layer in iter_moe_layers(moe_ckpt, experts, step, dtype, keep):
+                    yield layer['layer'], layer.pop('weights'), layer
+            elif stream_ckpt is not None and full_block:
+                yield from iter_checkpoint_blocks(stream_ckpt, step, dtype, keep)
+            elif stream_ckpt is not None:
+                for layer_idx, data_slice in iter_checkpoint_layers(stream_ckpt, step, dtype, keep, alloc):
+                    yield layer_idx, data_slice, None
+            else:
+                for layer_idx, block in enumerate(get_model_structure(model)):
+                    if keep is not None and layer_idx not in keep:
+                        continue
+                    data_slice, tags = extract_layer(layer_idx, block)
+                    if data_slice is None:
+                        if layer_idx not in unknown:
+                            print(f"Warning: Could not extract weights from layer {layer_idx} (Unknown architecture).")
+                            unknown.add(layer_idx)
+                        continue
+                    yield layer_idx, data_slice, tags
+
+        if pipeline:
+            if memory_budget:
+                print("   ↳ --pipeline keeps only a few layers resident; --memory-budget's spill is not used.")
+            saved = crystallize_pipelined(iter_layers, outputs, n_comps, step, layer_activations, projector, workers,
+                                          layer_latency=layer_latency, layer_attribution=layer_attribution, stats_file=stats_file, stats_meta=stats_meta)
+        else:
+            if stream_ckpt is not None and moe_ckpt is None and not full_block:
+                floor = max((chunk_bytes(stream_ckpt, names, conv1d) for layer, names, conv1d in find_attention_layers(stream_ckpt)
+                             if keep is None or layer in keep), default=0)
+                if floor > budget:
+                    print(f"   ⚠️  One {CHUNK_ROWS}-row read of the widest tensor takes {floor / 2**20:.0f} MB: "
+                          f"peak memory will exceed --memory-budget {memory_budget}.")
+            saved = crystallize_out_of_core(iter_layers, outputs, budget, n_comps, step, layer_activations, projector, layer_latency=layer_latency, layer_attribution=layer_attribution, stats_file=stats_file, stats_meta=stats_meta)
+        if saved:
+            for filename in outputs.values():
+                print(f"✨ Saved: {filename} (binary)")
+            if stats_file:
+                print(f"✨ Saved: {stats_file.replace('.npz', '.json')} (+ .npz histograms and row norms)")
+        return
     
     # 1. Collect all raw data
-    for layer_idx, block in enumerate(layers):
-        weights = extract_weights(block)
-        if weights is not None:
-            # We sample with 'step' to reduce density
-            data_slice = weights[::step]
+    # We sample with 'step' to reduce density. The extractor picks the sampled rows
+    # before any concatenation, so each entry is only as big as its slice (or a view).
+    # layer_ids[i] is the get_model_structure index of crystal layer i (blocks without weights,
+    # e.g. ReLU / pooling in CNNs, are skipped, but activations and timings are keyed by block)
+    # layer_tags[i]: per-vertex tag record of crystal layer i (MoE experts, full-block sub-modules) or None
+    if moe_ckpt is not None:
+        moe_layers = load_moe_layers(moe_ckpt, experts, step, dtype, keep)
+        all_layer_data = [layer['weights'] for layer in moe_layers]
+        layer_ids = [layer['layer'] for layer in moe_layers]
+        layer_tags = moe_layers
+    elif stream_ckpt is not None and full_block:
+        layer_ids, layer_tags = [], []
+        for layer_idx, data_slice, tags in iter_checkpoint_blocks(stream_ckpt, step, dtype, keep):
             all_layer_data.append(data_slice)
-        else:
-            print(f"Warning: Could not extract weights from layer {layer_idx} (Unknown architecture).")
+            layer_ids.append(layer_idx)
+            layer_tags.append(tags)
+    elif stream_ckpt is not None:
+        layer_ids = []
+        for layer_idx, data_slice in iter_checkpoint_layers(stream_ckpt, step, dtype, keep):
+            all_layer_data.append(data_slice)
+            layer_ids.append(layer_idx)
+        layer_tags = [None] * len(layer_ids)
+    else:
+        layer_ids, layer_tags = [], []
+        for layer_idx, block in enumerate(get_model_structure(model)):
+            if keep is not None and layer_idx not in keep:
+                continue
+            data_slice, tags = extract_layer(layer_idx, block)
+            if data_slice is not None:
+                all_layer_data.append(data_slice)
+                layer_ids.append(layer_idx)
+                layer_tags.append(tags)
+            else:
+                print(f"Warning: Could not extract weights from layer {layer_idx} (Unknown architecture).")
             
     if not all_layer_data: 
         print("No data extracted. Is this model supported?")
         return
+    # One chunked pass per layer: sparsity, min/max, row norms, histogram and the sums for explained variance
+    weight_stats = [layer_stats(data, layer_id) for data, layer_id in zip(all_layer_data, layer_ids)] if stats_file else None
+    explained = None
 
     # 2. PCA Strategy
     use_global_pca = False
@@ -86,14 +348,16 @@ def extract_and_crystallize(model_name='bert-base-uncased', step=2, mode='layers
     
     try:
         # Try Global PCA (Best for Transformers)
-        full_matrix = np.vstack(all_layer_data)
-        
-        # Determine PCA components based on model type
-        n_comps = 3 if model_name == 'hypercube' else 2
+        # Sparse layers (MoE / masked) stay CSR all the way into the projection
+        if any(sp.issparse(d) for d in all_layer_data):
+            full_matrix = sp.vstack([as_csr(d) for d in all_layer_data], format='csr')
+        else:
+            full_matrix = np.vstack(all_layer_data)
         
-        print(f"   ↳ Compressing {full_matrix.shape} dimensions (Global PCA {n_comps}D)...")
-        pca = PCA(n_components=n_comps)
-        projected_matrix = pca.fit_transform(full_matrix)
+        print(f"   ↳ Compressing {full_matrix.shape} dimensions (Global {projector.upper()} {n_comps}D)...")
+        projected_matrix = project(full_matrix, n_comps, projector)
+        if weight_stats:
+            explained = projection_explained(weight_stats, projected_matrix)
         
         # Normalize Global
         max_val = np.max(np.abs(projected_matrix))
@@ -105,130 +369,206 @@ def extract_and_crystallize(model_name='bert-base-uncased', step=2, mode='layers
         print("   ⚠️  Layer dimensions mismatch (likely CNN/ResNet). Switching to Per-Layer PCA mode...")
         use_global_pca = False
 
-    points, colors, edges = [], [], []
-    # Note: points_per_layer might vary in ResNet if not using global PCA.
-    # If global PCA is used, all_layer_data[0].shape[0] is representative.
-    # If not, current_points_count will be used per layer.
-    if use_global_pca and all_layer_data:
-        points_per_layer = all_layer_data[0].shape[0] 
-    else:
-        points_per_layer = 0 # Will be determined per layer
-
     total_layers = len(all_layer_data)
     
-    print(f"   ↳ Constructing {mode.upper()} Lattice...")
+    print(f"   ↳ Constructing {', '.join(m.upper() for m in modes)} Lattice...")
 
     # 3. Build the Crystal
+    # Geometry and edges are shared by every coloring mode, so they are built once;
+    # each mode then only costs one vectorized color pass.
+    positions, layer_magnitudes, counts, offsets = [], [], [], []
     global_point_offset = 0
-    
-    for layer_idx in range(total_layers):
-        layer_weights = all_layer_data[layer_idx]
+    for layer_idx, layer_weights in enumerate(all_layer_data):
         current_points_count = layer_weights.shape[0]
-        
-        # Determine Projection
         if use_global_pca:
-            # If global PCA was successful, all layers must have had the same number of features.
-            # So points_per_layer is constant.
-            start_idx = layer_idx * points_per_layer 
-            end_idx = start_idx + current_points_count
-            layer_projection = projected_matrix[start_idx:end_idx]
+            # Layers are stacked in order, so each layer is the next block of projected rows
+            layer_projection = projected_matrix[global_point_offset:global_point_offset + current_points_count]
         else:
             # Per-Layer PCA
-            pca = PCA(n_components=2)
-            layer_projection = pca.fit_transform(layer_weights)
+            layer_projection = project(layer_weights, 2, projector)
+            if weight_stats:
+                weight_stats[layer_idx].capture(layer_projection)
             # Normalize Local
             mx = np.max(np.abs(layer_projection))
             if mx > 0: layer_projection /= mx
-            
-        # Get activations for this layer if needed
-        current_layer_acts = None
-        if mode == 'activation':
-            current_layer_acts = layer_activations.get(layer_idx, np.zeros(current_points_count)) # Fallback size might be wrong for ResNet
-            if isinstance(current_layer_acts, (float, int, np.float32, np.float64)):
-                 current_layer_acts = np.zeros(1) # dummy
-
-        for i, point_data in enumerate(layer_projection):
-            if len(point_data) == 3:
-                x, y, z_pca = point_data
-                # For Hypercube, we want full 3D rotation, not flattened layers
-                points.append((x*2.0, y*2.0, z_pca*2.0)) 
-            else:
-                x, y = point_data
-                z = layer_idx * 0.15 
-                points.append((x*1.5, z, y*1.5)) # Scale up slightly for visibility
-            
-            # COLOR LOGIC
-            weight_magnitude = np.mean(np.abs(layer_weights[i]))
-            
-            original_neuron_idx = i * step
-            
-            act_val = 0
-            if mode == 'activation' and current_layer_acts is not None:
-                if original_neuron_idx < current_layer_acts.shape[0]:
-                    act_val = current_layer_acts[original_neuron_idx]
+        # For Hypercube (3 components) we want full 3D rotation, not flattened layers
+        positions.append(layer_positions(layer_projection, layer_idx))
+        layer_magnitudes.append(row_magnitudes(layer_weights))
+        counts.append(current_points_count)
+        offsets.append(global_point_offset)
+        global_point_offset += current_points_count
+    positions = np.concatenate(positions)
 
-            r, g, b = get_color(mode, layer_idx, total_layers, original_neuron_idx, weight_magnitude, act_val)
-            colors.append((r, g, b))
-            
-            # Edge Logic
-            current_node_idx = global_point_offset + i
-            
-            # Horizontal Ring
-            if i > 0:
-                 edges.append((current_node_idx - 1, current_node_idx))
-            
-            # Vertical/Diagonal Connections (Only if previous layer exists)
-            # For ResNet, layer sizes change, so 1:1 connection is impossible.
-            # We connect to the "relative" position in the previous layer.
-            if layer_idx > 0:
-                prev_layer_count = all_layer_data[layer_idx-1].shape[0]
-                prev_layer_start = global_point_offset - prev_layer_count
-                
-                # Map current index 'i' (0..N) to previous index 'j' (0..M)
-                ratio = i / current_points_count
-                prev_idx_approx = int(ratio * prev_layer_count)
-                prev_idx_approx = min(prev_idx_approx, prev_layer_count - 1) # Clamp
-                prev_node_idx = prev_layer_start + prev_idx_approx
-                
-                edges.append((prev_node_idx, current_node_idx))
-                # Diagonal skin
-                if prev_idx_approx > 0:
-                    edges.append((prev_layer_start + prev_idx_approx - 1, current_node_idx))
-                if prev_idx_approx < prev_layer_count - 1:
-                    edges.append((prev_layer_start + prev_idx_approx + 1, current_node_idx))
+    # Ring inside each layer + vertical/diagonal skin to the relative position in the previous layer
+    # (layer sizes may differ, e.g. ResNet, so links go to the "relative" index)
+    prev_counts = [counts[i - 1] if i > 0 else 0 for i in range(total_layers)]
+    ring_edges = np.concatenate([layer_edges(offsets[i], counts[i], prev_counts[i]) for i in range(total_layers)])
 
-        global_point_offset += current_points_count
+    # Attention links replace the synthetic ring with weighted edges inside each head cluster
+    attention_info, attention_edges, attention_weights = [None] * total_layers, None, None
+    if attention_links is not None:
+        parts, weights = [], []
+        for i in range(total_layers):
+            edges_i, weights_i, received = head_cluster_edges(
+                attention_links, layer_ids[i], offsets[i], counts[i], n_heads, n_tokens, max_edges=counts[i] * top_k)
+            if received.max() > 0: received = received / received.max()
+            head_size = max(counts[i] // n_heads, 1)
+            attention_info[i] = {'heads': np.minimum(np.arange(counts[i]) // head_size, n_heads - 1), 'n_heads': n_heads, 'received': received}
+            skin = layer_edges(offsets[i], counts[i], prev_counts[i], ring=False)
+            parts += [edges_i, skin]
+            weights += [weights_i, np.zeros(len(skin), dtype=np.float32)] # 0 = structural skin
+        attention_edges, attention_weights = np.concatenate(parts), np.concatenate(weights)
 
-    # Save
-    vertex = np.array([tuple(p + c) for p, c in zip(points, colors)],
-                      dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
-    vertex_el = PlyElement.describe(vertex, 'vertex')
-    
-    edge_array = np.array(edges, dtype=[('vertex1', 'i4'), ('vertex2', 'i4')])
-    edge_el = PlyElement.describe(edge_array, 'edge')
-    
-    # Custom filename based on input
-    if mode == 'activation':
-        if image_path:
-            clean_name = image_path.split("/")[-1].replace('.', '_')
-            filename = f"{model_name.replace('/', '_')}_{mode}_{clean_name}.ply"
+    # Voxel consolidation: points sharing a grid cell become one vertex (shared by every mode, edges remapped once)
+    groups = None
+    if consolidate:
+        cell = fit_cell(positions, consolidate)
+        groups = voxel_groups(positions, cell)
+        ring_edges = remap_edges(ring_edges, groups[0])[0]
+        if attention_edges is not None:
+            attention_edges, attention_weights = remap_edges(attention_edges, groups[0], attention_weights)
+        print(f"   ↳ Consolidated {len(positions)} -> {len(groups[1])} vertices ({len(positions) / len(groups[1]):.1f}x, voxel {cell:.4f})")
+
+    # Save one PLY per mode (the ring edge block is formatted once and shared)
+    vertex_dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    vertex_dtype += tag_dtype(layer_tags)
+    ring_array = np.empty(len(ring_edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4')])
+    ring_array['vertex1'], ring_array['vertex2'] = ring_edges[:, 0], ring_edges[:, 1]
+    ring_text = None
+
+    per_mode = {'latency': layer_latency, 'attribution': layer_attribution}
+    for mode in modes:
+        use_attention = mode == 'attention' and attention_links is not None
+        colors = np.concatenate([
+            layer_colors(mode, i, total_layers, layer_magnitudes[i], step,
+                         per_mode.get(mode, layer_activations).get(layer_ids[i]),
+                         layer_tags[i], attention_info[i] if use_attention else None)
+            for i in range(total_layers)])
+
+        vertex = np.empty(len(positions), dtype=vertex_dtype)
+        vertex['x'], vertex['y'], vertex['z'] = positions[:, 0], positions[:, 1], positions[:, 2]
+        vertex['red'], vertex['green'], vertex['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+        for i in range(total_layers):
+            fill_tags(vertex[offsets[i]:offsets[i] + counts[i]], layer_tags[i])
+        if groups is not None:
+            vertex = consolidate_vertex(vertex, *groups)
+
+        filename = outputs[mode]
+        if use_attention:
+            edge_array = np.empty(len(attention_edges), dtype=[('vertex1', 'i4'), ('vertex2', 'i4'), ('weight', 'f4')])
+            edge_array['vertex1'], edge_array['vertex2'] = attention_edges[:, 0], attention_edges[:, 1]
+            edge_array['weight'] = attention_weights
+            write_ascii_ply(filename, vertex, edge_array)
         else:
-            clean_text = "".join(x for x in text if x.isalnum())[:15]
-            filename = f"{model_name.replace('/', '_')}_{mode}_{clean_text}.ply"
-    else:
-        filename = f"{model_name.replace('/', '_')}_{mode}.ply"
-        
-    PlyData([vertex_el, edge_el], text=True).write(filename) 
-    print(f"✨ Saved: {filename}")
+            if ring_text is None:
+                ring_text = ascii_rows(ring_array)
+            write_ascii_ply(filename, vertex, ring_array, ring_text)
+        print(f"✨ Saved: {filename}")
+
+    if weight_stats:
+        save_weight_stats(weight_stats, stats_file, explained, **stats_meta)
+        print(f"✨ Saved: {stats_file.replace('.npz', '.json')} (+ .npz histograms and row norms)")
+
+    if per_image:
+        intensity_file = outputs['activation'].replace('.ply', '_images.npz')
+        save_image_intensities(intensity_file, image_names, image_classes, per_image, layer_ids, counts, step, per_class, groups)
+        print(f"✨ Saved: {intensity_file} ({len(image_names)} images{', per-class means' if per_class else ''} on the same vertices)")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('model', nargs='?', default='gpt2')
     parser.add_argument('--step', type=int, default=2)
-    parser.add_argument('--mode', choices=['default', 'layers', 'heads', 'activation'], default='default', 
-                        help="Coloring mode: default, layers (rainbow), heads (structure), activation (heatmap)")
+    parser.add_argument('--mode', choices=MODES, default='default', 
+                        help="Coloring mode: default, layers (rainbow), heads (structure), activation (heatmap), attention (top-k links of --text), latency (forward-time hot spots), embedding (token table), diff (fine-tune drift vs --base), attribution (gradient x activation for --target), parts (sub-modules of --block full)")
+    parser.add_argument('--modes', type=str, default=None,
+                        help="Comma-separated modes built in one pass (one load, one projection), e.g. default,layers,heads,activation")
     parser.add_argument('--text', type=str, default="The future is vast and infinite", help="Input text for activation heatmap")
     parser.add_argument('--image', type=str, default=None, help="Input image path for CNN activation heatmap")
+    parser.add_argument('--precision', choices=['float32', 'float16'], default='float32',
+                        help="Storage dtype for sampled weights (bf16 checkpoints are converted in chunks)")
+    
+    parser.add_argument('--projector', choices=PROJECTORS, default=None,
+                        help="Projection backend: pca (exact, default), randomized (low-rank SVD, default for embedding), sketch (sparse JL + PCA)")
+    
+    parser.add_argument('--experts', type=str, default='2',
+                        help="MoE checkpoints: experts per layer, a count (top-N by router norm) or a list like 0,3,7; "
+                             "a trailing comma picks one expert by id (5, is expert 5, 5 is the top 5)")
+    
+    parser.add_argument('--memory-budget', type=str, default=None,
+                        help="Out-of-core mode with a RAM budget (e.g. 2G): spill layers to disk, stream the projection, write a binary PLY")
+    
+    parser.add_argument('--corpus', type=str, default=None,
+                        help="Activation mode over a whole local corpus (.txt one text per line, or .jsonl with a 'text' field)")
+    parser.add_argument('--corpus-stat', choices=CORPUS_STATS, default='mean', help="Corpus statistic used for the heatmap")
+    parser.add_argument('--images', type=str, default=None,
+                        help="Activation mode over a directory of images (class sub-directories allowed), one batched pass")
+    parser.add_argument('--per-class', action='store_true', help="With --images: also store per-class mean intensities")
+    parser.add_argument('--workers', type=int, default=4, help="With --images: decode/preprocess threads; with --pipeline: projection threads")
+    parser.add_argument('--batch-size', type=int, default=16, help="Batch size for corpus streaming, image batches and latency profiling")
+    parser.add_argument('--top-k', type=int, default=8, help="Attention mode: links kept per query per head")
+    parser.add_argument('--samples', type=int, default=16384, help="Embedding mode: tokens sampled (stratified over the vocabulary)")
+    parser.add_argument('--seq-len', type=int, default=128, help="Latency mode: sequence length of the synthetic input")
+    parser.add_argument('--runs', type=int, default=5, help="Latency mode: timed forward passes")
+    parser.add_argument('--warmup', type=int, default=2, help="Latency mode: untimed warm-up passes")
+    parser.add_argument('--consolidate', type=float, default=None, metavar='RATIO',
+                        help="Merge points sharing a voxel (adaptive grid aiming at RATIO x fewer vertices, adds a `count` property)")
+    parser.add_argument('--base', type=str, default=None, help="Diff mode: base checkpoint the model was fine-tuned from")
+    parser.add_argument('--drift', choices=DRIFT_STATS, default='cosine', help="Diff mode: drift measure used for colors")
+    parser.add_argument('--target', type=str, default=None,
+                        help="Attribution mode: logit to explain, a token (' Paris'), class label or index (default: the top prediction)")
+    parser.add_argument('--layers', type=str, default=None, metavar='START:STOP:STRIDE',
+                        help="Only these blocks (Python slice over the model's layers, e.g. 24:32, -8:, ::4): loaded, hooked, extracted and projected")
+    parser.add_argument('--no-stats', action='store_true',
+                        help="Skip the weight statistics sidecar (_stats.json / _stats.npz, suffixed with a non-default --block / --step / --precision: sparsity, norms, histograms, explained variance)")
+    parser.add_argument('--block', choices=['attention', 'full'], default='attention',
+                        help="Tensors per block: attention (q/k/v, or the first convolution) or full (q/k/v/o, MLP gate/up/down and every convolution, each vertex tagged with its `part`; implied by --mode parts)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Staged build: extraction, projection and binary PLY writing run concurrently, layer by layer (global basis fitted in a first pass)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only predict vertices, edges, file sizes, peak memory and time from headers/config (no weights are loaded)")
+    parser.add_argument('--json', action='store_true', help="With --dry-run: print the estimate as JSON (for schedulers)")
     
     args = parser.parse_args()
-    extract_and_crystallize(args.model, args.step, args.mode, args.text, args.image)
+    if args.modes:
+        unknown = [m for m in args.modes.split(',') if m.strip() not in MODES]
+        if unknown:
+            parser.error(f"unknown mode(s) in --modes: {', '.join(unknown)} (choose from {', '.join(MODES)})")
+    if args.layers:
+        try:
+            parse_layer_range(args.layers)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        parse_experts(args.experts)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.memory_budget:
+        try:
+            parse_size(args.memory_budget)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.pipeline and args.projector and args.projector not in PIPELINE_PROJECTORS:
+        parser.error(f"--pipeline projects in streamed passes, which --projector {args.projector} has no form for: use {' or '.join(PIPELINE_PROJECTORS)}")
+    if args.runs < 1:
+        parser.error(f"--runs must be at least 1 (got {args.runs}): latency medians need a timed pass")
+    if args.dry_run:
+        modes = [m.strip() for m in args.modes.split(',')] if args.modes else [args.mode]
+        projector = args.projector or ('randomized' if modes == ['embedding'] else 'pca')
+        budget = parse_size(args.memory_budget) if args.memory_budget else None
+        try:
+            estimate = estimate_build(args.model, step=args.step, modes=modes, precision=args.precision, projector=projector,
+                                      experts=args.experts, memory_budget=budget, samples=args.samples, top_k=args.top_k,
+                                      consolidate=args.consolidate, layers=args.layers, stats=not args.no_stats,
+                                      pipelined=args.pipeline, block=args.block)
+        except ValueError as e: # --experts ids against the router size of a MoE checkpoint (expert_count)
+            sys.exit(str(e))
+        print_estimate(estimate, args.json)
+        sys.exit(0)
+
+    extract_and_crystallize(args.model, step=args.step, mode=args.modes or args.mode, text=args.text, image_path=args.image,
+                            precision=args.precision, projector=args.projector, experts=args.experts, memory_budget=args.memory_budget,
+                            corpus=args.corpus, corpus_stat=args.corpus_stat, batch_size=args.batch_size, top_k=args.top_k,
+                            samples=args.samples, seq_len=args.seq_len, runs=args.runs, warmup=args.warmup, base=args.base,
+                            drift=args.drift, images=args.images, per_class=args.per_class, workers=args.workers,
+                            consolidate=args.consolidate, layers=args.layers, target=args.target, stats=not args.no_stats,
+                            pipeline=args.pipeline, block=args.block)
@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+
+from lib.pack import Pack, write_pack, safe_name, entry_path, ALIGN
+
+GALLERY_EXTENSIONS = ('.ply', '.md', '.json', '.png', '.jpg', '.jpeg', '.webp', '.svg')
+
+def collect_files(inputs, root):
+    """{name relative to root (forward slashes, as in manifest.json): local path} for every gallery file."""
+    files = {}
+    for item in inputs:
+        paths = [item] if os.path.isfile(item) else [
+            os.path.join(d, f) for d, _, names in os.walk(item) for f in names]
+        for path in paths:
+            if path.lower().endswith(GALLERY_EXTENSIONS):
+                files[os.path.relpath(path, root).replace(os.sep, '/')] = path
+    return files
+
+def build(args):
+    root = args.root or os.path.dirname(os.path.normpath(args.inputs[0]))
+    files = collect_files(args.inputs, root)
+    if not files:
+        print("Nothing to pack.")
+        return 1
+    outside = sorted(path for name, path in files.items() if not safe_name(name))
+    if outside:
+        print(f"❌ {len(outside)} file(s) lie outside --root {root} (their entry names would start with '..'): {', '.join(outside)}")
+        return 1
+    print(f"📦 Packing {len(files)} files from {', '.join(args.inputs)} into {args.output}...")
+    index, stats = write_pack(args.output, files, full=args.full)
+    with Pack(args.output) as pack:
+        dead = pack.dead_bytes()
+        size = len(pack.map)
+    print(f"   ↳ {stats['added']} added/updated, {stats['reused']} unchanged, {stats['bytes_appended'] / 2**20:.1f} MB appended")
+    print(f"   ↳ Pack is {size / 2**20:.1f} MB ({dead / 2**20:.1f} MB padding/stale, {ALIGN}-byte aligned; --full reclaims stale entries)")
+    print(f"✨ Saved: {args.output}")
+    return 0
+
+def list_entries(args):
+    with Pack(args.pack) as pack:
+        for name in pack.names():
+            first, last = pack.byte_range(name)
+            print(f"{first:>12} {last - first + 1:>10}  {pack.entries[name][2][:12]}  {name}")
+    return 0
+
+def extract(args):
+    refused = 0
+    with Pack(args.pack) as pack:
+        for name in args.names or pack.names():
+            if name not in pack:
+                print(f"   ⚠️  {name} is not in the pack.")
+                continue
+            try:
+                path = entry_path(args.dest, name)
+            except ValueError as e:
+                print(f"   ⚠️  Skipped: {e}")
+                refused += 1
+                continue
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(pack.get(name))
+    return 1 if refused else 0
+
+def verify(args):
+    bad = 0
+    with Pack(args.pack) as pack:
+        for name in pack.names():
+            if not pack.verify(name):
+                print(f"   ⚠️  Hash mismatch: {name}")
+                bad += 1
+        print(f"{'✨' if not bad else '❌'} {len(pack.entries) - bad}/{len(pack.entries)} entries OK")
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bundle the gallery (crystals, metadata, diagrams) into one range-addressable pack file.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help="Create or incrementally update a pack")
+    p.add_argument('inputs', nargs='+', help="Files or directories, e.g. public/crystals public/diagrams")
+    p.add_argument('-o', '--output', default='public/gallery.pack')
+    p.add_argument('--root', default=None, help="Entry names are relative to this (default: parent of the first input, so they match manifest.json)")
+    p.add_argument('--full', action='store_true', help="Rewrite from scratch instead of appending changed entries")
+    p.set_defaults(func=build)
+
+    p = sub.add_parser('list', help="Entries with byte offset, length and hash")
+    p.add_argument('pack')
+    p.set_defaults(func=list_entries)
+
+    p = sub.add_parser('extract', help="Write entries back to disk")
+    p.add_argument('pack')
+    p.add_argument('names', nargs='*')
+    p.add_argument('--dest', default='.')
+    p.set_defaults(func=extract)
+
+    p = sub.add_parser('verify', help="Check every entry against its sha256")
+    p.add_argument('pack')
+    p.set_defaults(func=verify)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
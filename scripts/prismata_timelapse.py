@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+from lib.timelapse import checkpoint_sequence, crystallize_timelapse, BASES
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Animate a training run: one crystal frame per saved checkpoint, in one shared projection basis.")
+    parser.add_argument('run', help="Directory of checkpoints (e.g. checkpoint-500/, checkpoint-1000/ or step_*.safetensors)")
+    parser.add_argument('-o', '--output', default=None, help="Crystal PLY (last frame); frames go to the matching .npz")
+    parser.add_argument('--step', type=int, default=2, help="Sampling step, as in prismata_make.py")
+    parser.add_argument('--precision', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--basis', choices=BASES, default='final', help="final: basis of the last checkpoint; incremental: single pass, running basis")
+    parser.add_argument('--mode', choices=['default', 'layers', 'heads'], default='layers', help="Coloring of the crystal")
+    parser.add_argument('--bits', type=int, choices=range(8, 16), default=15, metavar='8-15', help="Position quantization of the frames")
+    args = parser.parse_args()
+
+    paths = checkpoint_sequence(args.run)
+    if not paths:
+        print(f"No safetensors checkpoints in {args.run}.")
+        sys.exit(1)
+    output = args.output or f"{os.path.basename(os.path.normpath(args.run))}_timelapse.ply"
+
+    print(f"🎞️  Timelapse of {len(paths)} checkpoints: {os.path.basename(paths[0])} ... {os.path.basename(paths[-1])}")
+    start = time.perf_counter()
+    names = crystallize_timelapse(paths, output, args.step, np.dtype(args.precision), args.basis, args.mode, args.bits)
+    if not names:
+        sys.exit(1)
+    print(f"   ↳ {len(names)} frames in {time.perf_counter() - start:.1f}s")
+    print(f"✨ Saved: {output} (+ frames in {output.replace('.ply', '.npz')})")
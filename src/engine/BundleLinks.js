@@ -0,0 +1,80 @@
+import * as THREE from 'three';
+
+// Correspondence edges of a Compare bundle. They join the two models, which the two viewers show apart,
+// so they are drawn on a 2D canvas laid over both: each link goes from its vertex as projected by the main
+// viewer's camera to its partner as projected by the compare viewer's camera, and follows both every frame.
+export class BundleLinks {
+  constructor(viewers, containerId = 'viewer-container') {
+    this.viewers = viewers;
+    this.container = document.getElementById(containerId);
+    if (!this.container) return;
+
+    this.canvas = document.createElement('canvas');
+    this.canvas.className = 'bundle-links';
+    this.container.appendChild(this.canvas);
+    this.ctx = this.canvas.getContext('2d');
+    this.point = new THREE.Vector3();
+    this.animationId = null;
+  }
+
+  start() {
+    if (!this.container || this.animationId) return;
+    const loop = () => {
+      this.animationId = requestAnimationFrame(loop);
+      this.draw();
+    };
+    loop();
+  }
+
+  // Both halves of one bundle on screen: [main half, compare half], else null
+  halves() {
+    const { main, compare } = this.viewers;
+    const a = main?.bundle, b = compare?.bundle;
+    if (!a || !b || a.url !== b.url || a.model === b.model) return null;
+    if (compare.container.classList.contains('hidden')) return null;
+    return [main, compare];
+  }
+
+  // Canvas pixel position of vertex `index` of a viewer's points, null when it is behind the camera.
+  // `frame` is the viewer's canvas within the overlay: [left, top, width, height]
+  project(viewer, points, index, frame) {
+    const p = this.point.fromBufferAttribute(points.geometry.attributes.position, index);
+    points.localToWorld(p).project(viewer.rig.camera);
+    if (p.z > 1) return null;
+    return [frame[0] + (p.x + 1) / 2 * frame[2], frame[1] + (1 - p.y) / 2 * frame[3]];
+  }
+
+  draw() {
+    const box = this.container.getBoundingClientRect();
+    const dpr = Math.min(window.devicePixelRatio, 2);
+    if (this.canvas.width !== Math.round(box.width * dpr) || this.canvas.height !== Math.round(box.height * dpr)) {
+      this.canvas.width = Math.round(box.width * dpr);
+      this.canvas.height = Math.round(box.height * dpr);
+    }
+    const ctx = this.ctx;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, box.width, box.height);
+
+    const halves = this.halves();
+    if (!halves) return;
+    const points = halves.map(viewer => viewer.crystalGroup?.children.find(c => c.isPoints));
+    if (!points[0] || !points[1]) return;
+    const [linksA, linksB] = halves.map(viewer => viewer.bundle.links);
+    const frames = halves.map(viewer => {
+      const rect = viewer.renderer.domElement.getBoundingClientRect();
+      return [rect.left - box.left, rect.top - box.top, rect.width, rect.height];
+    });
+
+    ctx.beginPath();
+    for (let i = 0; i < Math.min(linksA.length, linksB.length); i++) {
+      const a = this.project(halves[0], points[0], linksA[i], frames[0]);
+      const b = a && this.project(halves[1], points[1], linksB[i], frames[1]);
+      if (!b) continue;
+      ctx.moveTo(a[0], a[1]);
+      ctx.lineTo(b[0], b[1]);
+    }
+    ctx.strokeStyle = 'rgba(0, 243, 255, 0.25)';
+    ctx.lineWidth = 1;
+    ctx.stroke();
+  }
+}
@@ -4,6 +4,24 @@ import { Environment } from './Environment.js';
 import { CameraRig } from './CameraRig.js';
 import * as THREE from 'three';
 
+// Compare bundles hold both models of a pair: each viewer keeps its own half of one shared download.
+// An entry is dropped as soon as both halves have been handed out, so the buffer is freed once parsed.
+const bundleDownloads = new Map(); // url -> { buffer: Promise<ArrayBuffer>, halves: Set of models served }
+function fetchBuffer(url, model) {
+  if (model === undefined) return fetch(url).then(response => response.arrayBuffer());
+  let entry = bundleDownloads.get(url);
+  if (!entry) {
+    const buffer = fetch(url).then(response => response.arrayBuffer());
+    entry = { buffer, halves: new Set() };
+    bundleDownloads.set(url, entry);
+    // A failed download is retried on the next load
+    buffer.catch(() => { if (bundleDownloads.get(url) === entry) bundleDownloads.delete(url); });
+  }
+  entry.halves.add(model);
+  if (entry.halves.size === 2) bundleDownloads.delete(url);
+  return entry.buffer;
+}
+
 export class CrystalViewer {
   constructor(containerId) {
     this.container = document.getElementById(containerId);
@@ -12,6 +30,7 @@ export class CrystalViewer {
     this.scene = null;
     this.renderer = null;
     this.crystalGroup = null;
+    this.bundle = null; // { url, model, links } while showing one half of a Compare bundle (see BundleLinks)
     this.animationId = null;
 
     // Sub-systems
@@ -103,7 +122,7 @@ export class CrystalViewer {
     this.animate();
   }
 
-  async loadCrystal(url) {
+  async loadCrystal(url, options = {}) {
     // Cleanup old
     if (this.crystalGroup) {
       this.scene.remove(this.crystalGroup);
@@ -113,13 +132,14 @@ export class CrystalViewer {
       });
       this.crystalGroup = null;
     }
+    this.bundle = null;
 
     try {
-      const response = await fetch(url);
-      const buffer = await response.arrayBuffer();
-      const { meshResult, stats } = PLYParser.parse(buffer, this.customUniforms);
+      const buffer = await fetchBuffer(url, options.model);
+      const { meshResult, links, stats } = PLYParser.parse(buffer, this.customUniforms, options);
 
       this.crystalGroup = meshResult;
+      if (options.model !== undefined) this.bundle = { url, model: options.model, links };
       this.scene.add(this.crystalGroup);
 
       // Apply Base Size
@@ -1,7 +1,49 @@
 import * as THREE from 'three';
 
 export class PLYParser {
-  static parse(buffer, customUniforms) {
+  static parseProperties(headerText) {
+    // { vertex: [{ name: 'x', type: 'float' }, ...], edge: [...] } in declaration order
+    const props = {};
+    let current = null;
+    for (const line of headerText.split('\n')) {
+      const parts = line.trim().split(/\s+/);
+      if (parts[0] === 'element') {
+        current = parts[1];
+        props[current] = [];
+      } else if (parts[0] === 'property' && current) {
+        props[current].push({ name: parts[parts.length - 1], type: parts[1] });
+      }
+    }
+    return props;
+  }
+
+  static readBinary(count, props, littleEndian = true) {
+    // Fixed-size records: returns the column offsets + a getter per property
+    const sizes = { char: 1, uchar: 1, int8: 1, uint8: 1, short: 2, ushort: 2, int16: 2, uint16: 2,
+      int: 4, uint: 4, int32: 4, uint32: 4, float: 4, float32: 4, double: 8, float64: 8 };
+    const getters = {
+      char: 'getInt8', int8: 'getInt8', uchar: 'getUint8', uint8: 'getUint8',
+      short: 'getInt16', int16: 'getInt16', ushort: 'getUint16', uint16: 'getUint16',
+      int: 'getInt32', int32: 'getInt32', uint: 'getUint32', uint32: 'getUint32',
+      float: 'getFloat32', float32: 'getFloat32', double: 'getFloat64', float64: 'getFloat64'
+    };
+    let stride = 0;
+    const columns = {};
+    for (const p of props) {
+      columns[p.name] = { offset: stride, getter: getters[p.type] };
+      stride += sizes[p.type];
+    }
+    return {
+      stride,
+      byteLength: stride * count,
+      get: (view, base, i, name) => {
+        const c = columns[name];
+        return view[c.getter](base + i * stride + c.offset, littleEndian);
+      }
+    };
+  }
+
+  static parse(buffer, customUniforms, options = {}) {
     const decoder = new TextDecoder();
     let headerEndIndex = 0;
     const chunk = decoder.decode(buffer.slice(0, 2048));
@@ -11,33 +53,89 @@ export class PLYParser {
     const headerText = decoder.decode(buffer.slice(0, headerEndIndex));
     const body = buffer.slice(headerEndIndex);
 
-    const vertexCount = parseInt(headerText.match(/element vertex (\d+)/)?.[1] || 0);
-    const edgeCount = parseInt(headerText.match(/element edge (\d+)/)?.[1] || 0);
-
-    const textData = decoder.decode(body).trim().split(/\s+/);
-    let ptr = 0;
-
-    const positions = [];
-    const colors = [];
-
-    // Read Vertices
-    for (let i = 0; i < vertexCount; i++) {
-      const x = parseFloat(textData[ptr++]);
-      const y = parseFloat(textData[ptr++]);
-      const z = parseFloat(textData[ptr++]);
-      const r = parseInt(textData[ptr++]) / 255;
-      const g = parseInt(textData[ptr++]) / 255;
-      const b = parseInt(textData[ptr++]) / 255;
-      positions.push(x, y, z);
-      colors.push(r, g, b);
+    let vertexCount = parseInt(headerText.match(/element vertex (\d+)/)?.[1] || 0);
+    let edgeCount = parseInt(headerText.match(/element edge (\d+)/)?.[1] || 0);
+
+    // Property layout per element (extra columns such as `expert` tags are skipped)
+    const props = PLYParser.parseProperties(headerText);
+    const vProps = props.vertex || ['x', 'y', 'z', 'red', 'green', 'blue'].map(name => ({ name, type: 'float' }));
+    const eProps = props.edge || ['vertex1', 'vertex2'].map(name => ({ name, type: 'int' }));
+
+    let positions = [];
+    let colors = [];
+    let edgeIndices = [];
+    // Compare bundles tag every vertex with its `model`; options.model keeps one of them
+    const filterModel = options.model !== undefined && vProps.some(p => p.name === 'model');
+    const modelTags = [];
+
+    if (headerText.includes('format binary_little_endian')) {
+      // Binary crystals (out-of-core builds): fixed-size records, read straight from the buffer
+      const view = new DataView(body);
+      const v = PLYParser.readBinary(vertexCount, vProps);
+      for (let i = 0; i < vertexCount; i++) {
+        positions.push(v.get(view, 0, i, 'x'), v.get(view, 0, i, 'y'), v.get(view, 0, i, 'z'));
+        colors.push(v.get(view, 0, i, 'red') / 255, v.get(view, 0, i, 'green') / 255, v.get(view, 0, i, 'blue') / 255);
+        if (filterModel) modelTags.push(v.get(view, 0, i, 'model'));
+      }
+      const e = PLYParser.readBinary(edgeCount, eProps);
+      for (let i = 0; i < edgeCount; i++) {
+        edgeIndices.push(e.get(view, v.byteLength, i, 'vertex1'), e.get(view, v.byteLength, i, 'vertex2'));
+      }
+    } else {
+      const vNames = vProps.map(p => p.name);
+      const eNames = eProps.map(p => p.name);
+      const [ix, iy, iz, ir, ig, ib, im] = ['x', 'y', 'z', 'red', 'green', 'blue', 'model'].map(n => vNames.indexOf(n));
+      const [i1, i2] = ['vertex1', 'vertex2'].map(n => eNames.indexOf(n));
+
+      const textData = decoder.decode(body).trim().split(/\s+/);
+      let ptr = 0;
+
+      // Read Vertices
+      for (let i = 0; i < vertexCount; i++) {
+        const x = parseFloat(textData[ptr + ix]);
+        const y = parseFloat(textData[ptr + iy]);
+        const z = parseFloat(textData[ptr + iz]);
+        const r = parseInt(textData[ptr + ir]) / 255;
+        const g = parseInt(textData[ptr + ig]) / 255;
+        const b = parseInt(textData[ptr + ib]) / 255;
+        if (filterModel) modelTags.push(parseInt(textData[ptr + im]));
+        ptr += vNames.length;
+        positions.push(x, y, z);
+        colors.push(r, g, b);
+      }
+
+      // Read Edges
+      for (let i = 0; i < edgeCount; i++) {
+        const v1 = parseInt(textData[ptr + i1]);
+        const v2 = parseInt(textData[ptr + i2]);
+        ptr += eNames.length;
+        edgeIndices.push(v1, v2);
+      }
     }
 
-    // Read Edges
-    const edgeIndices = [];
-    for (let i = 0; i < edgeCount; i++) {
-      const v1 = parseInt(textData[ptr++]);
-      const v2 = parseInt(textData[ptr++]);
-      edgeIndices.push(v1, v2);
+    // Correspondence edges of a bundle: this model's end of each, in file order (the other half lists its ends in the same order)
+    const links = [];
+    if (filterModel) {
+      // Keep one model's vertices; edges survive only if both ends do, correspondence edges go to `links`
+      const remap = new Int32Array(vertexCount).fill(-1);
+      const keptPositions = [], keptColors = [], keptEdges = [];
+      let kept = 0;
+      for (let i = 0; i < vertexCount; i++) {
+        if (modelTags[i] !== options.model) continue;
+        remap[i] = kept++;
+        keptPositions.push(positions[3 * i], positions[3 * i + 1], positions[3 * i + 2]);
+        keptColors.push(colors[3 * i], colors[3 * i + 1], colors[3 * i + 2]);
+      }
+      for (let i = 0; i < edgeIndices.length; i += 2) {
+        const a = remap[edgeIndices[i]], b = remap[edgeIndices[i + 1]];
+        if (a >= 0 && b >= 0) keptEdges.push(a, b);
+        else if (a >= 0 || b >= 0) links.push(a >= 0 ? a : b);
+      }
+      positions = keptPositions;
+      colors = keptColors;
+      edgeIndices = keptEdges;
+      vertexCount = kept;
+      edgeCount = keptEdges.length / 2;
     }
 
     const geometry = new THREE.BufferGeometry();
@@ -360,6 +458,7 @@ export class PLYParser {
 
     return {
       meshResult: group,
+      links,
       stats: {
         nodes: vertexCount,
         links: edgeCount,
@@ -1,5 +1,6 @@
 
 import { CrystalViewer } from './main.js';
+import { BundleLinks } from './engine/BundleLinks.js';
 import { archiveManager } from './archive/ArchiveManager.js';
 import { timelineManager } from './timeline/TimelineManager.js';
 import { initGallery } from './ui/Gallery.js';
@@ -27,6 +28,7 @@ document.addEventListener('DOMContentLoaded', async () => {
   // 1. Init Viewers
   viewers.main = new CrystalViewer('view-main');
   viewers.compare = new CrystalViewer('view-compare');
+  new BundleLinks(viewers).start();
 
   // 2. Helpers
   const getActiveSlot = () => activeSlot;
@@ -51,6 +51,7 @@ async function loadGallery(activeSlotGetter, viewers) {
             item.dataset.modelDesc = model.desc;
             item.dataset.modelId = model.id;
           item.dataset.diagram = model.diagram || '';
+          if (crystal.bundleModel !== undefined) item.dataset.bundleModel = crystal.bundleModel;
 
             item.innerHTML = `
                 <span class="item-name">${crystal.name}</span>
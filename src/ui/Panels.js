@@ -48,7 +48,7 @@ export async function handleLoadCrystal(data, slot, viewers) {
   if (ui.type) ui.type.textContent = data.type;
 
   try {
-    const stats = await viewer.loadCrystal(data.url);
+    const stats = await viewer.loadCrystal(data.url, data.bundleModel !== undefined ? { model: Number(data.bundleModel) } : {});
 
     if (ui.nodes) ui.nodes.textContent = stats.nodes.toLocaleString();
     if (ui.links) ui.links.textContent = stats.links.toLocaleString();